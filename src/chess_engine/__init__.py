@@ -1,7 +1,23 @@
-from typing import Tuple
+import os
+from typing import Dict, List, Tuple, Union
 import numpy as np
 
-from . import diagchess as internal
+from .constants import STAT_LEGAL_MOVES_CALLS, STAT_MASKS, STAT_NAMES, STATS_SIZE
+from .history import FrameHistory
+
+# engine backend, "numba" (default, falls back to numpy if numba is missing) or "numpy"
+BACKEND = os.environ.get("DIAGCHESS_BACKEND", "numba")
+
+if BACKEND == "numba":
+    try:
+        from . import diagchess as internal
+    except ImportError:
+        BACKEND = "numpy"
+
+if BACKEND == "numpy":
+    from . import numpy_backend as internal
+elif BACKEND != "numba":
+    raise ImportError(f"unknown DIAGCHESS_BACKEND: {BACKEND}")
 
 def action(move_str: str) -> int:
     x1ord = ord(move_str[0]) - ord("a")
@@ -15,7 +31,45 @@ def action(move_str: str) -> int:
 
 
 class DiagonalChess:
-    def __init__(self):
+    def __init__(self, collect_stats: bool = False, strict: bool = False, record: bool = False, incremental: bool = False,
+                 history: int = 1):
+        """
+        `collect_stats` - count what engine kernels do (fallbacks, penalties, `legal_moves` calls), see `stats()`.
+        When disabled kernels are compiled without counters.
+        `strict` - only moves that don't leave own king attacked are legal (masks and fallbacks),
+        game ends on checkmate (rewarded like capturing the king) or stalemate.
+        `record` - keep moves actually played since last reset (after illegal moves are replaced), see `game_record()`
+        `incremental` - keep observation and masks up to date between moves instead of rebuilding them every step
+        (only moves of pieces affected by a move are regenerated), strict masks filter the kept moves
+        `history` - observations stack the last `history` positions returned by the environment (8, 8, 8 * history),
+        oldest first, zeros before the start of the game. They are views into a ring buffer overwritten by later steps,
+        copy them if they have to be kept (see `FrameHistory`)
+        """
+        if strict and not hasattr(internal, 'make_move_from_action_strict'):
+            raise ValueError(f"strict rules are not supported by {BACKEND} backend")
+        if incremental and not hasattr(internal, 'incremental_state'):
+            raise ValueError(f"incremental state is not supported by {BACKEND} backend")
+
+        self.strict = strict
+        self._make_move = internal.make_move_from_action_strict if strict else internal.make_move_from_action
+        self._make_move_played = internal.make_move_from_action_strict_played if strict else internal.make_move_from_action_played
+        if incremental:
+            self._make_move_incremental = internal.make_move_from_action_strict_incremental if strict else internal.make_move_from_action_incremental
+
+        # played actions, None if recording is disabled
+        self._moves = [] if record else None
+
+        # (piece_moves, move_sums, masks, observation), see `incremental_state`, None if disabled
+        self._incremental = () if incremental else None
+
+        # last observations, None if only the current position is observed
+        self._history = FrameHistory(history) if history > 1 else None
+
+        self._stats = np.zeros(STATS_SIZE, dtype=np.int64) if collect_stats else None
+        # piece lists updated by move kernels along with the board (numba backend only, numpy one scans whole boards anyway)
+        self._pieces = internal.build_piece_lists(internal.generate_start_board()) if hasattr(internal, 'build_piece_lists') else None
+        self._set_kernel_args()
+
         self.reset()
 
 
@@ -26,8 +80,9 @@ class DiagonalChess:
         
         self.board = internal.generate_start_board()
         self.isBlack = False
+        self._new_board()
 
-        return internal.board_to_observation(self.board)
+        return self._observation()
 
     def reset_board(self):
         """
@@ -36,8 +91,53 @@ class DiagonalChess:
         
         self.board = internal.generate_start_board()
         self.isBlack = False
+        self._new_board()
+
+        return self._observation()
+
+    def reset_with_mask(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        resets the board to the starting position, returns observation and legal moves mask for the side to move
+        """
+
+        self.board = internal.generate_start_board()
+        self.isBlack = False
+        self._new_board()
+
+        return self._observation_and_mask()
+
+    def _observation(self) -> np.ndarray:
+        if self._incremental is not None:
+            return self._stacked(self._incremental[3])
+
+        self._count_observation()
+        return self._stacked(internal.board_to_observation(self.board))
 
-        return internal.board_to_observation(self.board)
+    def _observation_and_mask(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._incremental is not None:
+            _, _, masks, observation = self._incremental
+            if self.strict:
+                mask = internal.get_strict_legal_moves_mask(self.board, self.isBlack, self._stats, self._pieces, self._incremental)
+                return self._stacked(observation), mask
+
+            if self._stats is not None:
+                self._stats[STAT_MASKS] += 1
+            return self._stacked(observation), masks[int(self.isBlack)].copy()
+
+        if self.strict:
+            observation, mask = internal.board_to_observation_and_strict_mask(self.board, self.isBlack, *self._kernel_args)
+            return self._stacked(observation), mask
+
+        observation, mask = internal.board_to_observation_and_mask(self.board, self.isBlack, *self._kernel_args)
+        return self._stacked(observation), mask
+
+    def _stacked(self, observation: np.ndarray) -> np.ndarray:
+        # incremental observation is updated in place, it is copied here or into the history
+        if self._history is None:
+            return observation.copy() if self._incremental is not None else observation
+
+        self._history.push(observation)
+        return self._history.stacked()
     
 
     def step(self, action: int) -> Tuple[np.ndarray, float, bool]:
@@ -87,16 +187,37 @@ class DiagonalChess:
         """
 
         # make move
-        done, reward = internal.make_move_from_action(self.board, action, self.isBlack)
+        done, reward = self._move(action)
 
         # switch player
         self.isBlack = not self.isBlack
-        
-        return internal.board_to_observation(self.board), reward, done
+
+        return self._observation(), reward, done
     
+    def step_with_mask(self, action: int) -> Tuple[np.ndarray, np.ndarray, float, bool]:
+        """
+        Same as `step` but also returns legal moves mask (4096,) for the side to move next.
+        Observation and mask are built from the same move generation pass,
+        so there is no need to call `get_legal_moves_mask` after the step.
+
+        ## returns
+        - observation: np.ndarray
+        - mask: np.ndarray (int8)
+        - reward: int
+        - done: bool
+        """
+        done, reward = self._move(action)
+
+        # switch player
+        self.isBlack = not self.isBlack
+
+        observation, mask = self._observation_and_mask()
+
+        return observation, mask, reward, done
+
     def step_board_obs(self, action: int) -> Tuple[np.ndarray, float, bool]:
         
-        done, reward = internal.make_move_from_action(self.board, action, self.isBlack)
+        done, reward = self._move(action)
 
         # switch player
         self.isBlack = not self.isBlack
@@ -110,15 +231,153 @@ class DiagonalChess:
         return self.step(from_x + from_y * 8 + to_x * 64 + to_y * 512)
     
     def step_prop(self, action: np.ndarray) -> Tuple[np.ndarray, float, bool]:
-        done, reward = internal.make_move_from_prob(self.board, action, self.isBlack)
+        if self.strict or self._moves is not None or self._incremental is not None:
+            move = internal.array_action_to_move(self.board, action, self.isBlack)
+            done, reward = self._move(move)
+        else:
+            done, reward = internal.make_move_from_prob(self.board, action, self.isBlack, *self._kernel_args)
 
         # switch player
         self.isBlack = not self.isBlack
 
-        return internal.board_to_observation(self.board), reward, done
+        return self._observation(), reward, done
+
+    def _move(self, action: int) -> Tuple[bool, float]:
+        if self._incremental is not None:
+            done, reward, played = self._make_move_incremental(self.board, action, self.isBlack, *self._incremental, *self._kernel_args)
+        elif self._moves is None:
+            return self._make_move(self.board, action, self.isBlack, *self._kernel_args)
+        else:
+            done, reward, played = self._make_move_played(self.board, action, self.isBlack, *self._kernel_args)
+
+        if self._moves is not None and not self._recorded_end:
+            # moves after the end of the game (e.g. an opponent answering a side without moves) are not part of it
+            if played >= 0:
+                self._moves.append(int(played))
+            self._recorded_end = done
+        return done, reward
+
+    def _set_kernel_args(self):
+        # extra arguments for engine kernels, disabled stats are passed as None (compiled out)
+        if self._pieces is not None:
+            self._kernel_args = (self._stats, self._pieces)
+        else:
+            self._kernel_args = () if self._stats is None else (self._stats,)
+
+    def _new_board(self):
+        # board was replaced (not changed by a move)
+        if self._pieces is not None:
+            self._pieces[:] = internal.build_piece_lists(self.board)
+
+        if self._incremental is not None:
+            self._incremental = internal.incremental_state(self.board)
+
+        if self._history is not None:
+            self._history.clear()
+
+        if self._moves is not None:
+            self._moves = []
+            self._recorded_end = False
+            self._start_board = self.board.copy()
+            self._start_black = self.isBlack
+
+    def game_record(self) -> Tuple[np.ndarray, np.ndarray, bool]:
+        """
+        Returns actions (int32) played since last reset/restore, starting board and side that moved first.
+        Recording stops when the game ends, so the record is always accepted by `GameLog.append`.
+        Environment has to be created with `record=True`, see `GameLog` for storing games.
+        """
+        if self._moves is None:
+            raise ValueError("environment was created without record=True")
+        return np.array(self._moves, dtype=np.int32), self._start_board.copy(), self._start_black
+
+    def _count_observation(self):
+        # `board_to_observation` has fixed signature, it calls `legal_moves` once per piece (both colors)
+        if self._stats is not None:
+            self._stats[STAT_LEGAL_MOVES_CALLS] += np.count_nonzero(self.board)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns engine counters collected since creation or last `reset_stats`,
+        empty dict if environment was created without `collect_stats=True`.
+        """
+        if self._stats is None:
+            return {}
+        return {name: int(value) for name, value in zip(STAT_NAMES, self._stats)}
+
+    def reset_stats(self):
+        """
+        Zeroes engine counters, call it at the start of an episode to get per episode stats
+        """
+        if self._stats is not None:
+            self._stats[:] = 0
 
 
     
+    def snapshot(self) -> np.ndarray:
+        """
+        Returns packed state as uint8 array of `internal.SNAPSHOT_SIZE` bytes:
+        board (64 bytes), side to move (1 byte) and zobrist hash (8 bytes).
+        Use `.tobytes()` on it if you need `bytes`.
+        """
+        return internal.pack_snapshot(self.board, self.isBlack)
+
+    def restore(self, snapshot: Union[bytes, np.ndarray]):
+        """
+        Restores state saved by `snapshot`
+        """
+        if isinstance(snapshot, (bytes, bytearray)):
+            snapshot = np.frombuffer(snapshot, dtype=np.uint8)
+        snapshot = np.array(snapshot, dtype=np.uint8)
+
+        if snapshot.shape != (internal.SNAPSHOT_SIZE,):
+            raise ValueError(f"snapshot should have {internal.SNAPSHOT_SIZE} bytes, got {snapshot.shape}")
+
+        board, isBlack, stored_hash = internal.unpack_snapshot(snapshot)
+
+        if internal.board_hash(board, isBlack) != stored_hash:
+            raise ValueError("snapshot hash does not match its board")
+
+        self.board = board
+        self.isBlack = isBlack
+        self._new_board()
+
+    def hash(self) -> int:
+        """
+        Zobrist hash of current position
+        """
+        return int(internal.board_hash(self.board, self.isBlack))
+
+    def clone(self) -> 'DiagonalChess':
+        return self.clone_many(1)[0]
+
+    def clone_many(self, n: int) -> List['DiagonalChess']:
+        """
+        Returns `n` independent copies of the environment.
+        Boards of the copies are views into one (n, 8, 8) array allocated in one go.
+        """
+        boards = np.repeat(self.board[np.newaxis], n, axis=0)
+
+        clones = []
+        for i in range(n):
+            clone = DiagonalChess.__new__(DiagonalChess)
+            clone.__dict__.update(self.__dict__)
+            clone.board = boards[i]
+            if self._stats is not None:
+                clone._stats = self._stats.copy()
+            if self._pieces is not None:
+                clone._pieces = self._pieces.copy()
+            clone._set_kernel_args()
+            if self._moves is not None:
+                clone._moves = list(self._moves)
+            if self._incremental is not None:
+                clone._incremental = tuple(array.copy() for array in self._incremental)
+            if self._history is not None:
+                clone._history = self._history.copy()
+            clones.append(clone)
+
+        return clones
+
     def render(self):
         """
         Should render the board using the python-chess library
@@ -126,7 +385,27 @@ class DiagonalChess:
 
         return internal.fen_to_svg(internal.to_fen(self.board))
 
+    def render_rgb(self, size: int = 32) -> np.ndarray:
+        """
+        Returns board as RGB image (8 * size, 8 * size, 3) uint8, see `render.render_boards` for batches
+        """
+        from .render import render_board
+        return render_board(self.board, size)
+
+    def greedy_action(self) -> int:
+        """
+        Action of greedy capture opponent for the side to move (best capture by static exchange, random move otherwise),
+        see `greedy_capture_action`. Returns 0 if there are no legal moves (any action ends the game then).
+        """
+        if not hasattr(internal, 'greedy_capture_action'):
+            raise ValueError(f"greedy opponent is not supported by {BACKEND} backend")
+
+        piece_lists = () if self._pieces is None else (self._pieces,)
+        return max(int(internal.greedy_capture_action(self.board, self.isBlack, *piece_lists)), 0)
+
     def allowed_moves(self):
+        if self._pieces is not None:
+            return internal.all_legal_moves(self.board, self.isBlack, self._pieces)
         return internal.all_legal_moves(self.board, self.isBlack)
     
     
@@ -0,0 +1,79 @@
+"""
+rewards and tables shared by all engine backends, must stay free of numba imports
+"""
+import numpy as np
+
+WRONG_PIECE_COLOR_PENALTY = -1
+ILLEGAL_MOVE_PENALTY_1 = -1
+ILLEGAL_MOVE_PENALTY_2 = -1
+LEGAL_MOVE_REWARD = 1
+
+# PAWN_CAPTURE_REWARD = 5
+# ROOK_CAPTURE_REWARD = 5
+# KNIGHT_CAPTURE_REWARD = 5
+# BISHOP_CAPTURE_REWARD = 5
+# QUEEN_CAPTURE_REWARD = 5
+# KING_CAPTURE_REWARD = 5
+
+# WRONG_PIECE_COLOR_PENALTY = 0
+# ILLEGAL_MOVE_PENALTY_1 = 0
+# ILLEGAL_MOVE_PENALTY_2 = 0
+# LEGAL_MOVE_REWARD = 0
+
+PAWN_CAPTURE_REWARD = 1
+ROOK_CAPTURE_REWARD = 2
+KNIGHT_CAPTURE_REWARD = 3
+BISHOP_CAPTURE_REWARD = 5
+QUEEN_CAPTURE_REWARD = 15
+KING_CAPTURE_REWARD = 50
+
+# Zobrist keys, one for each (piece + 6, square) pair and one for black to move
+ZOBRIST_PIECE_KEYS = np.random.default_rng(225).integers(0, 2**64, size=(13, 64), dtype=np.uint64, endpoint=False)
+ZOBRIST_BLACK_KEY = np.uint64(0x9E3779B97F4A7C15)
+
+# snapshot layout: 64 bytes of board, 1 byte of side to move, 8 bytes of hash (little endian)
+SNAPSHOT_SIZE = 64 + 1 + 8
+
+# reward for capturing a piece indexed by piece + 6, same values as `capture_reward`
+CAPTURE_REWARDS = np.array([0, 0, 0, 0, 0, 0, 0,
+                            PAWN_CAPTURE_REWARD,
+                            ROOK_CAPTURE_REWARD,
+                            KNIGHT_CAPTURE_REWARD,
+                            BISHOP_CAPTURE_REWARD,
+                            QUEEN_CAPTURE_REWARD,
+                            KING_CAPTURE_REWARD], dtype=np.int32)
+
+# hot-path counters, indices into the int64 stats array accepted by engine kernels (`stats=None` disables counting)
+STAT_MOVES = 0              # make_a_move calls
+STAT_LEGAL = 1              # move was legal
+STAT_WRONG_COLOR = 2        # WRONG_PIECE_COLOR_PENALTY fired
+STAT_ILLEGAL_1 = 3          # ILLEGAL_MOVE_PENALTY_1 fired, other target of the same piece was used
+STAT_ILLEGAL_2 = 4          # ILLEGAL_MOVE_PENALTY_2 fired
+STAT_RANDOM_FALLBACKS = 5   # generate_move fell back to random_legal_move
+STAT_NO_LEGAL_MOVES = 6     # game ended because side to move had no legal moves
+STAT_CAPTURES = 7
+STAT_LEGAL_MOVES_CALLS = 8  # legal_moves calls (numpy backend counts squares expanded by move generation)
+STAT_MASKS = 9              # legal moves masks built
+
+STAT_NAMES = (
+    'moves',
+    'legal',
+    'wrong_color',
+    'illegal_1',
+    'illegal_2',
+    'random_fallbacks',
+    'no_legal_moves',
+    'captures',
+    'legal_moves_calls',
+    'masks',
+)
+STATS_SIZE = len(STAT_NAMES)
+
+# piece values (same as `piece`), positive pieces are black, negative white.
+# Use these in kernels, `piece` builds its lookup dict on every call.
+PAWN = 1
+ROOK = 2
+KNIGHT = 3
+BISHOP = 4
+QUEEN = 5
+KING = 6
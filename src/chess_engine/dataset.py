@@ -0,0 +1,206 @@
+"""
+Position datasets from random play, for starting positions and benchmarks.
+
+Games are played inside numba kernels (same rules as `DiagonalChess`), every position is stored with its
+side to move and bit-packed legal moves mask (`np.packbits` order, see `get_legal_moves_mask_batch`).
+Positions go into fixed-size shards of memory mapped `.npy` files, one shard per worker task:
+* `boards_00000.npy` - (shard_size, 8, 8) int8
+* `is_black_00000.npy` - (shard_size,) bool
+* `masks_00000.npy` - (shard_size, 512) uint8
+
+`index.json` lists shards with number of positions in each (last one can be partially filled).
+
+```
+python -m chess_engine.dataset positions --positions 1000000 --opponent greedy
+```
+"""
+import json
+import multiprocessing
+import os
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import numba as nb
+
+from .diagchess import (generate_start_board, get_legal_moves_mask, get_strict_legal_moves_mask, make_move_from_action,
+                        make_move_from_action_strict, greedy_capture_action, seed)
+
+INDEX_FILE = 'index.json'
+OPPONENTS = ('random', 'greedy')
+
+
+@nb.njit(cache=True)
+def play_games(boards: np.ndarray, is_black: np.ndarray, masks: np.ndarray, max_plies: int, greedy: bool, strict: bool):
+    """
+    Fills `boards`, `is_black` and packed `masks` with consecutive positions of games played from the start board,
+    a new game starts when one ends (or after `max_plies`). Moves are random, or (`greedy`) chosen by
+    `greedy_capture_action` like the greedy opponent of `DiagonalChess`
+    """
+    board = generate_start_board()
+    isBlack = False
+    ply = 0
+
+    for i in range(len(boards)):
+        if strict:
+            mask = get_strict_legal_moves_mask(board, isBlack)
+        else:
+            mask = get_legal_moves_mask(board, isBlack)
+        legal = np.flatnonzero(mask)
+
+        boards[i] = board
+        is_black[i] = isBlack
+        masks[i] = 0
+        for action in legal:
+            masks[i, action >> 3] |= np.uint8(0x80 >> (action & 7))
+
+        if len(legal) == 0 or ply >= max_plies:
+            board = generate_start_board()
+            isBlack = False
+            ply = 0
+            continue
+
+        action = greedy_capture_action(board, isBlack) if greedy else -1
+        # pseudo-legal greedy moves that strict rules forbid are replaced by random ones
+        if action < 0 or not mask[action]:
+            action = legal[np.random.randint(0, len(legal))]
+        if strict:
+            done, _ = make_move_from_action_strict(board, action, isBlack)
+        else:
+            done, _ = make_move_from_action(board, action, isBlack)
+
+        isBlack = not isBlack
+        ply += 1
+
+        if done:
+            board = generate_start_board()
+            isBlack = False
+            ply = 0
+
+
+def shard_paths(directory: str, shard: int) -> Tuple[str, str, str]:
+    return (os.path.join(directory, f"boards_{shard:05d}.npy"),
+            os.path.join(directory, f"is_black_{shard:05d}.npy"),
+            os.path.join(directory, f"masks_{shard:05d}.npy"))
+
+def _write_shard(task: Tuple[str, int, int, int, int, bool, bool, int]) -> Tuple[int, int]:
+    directory, shard, shard_size, count, max_plies, greedy, strict, base_seed = task
+
+    # every shard is its own stream of games
+    seed(base_seed + shard)
+
+    boards_path, is_black_path, masks_path = shard_paths(directory, shard)
+    boards = np.lib.format.open_memmap(boards_path, mode='w+', dtype=np.int8, shape=(shard_size, 8, 8))
+    is_black = np.lib.format.open_memmap(is_black_path, mode='w+', dtype=np.bool_, shape=(shard_size,))
+    masks = np.lib.format.open_memmap(masks_path, mode='w+', dtype=np.uint8, shape=(shard_size, 512))
+
+    play_games(boards[:count], is_black[:count], masks[:count], max_plies, greedy, strict)
+
+    for array in (boards, is_black, masks):
+        array.flush()
+
+    return shard, count
+
+def generate_dataset(directory: str, positions: int, shard_size: int = 1 << 16, opponent: str = 'random',
+                     strict: bool = False, max_plies: int = 200, workers: Optional[int] = None, base_seed: int = 0,
+                     verbose: bool = True) -> Dict:
+    """
+    Plays games on `workers` processes (all cores by default) until `positions` positions are stored in `directory`.
+    Returns index (also saved as `index.json`)
+    """
+    if opponent not in OPPONENTS:
+        raise ValueError(f"opponent should be one of {OPPONENTS}, got {opponent}")
+
+    os.makedirs(directory, exist_ok=True)
+
+    shards = (positions + shard_size - 1) // shard_size
+    tasks = [(directory, shard, shard_size, min(shard_size, positions - shard * shard_size), max_plies, opponent == 'greedy', strict, base_seed)
+             for shard in range(shards)]
+
+    counts = [0] * shards
+    if workers == 1:
+        results = map(_write_shard, tasks)
+        for shard, count in results:
+            counts[shard] = count
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            for shard, count in pool.imap_unordered(_write_shard, tasks):
+                counts[shard] = count
+                if verbose:
+                    print(f"shard {shard + 1}/{shards} done")
+
+    index = {
+        'positions': positions,
+        'shard_size': shard_size,
+        'opponent': opponent,
+        'strict': strict,
+        'max_plies': max_plies,
+        'seed': base_seed,
+        'shards': [{'boards': os.path.basename(paths[0]), 'is_black': os.path.basename(paths[1]), 'masks': os.path.basename(paths[2]), 'count': count}
+                   for paths, count in ((shard_paths(directory, shard), count) for shard, count in enumerate(counts))],
+    }
+
+    with open(os.path.join(directory, INDEX_FILE), 'w') as f:
+        json.dump(index, f, indent=2)
+
+    return index
+
+
+class PositionDataset:
+    """
+    Read access to dataset written by `generate_dataset`, shards are memory mapped
+    """
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            self.index = json.load(f)
+
+        self.shards: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        for shard in self.index['shards']:
+            count = shard['count']
+            self.shards.append(tuple(np.load(os.path.join(directory, shard[name]), mmap_mode='r')[:count] for name in ('boards', 'is_black', 'masks')))
+
+        self.offsets = np.cumsum([0] + [shard['count'] for shard in self.index['shards']])
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def batch(self, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns boards, is_black and packed masks of given positions
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        shard_ids = np.searchsorted(self.offsets, indices, side='right') - 1
+
+        boards = np.empty((len(indices), 8, 8), dtype=np.int8)
+        is_black = np.empty(len(indices), dtype=np.bool_)
+        masks = np.empty((len(indices), 512), dtype=np.uint8)
+
+        for shard_id in np.unique(shard_ids):
+            rows = np.flatnonzero(shard_ids == shard_id)
+            local = indices[rows] - self.offsets[shard_id]
+            shard_boards, shard_is_black, shard_masks = self.shards[shard_id]
+            boards[rows] = shard_boards[local]
+            is_black[rows] = shard_is_black[local]
+            masks[rows] = shard_masks[local]
+
+        return boards, is_black, masks
+
+    def sample(self, batch_size: int, rng: Optional[np.random.Generator] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        rng = np.random.default_rng() if rng is None else rng
+        return self.batch(rng.integers(0, len(self), size=batch_size))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="generates positions dataset from random play")
+    parser.add_argument("directory", type=str, help="where to save shards and index")
+    parser.add_argument("--positions", type=int, default=1_000_000, help="number of positions")
+    parser.add_argument("--shard-size", type=int, default=1 << 16, help="positions per shard")
+    parser.add_argument("--opponent", type=str, default='random', choices=OPPONENTS, help="how moves are chosen")
+    parser.add_argument("--strict", action='store_true', help="check aware rules (games end on checkmate)")
+    parser.add_argument("--max-plies", type=int, default=200, help="restart games longer than this")
+    parser.add_argument("--workers", type=int, default=None, help="processes, all cores by default")
+    parser.add_argument("--seed", type=int, default=0, help="base seed, shard i uses seed + i")
+
+    args = parser.parse_args()
+
+    generate_dataset(args.directory, args.positions, args.shard_size, args.opponent, args.strict, args.max_plies, args.workers, args.seed)
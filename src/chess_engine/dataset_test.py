@@ -0,0 +1,38 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from . import dataset
+from .diagchess import get_legal_moves_mask, get_strict_legal_moves_mask
+
+
+class DatasetTests(unittest.TestCase):
+    def test_generate_and_read(self):
+        with tempfile.TemporaryDirectory() as directory:
+            index = dataset.generate_dataset(directory, 1000, shard_size=300, opponent='greedy', workers=1, verbose=False)
+            self.assertEqual([shard['count'] for shard in index['shards']], [300, 300, 300, 100])
+
+            positions = dataset.PositionDataset(directory)
+            self.assertEqual(len(positions), 1000)
+
+            boards, is_black, masks = positions.batch(np.arange(len(positions)))
+            for board, color, mask in zip(boards, is_black, masks):
+                self.assertTrue(np.array_equal(np.unpackbits(mask).view(np.int8), get_legal_moves_mask(board, color)))
+
+            # games are played, not only start positions
+            self.assertGreater(len(np.unique(boards.reshape(len(boards), -1), axis=0)), 100)
+
+            boards, is_black, masks = positions.sample(16)
+            self.assertEqual(boards.shape, (16, 8, 8))
+
+    def test_strict_games(self):
+        with tempfile.TemporaryDirectory() as directory:
+            dataset.generate_dataset(directory, 200, shard_size=200, strict=True, workers=1, verbose=False)
+            boards, is_black, masks = dataset.PositionDataset(directory).batch(np.arange(200))
+            for board, color, mask in zip(boards, is_black, masks):
+                self.assertTrue(np.array_equal(np.unpackbits(mask).view(np.int8), get_strict_legal_moves_mask(board, color)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,29 +4,12 @@ import numba as nb
 import chess
 import chess.svg
 
-WRONG_PIECE_COLOR_PENALTY = -1
-ILLEGAL_MOVE_PENALTY_1 = -1
-ILLEGAL_MOVE_PENALTY_2 = -1
-LEGAL_MOVE_REWARD = 1
-
-# PAWN_CAPTURE_REWARD = 5
-# ROOK_CAPTURE_REWARD = 5
-# KNIGHT_CAPTURE_REWARD = 5
-# BISHOP_CAPTURE_REWARD = 5
-# QUEEN_CAPTURE_REWARD = 5
-# KING_CAPTURE_REWARD = 5
-
-# WRONG_PIECE_COLOR_PENALTY = 0
-# ILLEGAL_MOVE_PENALTY_1 = 0
-# ILLEGAL_MOVE_PENALTY_2 = 0
-# LEGAL_MOVE_REWARD = 0
-
-PAWN_CAPTURE_REWARD = 1
-ROOK_CAPTURE_REWARD = 2
-KNIGHT_CAPTURE_REWARD = 3
-BISHOP_CAPTURE_REWARD = 5
-QUEEN_CAPTURE_REWARD = 15
-KING_CAPTURE_REWARD = 50
+from .constants import (WRONG_PIECE_COLOR_PENALTY, ILLEGAL_MOVE_PENALTY_1, ILLEGAL_MOVE_PENALTY_2, LEGAL_MOVE_REWARD,
+                        PAWN_CAPTURE_REWARD, ROOK_CAPTURE_REWARD, KNIGHT_CAPTURE_REWARD, BISHOP_CAPTURE_REWARD,
+                        QUEEN_CAPTURE_REWARD, KING_CAPTURE_REWARD, ZOBRIST_PIECE_KEYS, ZOBRIST_BLACK_KEY, SNAPSHOT_SIZE,
+                        STAT_MOVES, STAT_LEGAL, STAT_WRONG_COLOR, STAT_ILLEGAL_1, STAT_ILLEGAL_2, STAT_RANDOM_FALLBACKS,
+                        STAT_NO_LEGAL_MOVES, STAT_CAPTURES, STAT_LEGAL_MOVES_CALLS, STAT_MASKS, PAWN, ROOK, KNIGHT,
+                        BISHOP, QUEEN, KING)
 
 @nb.njit('int8(types.unicode_type)',cache=True)
 def piece(name: str) -> int:
@@ -95,14 +78,14 @@ def to_fen(board: np.ndarray) -> str:
 def generate_start_board() -> np.ndarray:
     board = np.zeros((8, 8), dtype=np.int8)
 
-    board[0, :] = np.array([0             , 0             , 0             , piece('PAWN'), piece('ROOK'), piece('BISHOP'), piece('KNIGHT'), piece('KING')  ], dtype=np.int8)
-    board[1, :] = np.array([0             , 0             , 0             , 0           , piece('PAWN'), piece('PAWN')  , piece('QUEEN') , piece('KNIGHT')], dtype=np.int8)
-    board[2, :] = np.array([0             , 0             , 0             , 0           , 0           , piece('PAWN')  , piece('PAWN')  , piece('BISHOP')], dtype=np.int8)
-    board[3, :] = np.array([piece('pawn')  , 0             , 0             , 0           , 0           , 0             , piece('PAWN')  , piece('ROOK')  ], dtype=np.int8)
-    board[4, :] = np.array([piece('rook')  , piece('pawn')  , 0             , 0           , 0           , 0             , 0             , piece('PAWN')  ], dtype=np.int8)
-    board[5, :] = np.array([piece('bishop'), piece('pawn')  , piece('pawn')  , 0           , 0           , 0             , 0             , 0             ], dtype=np.int8)
-    board[6, :] = np.array([piece('knight'), piece('queen') , piece('pawn')  , piece('pawn'), 0           , 0             , 0             , 0             ], dtype=np.int8)
-    board[7, :] = np.array([piece('king')  , piece('knight'), piece('bishop'), piece('rook'), piece('pawn'), 0             , 0             , 0             ], dtype=np.int8)
+    board[0, :] = np.array([0      , 0      , 0      , PAWN , ROOK , BISHOP, KNIGHT, KING  ], dtype=np.int8)
+    board[1, :] = np.array([0      , 0      , 0      , 0    , PAWN , PAWN  , QUEEN , KNIGHT], dtype=np.int8)
+    board[2, :] = np.array([0      , 0      , 0      , 0    , 0    , PAWN  , PAWN  , BISHOP], dtype=np.int8)
+    board[3, :] = np.array([-PAWN  , 0      , 0      , 0    , 0    , 0     , PAWN  , ROOK  ], dtype=np.int8)
+    board[4, :] = np.array([-ROOK  , -PAWN  , 0      , 0    , 0    , 0     , 0     , PAWN  ], dtype=np.int8)
+    board[5, :] = np.array([-BISHOP, -PAWN  , -PAWN  , 0    , 0    , 0     , 0     , 0     ], dtype=np.int8)
+    board[6, :] = np.array([-KNIGHT, -QUEEN , -PAWN  , -PAWN, 0    , 0     , 0     , 0     ], dtype=np.int8)
+    board[7, :] = np.array([-KING  , -KNIGHT, -BISHOP, -ROOK, -PAWN, 0     , 0     , 0     ], dtype=np.int8)
     
     return board
 
@@ -292,6 +275,9 @@ def king_legal_moves(board: np.ndarray, x: int, y: int):
     
     # Possible king moves
     king_moves = [(1,1), (1,-1), (-1,1), (-1,-1), (1,0), (-1,0), (0,1), (0,-1)]
+
+    # opponent kings, same for every target square
+    king_positions = np.where(board == -piece)
     
     for move in king_moves:
         # Determine potential square to move to
@@ -302,7 +288,6 @@ def king_legal_moves(board: np.ndarray, x: int, y: int):
         if inbounds(new_y, new_x) and (board[new_y, new_x] == 0 or board[new_y, new_x] * piece < 0):
             
             # Check if the king is not moving adjacent to an opponent king
-            king_positions = np.where(board == -piece)
             for kx, ky in zip(king_positions[1], king_positions[0]):
                 if abs(new_x - kx) <= 1 and abs(new_y - ky) <= 1:
                     break
@@ -315,39 +300,88 @@ def king_legal_moves(board: np.ndarray, x: int, y: int):
 def legal_moves(board: np.ndarray, x, y):
     piece_value = board[y, x]
     
-    if abs(piece_value) == piece('PAWN'):
+    if abs(piece_value) == PAWN:
         return pawn_legal_moves(board, x, y)
-    elif abs(piece_value) == piece('ROOK'):
+    elif abs(piece_value) == ROOK:
         return rook_legal_moves(board, x, y)
-    elif abs(piece_value) == piece('KNIGHT'):
+    elif abs(piece_value) == KNIGHT:
         return knight_legal_moves(board, x, y)
-    elif abs(piece_value) == piece('BISHOP'):
+    elif abs(piece_value) == BISHOP:
         return bishop_legal_moves(board, x, y)
-    elif abs(piece_value) == piece('QUEEN'):
+    elif abs(piece_value) == QUEEN:
         return queen_legal_moves(board, x, y)
-    elif abs(piece_value) == piece('king'):
+    elif abs(piece_value) == KING:
         return king_legal_moves(board, x, y)
 
     return np.zeros((8, 8), dtype=np.int8)
 
-@nb.njit('int8[:,:](int8[:,:], boolean)', cache=True)
-def all_legal_moves(board: np.ndarray, isBlack: bool) -> np.ndarray:
+# Piece lists, per color squares (`y * 8 + x`) of pieces kept next to the board so move generation
+# does not scan empty squares. Row 0 holds white pieces, row 1 black ones, column `PIECE_COUNT` holds number of pieces.
+# Lists are updated by move kernels (`piece_lists` argument), order of squares in a list is arbitrary.
+PIECE_COUNT = 64
+
+@nb.njit(cache=True)
+def build_piece_lists(board: np.ndarray) -> np.ndarray:
+    """
+    Returns piece lists (2, 65) int8 of given board
+    """
+    piece_lists = np.zeros((2, PIECE_COUNT + 1), dtype=np.int8)
+    for square in range(64):
+        piece_value = board[square // 8, square % 8]
+        if piece_value != 0:
+            color = 1 if piece_value > 0 else 0
+            piece_lists[color, piece_lists[color, PIECE_COUNT]] = square
+            piece_lists[color, PIECE_COUNT] += 1
+    return piece_lists
+
+@nb.njit(cache=True)
+def piece_squares(board: np.ndarray, isBlack: bool, piece_lists=None) -> np.ndarray:
+    """
+    Squares of pieces of given color, from `piece_lists` if given, otherwise the board is scanned
+    """
+    if piece_lists is None:
+        return np.flatnonzero(((board > 0) == isBlack) & (board != 0))
+    color = 1 if isBlack else 0
+    return piece_lists[color, :piece_lists[color, PIECE_COUNT]].astype(np.int64)
+
+@nb.njit(cache=True)
+def move_piece(piece_lists: np.ndarray, piece_value: int, captured: int, from_square: int, to_square: int):
+    """
+    Updates piece lists for a move, call it with board values from before the move
+    """
+    if captured != 0:
+        color = 1 if captured > 0 else 0
+        count = piece_lists[color, PIECE_COUNT]
+        for i in range(count):
+            if piece_lists[color, i] == to_square:
+                # last piece takes place of the captured one
+                piece_lists[color, i] = piece_lists[color, count - 1]
+                piece_lists[color, PIECE_COUNT] = count - 1
+                break
+
+    color = 1 if piece_value > 0 else 0
+    for i in range(piece_lists[color, PIECE_COUNT]):
+        if piece_lists[color, i] == from_square:
+            piece_lists[color, i] = to_square
+            break
+
+@nb.njit(cache=True)
+def all_legal_moves(board: np.ndarray, isBlack: bool, piece_lists=None) -> np.ndarray:
     moves = np.zeros((8, 8), dtype=np.int8)
-    xs, ys = np.where((board < 0) != isBlack)
-    for x, y in zip(xs, ys):
-        moves += legal_moves(board, y, x)
+    for square in piece_squares(board, isBlack, piece_lists):
+        moves += legal_moves(board, square % 8, square // 8)
     return moves
 
 @nb.njit('float32[:,:,:](int8[:,:])', cache=True)
 def board_to_observation(board: np.ndarray) -> np.ndarray:
     observation = np.zeros((8, 8, 8), dtype=np.float32)
 
-    observation[:, :, 0] = (board == piece('pawn')).astype(np.int8) - (board == piece('PAWN')).astype(np.int8)
-    observation[:, :, 1] = (board == piece('rook')).astype(np.int8) - (board == piece('ROOK')).astype(np.int8)
-    observation[:, :, 2] = (board == piece('knight')).astype(np.int8) - (board == piece('KNIGHT')).astype(np.int8)
-    observation[:, :, 3] = (board == piece('bishop')).astype(np.int8) - (board == piece('BISHOP')).astype(np.int8)
-    observation[:, :, 4] = (board == piece('queen')).astype(np.int8) - (board == piece('QUEEN')).astype(np.int8)
-    observation[:, :, 5] = (board == piece('king')).astype(np.int8) - (board == piece('KING')).astype(np.int8)
+    observation[:, :, 0] = (board == -PAWN).astype(np.int8) - (board == PAWN).astype(np.int8)
+    observation[:, :, 1] = (board == -ROOK).astype(np.int8) - (board == ROOK).astype(np.int8)
+    observation[:, :, 2] = (board == -KNIGHT).astype(np.int8) - (board == KNIGHT).astype(np.int8)
+    observation[:, :, 3] = (board == -BISHOP).astype(np.int8) - (board == BISHOP).astype(np.int8)
+    observation[:, :, 4] = (board == -QUEEN).astype(np.int8) - (board == QUEEN).astype(np.int8)
+    observation[:, :, 5] = (board == -KING).astype(np.int8) - (board == KING).astype(np.int8)
 
     observation[:, :, 6] = all_legal_moves(board, True)
     observation[:, :, 7] = all_legal_moves(board, False)
@@ -361,11 +395,200 @@ def board_to_observation_batch(board: np.ndarray) -> np.ndarray:
         output[i] = board_to_observation(board[i])
     return output
 
+@nb.njit(cache=True)
+def _observation_and_mask(board: np.ndarray, isBlack: bool, safety, stats, piece_lists) -> Tuple[np.ndarray, np.ndarray]:
+    # `safety` - `king_safety` of the side to move to filter its moves with, `None` compiles filtering out
+    if stats is not None:
+        stats[STAT_MASKS] += 1
+
+    observation = np.zeros((8, 8, 8), dtype=np.float32)
+    mask = np.zeros((4096), dtype=np.int8)
+
+    observation[:, :, 0] = (board == -PAWN).astype(np.int8) - (board == PAWN).astype(np.int8)
+    observation[:, :, 1] = (board == -ROOK).astype(np.int8) - (board == ROOK).astype(np.int8)
+    observation[:, :, 2] = (board == -KNIGHT).astype(np.int8) - (board == KNIGHT).astype(np.int8)
+    observation[:, :, 3] = (board == -BISHOP).astype(np.int8) - (board == BISHOP).astype(np.int8)
+    observation[:, :, 4] = (board == -QUEEN).astype(np.int8) - (board == QUEEN).astype(np.int8)
+    observation[:, :, 5] = (board == -KING).astype(np.int8) - (board == KING).astype(np.int8)
+
+    # accumulate in int8 like `all_legal_moves` does
+    black_moves = np.zeros((8, 8), dtype=np.int8)
+    white_moves = np.zeros((8, 8), dtype=np.int8)
+
+    for color in (True, False):
+        for square in piece_squares(board, color, piece_lists):
+            y, x = square // 8, square % 8
+
+            legal = legal_moves(board, x, y)
+            if stats is not None:
+                stats[STAT_LEGAL_MOVES_CALLS] += 1
+
+            if color:
+                black_moves += legal
+            else:
+                white_moves += legal
+
+            if color == isBlack:
+                if safety is not None:
+                    # observation keeps pseudo-legal moves, they are already summed
+                    legal = filter_legal_moves(board, x, y, legal, *safety)
+                for y2 in range(8):
+                    for x2 in range(8):
+                        if legal[y2, x2] != 0:
+                            mask[move_to_int(x, y, x2, y2)] = 1
+
+    observation[:, :, 6] = black_moves
+    observation[:, :, 7] = white_moves
+
+    return observation, mask
+
+@nb.njit(cache=True)
+def board_to_observation_and_mask(board: np.ndarray, isBlack: bool, stats=None, piece_lists=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns observation (same as `board_to_observation`) and mask (4096 x 1) of legal moves for given color
+    (same as `get_legal_moves_mask`). Both are built from one move generation pass over the board.
+    `stats` - optional int64 array of counters (see `STAT_*` in constants), `None` compiles counting out
+    `piece_lists` - optional piece lists of the board (see `build_piece_lists`), only listed squares are visited
+    """
+    return _observation_and_mask(board, isBlack, None, stats, piece_lists)
+
+
+# Incremental position state, keeps `legal_moves` of every piece and everything derived from it, so after a move
+# only pieces whose moves could have changed are regenerated (the moved piece, pieces seeing the from or to square
+# and kings). Same observation and pseudo-legal mask as `board_to_observation_and_mask`.
+# * piece_moves - (64, 8, 8) int8 `legal_moves` of the piece on every square (zeros for empty squares)
+# * move_sums - (2, 8, 8) int8 sums of piece moves, white (0) and black (1), wrapping like `all_legal_moves`
+# * masks - (2, 4096) int8 legal moves masks of white (0) and black (1)
+# * observation - (8, 8, 8) float32
+
+@nb.njit(cache=True)
+def _refresh_square(board: np.ndarray, square: int, piece_moves: np.ndarray, move_sums: np.ndarray, masks: np.ndarray):
+    y, x = square // 8, square % 8
+    row = x * 512 + y * 64
+    stored = piece_moves[square]
+
+    # stored moves carry value of the piece that made them
+    for y2 in range(8):
+        for x2 in range(8):
+            value = stored[y2, x2]
+            if value != 0:
+                move_sums[1 if value > 0 else 0, y2, x2] -= value
+                stored[y2, x2] = 0
+                masks[1 if value > 0 else 0, row + x2 * 8 + y2] = 0
+
+    if board[y, x] == 0:
+        return
+
+    moves = legal_moves(board, x, y)
+    color = 1 if board[y, x] > 0 else 0
+    for y2 in range(8):
+        for x2 in range(8):
+            value = moves[y2, x2]
+            if value != 0:
+                stored[y2, x2] = value
+                move_sums[color, y2, x2] += value
+                masks[color, row + x2 * 8 + y2] = 1
+
+@nb.njit(cache=True)
+def _sees(board: np.ndarray, square: int, target: int) -> bool:
+    """
+    whether moves of piece on `square` can depend on contents of `target`
+    """
+    y, x = square // 8, square % 8
+    target_y, target_x = target // 8, target % 8
+    dx, dy = abs(target_x - x), abs(target_y - y)
+    kind = abs(board[y, x])
+
+    if kind == PAWN:
+        return max(dx, dy) <= 2
+    if kind == KNIGHT:
+        return (dx == 1 and dy == 2) or (dx == 2 and dy == 1)
+    if kind == KING:
+        return max(dx, dy) <= 1
+
+    straight = dx == 0 or dy == 0
+    diagonal = dx == dy
+    if not ((straight and kind != BISHOP) or (diagonal and kind != ROOK)):
+        return False
+
+    # slider only sees the target if nothing stands in between
+    step_x, step_y = np.sign(target_x - x), np.sign(target_y - y)
+    x, y = x + step_x, y + step_y
+    while x != target_x or y != target_y:
+        if board[y, x] != 0:
+            return False
+        x, y = x + step_x, y + step_y
+    return True
+
+@nb.njit(cache=True)
+def _piece_planes(board: np.ndarray, observation: np.ndarray, y: int, x: int):
+    observation[y, x, :6] = 0
+    piece_value = board[y, x]
+    if piece_value != 0:
+        # white pieces are 1, black -1 (see `board_to_observation_and_mask`)
+        observation[y, x, abs(piece_value) - 1] = -1 if piece_value > 0 else 1
+
+@nb.njit(cache=True)
+def incremental_state(board: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Builds incremental state (piece_moves, move_sums, masks, observation) of the board from scratch
+    """
+    piece_moves = np.zeros((64, 8, 8), dtype=np.int8)
+    move_sums = np.zeros((2, 8, 8), dtype=np.int8)
+    masks = np.zeros((2, 4096), dtype=np.int8)
+    observation = np.zeros((8, 8, 8), dtype=np.float32)
+
+    for square in range(64):
+        _refresh_square(board, square, piece_moves, move_sums, masks)
+        _piece_planes(board, observation, square // 8, square % 8)
+
+    observation[:, :, 6] = move_sums[1]
+    observation[:, :, 7] = move_sums[0]
+    return piece_moves, move_sums, masks, observation
+
+@nb.njit(cache=True)
+def update_incremental(board: np.ndarray, from_square: int, to_square: int, piece_moves: np.ndarray, move_sums: np.ndarray,
+                       masks: np.ndarray, observation: np.ndarray, stats=None, piece_lists=None):
+    """
+    Updates incremental state after a move from `from_square` to `to_square` (`y * 8 + x`) was made on the board
+    """
+    _refresh_square(board, from_square, piece_moves, move_sums, masks)
+    _refresh_square(board, to_square, piece_moves, move_sums, masks)
+    refreshed = 2
+
+    for color in (True, False):
+        for square in piece_squares(board, color, piece_lists):
+            if square == to_square:
+                continue
+            # kings can't step next to the opponent king, which may have moved or been captured
+            if abs(board[square // 8, square % 8]) == KING or _sees(board, square, from_square) or _sees(board, square, to_square):
+                _refresh_square(board, square, piece_moves, move_sums, masks)
+                refreshed += 1
+
+    if stats is not None:
+        stats[STAT_LEGAL_MOVES_CALLS] += refreshed
+
+    for square in (from_square, to_square):
+        _piece_planes(board, observation, square // 8, square % 8)
+    observation[:, :, 6] = move_sums[1]
+    observation[:, :, 7] = move_sums[0]
+
+@nb.njit(cache=True)
+def make_move_from_action_incremental(board: np.ndarray, action: int, isBlack: bool, piece_moves: np.ndarray, move_sums: np.ndarray,
+                                      masks: np.ndarray, observation: np.ndarray, stats=None, piece_lists=None) -> Tuple[bool, float, int]:
+    """
+    Same as `make_move_from_action_played`, also updates incremental state
+    """
+    done, reward, played = make_move_from_action_played(board, action, isBlack, stats, piece_lists)
+    if played >= 0:
+        x1, y1, x2, y2 = int_action_to_move(played)
+        update_incremental(board, y1 * 8 + x1, y2 * 8 + x2, piece_moves, move_sums, masks, observation, stats, piece_lists)
+    return done, reward, played
 
 @nb.njit(cache=True)
-def random_legal_move(board: np.ndarray, isBlack: bool) -> Optional[Tuple[int, int, int, int]]:
+def random_legal_move(board: np.ndarray, isBlack: bool, stats=None, piece_lists=None) -> Optional[Tuple[int, int, int, int]]:
     # choose random piece
-    pieces = np.argwhere((board > 0) != isBlack)
+    pieces = piece_squares(board, isBlack, piece_lists)
 
     # if no pieces, return None
     if len(pieces) == 0:
@@ -374,8 +597,11 @@ def random_legal_move(board: np.ndarray, isBlack: bool) -> Optional[Tuple[int, i
     # random permutation of pieces
     np.random.shuffle(pieces)
 
-    for x1, y1 in pieces:
-        legal = legal_moves(board, y1, x1)
+    for square in pieces:
+        y1, x1 = square // 8, square % 8
+        legal = legal_moves(board, x1, y1)
+        if stats is not None:
+            stats[STAT_LEGAL_MOVES_CALLS] += 1
 
         # choose random legal move
         legal = np.argwhere(legal != 0)
@@ -384,13 +610,13 @@ def random_legal_move(board: np.ndarray, isBlack: bool) -> Optional[Tuple[int, i
             continue
         
         # choose random legal move
-        x2, y2 = legal[np.random.randint(0, len(legal))]
+        y2, x2 = legal[np.random.randint(0, len(legal))]
 
         return (x1, y1, x2, y2)
     return None
 
 @nb.njit(cache=True)
-def generate_move(board: np.ndarray, x1: int, y1: int, x2: int, y2: int, isBlack: bool) -> Tuple[Optional[Tuple[int, int, int, int]], float]:
+def generate_move(board: np.ndarray, x1: int, y1: int, x2: int, y2: int, isBlack: bool, stats=None, piece_lists=None) -> Tuple[Optional[Tuple[int, int, int, int]], float]:
     """
     generates legal move and penalty from any illegal move, return None if no legal moves are possible
     """
@@ -399,7 +625,10 @@ def generate_move(board: np.ndarray, x1: int, y1: int, x2: int, y2: int, isBlack
 
     # check if piece is correct color
     if (piece > 0) != isBlack:
-        move = random_legal_move(board, isBlack)
+        if stats is not None:
+            stats[STAT_WRONG_COLOR] += 1
+            stats[STAT_RANDOM_FALLBACKS] += 1
+        move = random_legal_move(board, isBlack, stats, piece_lists)
         if move is None:
             return None, 0 # no legal moves, game over
         else:
@@ -407,51 +636,63 @@ def generate_move(board: np.ndarray, x1: int, y1: int, x2: int, y2: int, isBlack
         
     # check what are the legal moves
     legal = legal_moves(board, x1, y1)
+    if stats is not None:
+        stats[STAT_LEGAL_MOVES_CALLS] += 1
 
     if legal[y2, x2] != 0:
         # legal move
+        if stats is not None:
+            stats[STAT_LEGAL] += 1
         return (x1, y1, x2, y2), LEGAL_MOVE_REWARD
     else:
         # choose random legal move
         legal = np.argwhere(legal != 0)
         if len(legal) != 0:
+            if stats is not None:
+                stats[STAT_ILLEGAL_1] += 1
             y2, x2 = legal[np.random.randint(0, len(legal))]
             return (x1, y1, x2, y2), ILLEGAL_MOVE_PENALTY_1 # legal pawn, illegal move
         else: 
             # no legal moves, try any move
-            return random_legal_move(board, isBlack), ILLEGAL_MOVE_PENALTY_2 # no legal moves
+            if stats is not None:
+                stats[STAT_ILLEGAL_2] += 1
+                stats[STAT_RANDOM_FALLBACKS] += 1
+            return random_legal_move(board, isBlack, stats, piece_lists), ILLEGAL_MOVE_PENALTY_2 # no legal moves
 
 @nb.njit(cache=True)
-def get_legal_moves_mask(board: np.ndarray, isBlack: bool) -> np.ndarray:
+def get_legal_moves_mask(board: np.ndarray, isBlack: bool, stats=None, piece_lists=None) -> np.ndarray:
     """
     Returns a mask (4096 x 1) of legal moves for given board and color
     """
+    if stats is not None:
+        stats[STAT_MASKS] += 1
 
     mask = np.zeros((4096), dtype=np.int8)
 
-    for x in range(8):
-        for y in range(8):
-            if (board[x, y] < 0) == isBlack:
-                legal = legal_moves(board, x, y)
-                legal = np.argwhere(legal != 0)
-                for x2, y2 in legal:
-                    mask[move_to_int(x, y, y2, x2)] = 1
+    for square in piece_squares(board, isBlack, piece_lists):
+        y, x = square // 8, square % 8
+        legal = legal_moves(board, x, y)
+        if stats is not None:
+            stats[STAT_LEGAL_MOVES_CALLS] += 1
+        legal = np.argwhere(legal != 0)
+        for y2, x2 in legal:
+            mask[move_to_int(x, y, x2, y2)] = 1
 
     return mask
 
 @nb.njit(cache=True)
 def capture_reward(captured_piece: int):
-    if captured_piece == piece('PAWN'):
+    if captured_piece == PAWN:
         return PAWN_CAPTURE_REWARD
-    elif captured_piece == piece('ROOK'):
+    elif captured_piece == ROOK:
         return ROOK_CAPTURE_REWARD
-    elif captured_piece == piece('KNIGHT'):
+    elif captured_piece == KNIGHT:
         return KNIGHT_CAPTURE_REWARD
-    elif captured_piece == piece('BISHOP'):
+    elif captured_piece == BISHOP:
         return BISHOP_CAPTURE_REWARD
-    elif captured_piece == piece('QUEEN'):
+    elif captured_piece == QUEEN:
         return QUEEN_CAPTURE_REWARD
-    elif captured_piece == piece('KING'):
+    elif captured_piece == KING:
         return KING_CAPTURE_REWARD
     else:
         return 0
@@ -469,6 +710,120 @@ def int_action_to_move(action: int) -> Tuple[int, int, int, int]:
 
     return x1, y1, x2, y2
 
+@nb.njit('void(int8[:,:], boolean, uint8[:], boolean)', cache=True)
+def _fill_legal_moves_mask(board: np.ndarray, isBlack: bool, mask: np.ndarray, packed: bool):
+    """
+    writes legal moves of given color into `mask`, either dense (4096,) or bit-packed (512,)
+    """
+    for x in range(8):
+        for y in range(8):
+            if board[y, x] != 0 and (board[y, x] > 0) == isBlack:
+                legal = legal_moves(board, x, y)
+                for y2 in range(8):
+                    for x2 in range(8):
+                        if legal[y2, x2] != 0:
+                            action = move_to_int(x, y, x2, y2)
+                            if packed:
+                                # same bit order as np.packbits (most significant bit first)
+                                mask[action >> 3] |= np.uint8(0x80 >> (action & 7))
+                            else:
+                                mask[action] = 1
+
+@nb.njit('uint8[:,:](int8[:,:,:], boolean[:], boolean)', cache=True, parallel=True)
+def _legal_moves_mask_batch(boards: np.ndarray, isBlack: np.ndarray, packed: bool) -> np.ndarray:
+    mask = np.zeros((len(boards), 512 if packed else 4096), dtype=np.uint8)
+    for i in nb.prange(len(boards)):
+        _fill_legal_moves_mask(boards[i], isBlack[i], mask[i], packed)
+    return mask
+
+def get_legal_moves_mask_batch(boards: np.ndarray, isBlack, packed: bool = False) -> np.ndarray:
+    """
+    Returns masks of legal moves for batch of boards (N, 8, 8) and colors (one color or one per board).
+    Dense masks are (N, 4096) int8 (like `get_legal_moves_mask`), packed are (N, 512) uint8 with bits in `np.packbits` order,
+    unpack with `np.unpackbits(mask, axis=1)` or `reinforce.masking.unpack_mask` in graph.
+    Boards are processed in parallel.
+    """
+    boards = np.ascontiguousarray(boards, dtype=np.int8).reshape(-1, 8, 8)
+    isBlack = np.array(np.broadcast_to(np.asarray(isBlack, dtype=np.bool_), (len(boards),)))
+    mask = _legal_moves_mask_batch(boards, isBlack, packed)
+    return mask if packed else mask.view(np.int8)
+
+@nb.njit('Tuple((int64[:], int32[:]))(uint8[:,:])', cache=True, parallel=True)
+def _mask_to_csr(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    n = len(mask)
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    for i in range(n):
+        offsets[i + 1] = offsets[i] + np.count_nonzero(mask[i])
+
+    actions = np.empty(offsets[n], dtype=np.int32)
+    for i in nb.prange(n):
+        position = offsets[i]
+        for action in range(4096):
+            if mask[i, action] != 0:
+                actions[position] = action
+                position += 1
+    return offsets, actions
+
+def legal_moves_csr_batch(boards: np.ndarray, isBlack) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns legal moves of batch of boards (N, 8, 8) in CSR form:
+    * offsets (N + 1,) int64 - moves of board `i` are `actions[offsets[i]:offsets[i + 1]]`
+    * actions (offsets[N],) int32 - legal actions (`move_to_int`), ascending within every board
+    Use with `reinforce.masking` segment helpers instead of dense 4096 masks.
+    """
+    boards = np.ascontiguousarray(boards, dtype=np.int8).reshape(-1, 8, 8)
+    isBlack = np.array(np.broadcast_to(np.asarray(isBlack, dtype=np.bool_), (len(boards),)))
+    return _mask_to_csr(_legal_moves_mask_batch(boards, isBlack, False))
+
+@nb.njit(cache=True)
+def _fill_factored_mask(board: np.ndarray, isBlack: bool, from_mask: np.ndarray, to_masks: np.ndarray, stats=None, piece_lists=None):
+    """
+    writes from-squares with legal moves into `from_mask` (64,) and their targets into bit-packed `to_masks` (64, 8),
+    squares are `y * 8 + x`
+    """
+    for square in piece_squares(board, isBlack, piece_lists):
+        legal = legal_moves(board, square % 8, square // 8)
+        if stats is not None:
+            stats[STAT_LEGAL_MOVES_CALLS] += 1
+        for target in range(64):
+            if legal[target // 8, target % 8] != 0:
+                from_mask[square] = 1
+                # same bit order as np.packbits (most significant bit first)
+                to_masks[square, target >> 3] |= np.uint8(0x80 >> (target & 7))
+
+@nb.njit(cache=True)
+def get_factored_legal_moves_mask(board: np.ndarray, isBlack: bool, stats=None, piece_lists=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Legal moves split for from/to policy heads (8x8x2 actions of `array_action_to_move`), from one move generation pass:
+    * from mask (64,) int8 - squares `y * 8 + x` of pieces that have a legal move
+    * to masks (64, 8) uint8 - bit-packed targets of every from-square (`np.packbits` order, unpack with
+      `np.unpackbits(to_masks, axis=1)` into (64, 64))
+    """
+    if stats is not None:
+        stats[STAT_MASKS] += 1
+
+    from_mask = np.zeros(64, dtype=np.int8)
+    to_masks = np.zeros((64, 8), dtype=np.uint8)
+    _fill_factored_mask(board, isBlack, from_mask, to_masks, stats, piece_lists)
+    return from_mask, to_masks
+
+@nb.njit(cache=True, parallel=True)
+def _factored_legal_moves_mask_batch(boards: np.ndarray, isBlack: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    from_masks = np.zeros((len(boards), 64), dtype=np.int8)
+    to_masks = np.zeros((len(boards), 64, 8), dtype=np.uint8)
+    for i in nb.prange(len(boards)):
+        _fill_factored_mask(boards[i], isBlack[i], from_masks[i], to_masks[i], None, None)
+    return from_masks, to_masks
+
+def get_factored_legal_moves_mask_batch(boards: np.ndarray, isBlack) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    `get_factored_legal_moves_mask` for batch of boards (N, 8, 8) and colors (one color or one per board),
+    returns from masks (N, 64) int8 and packed to masks (N, 64, 8) uint8. Boards are processed in parallel.
+    """
+    boards = np.ascontiguousarray(boards, dtype=np.int8).reshape(-1, 8, 8)
+    isBlack = np.array(np.broadcast_to(np.asarray(isBlack, dtype=np.bool_), (len(boards),)))
+    return _factored_legal_moves_mask_batch(boards, isBlack)
+
 @nb.njit('int32(int8[:,:], float32[:,:,:], boolean)',cache=True)
 def array_action_to_move(board: np.ndarray, action: np.ndarray, isBlack: bool) -> int:
     # action is array 8x8x2, split into 8x8 and 8x8
@@ -530,11 +885,18 @@ def array_action_to_move_vectorized_one_board(board: np.ndarray, action: np.ndar
         
 
 @nb.njit(cache=True)
-def make_a_move(board: np.ndarray, x1: int, y1: int, x2: int, y2: int, isBlack: bool) -> Tuple[bool, float]:
+def make_a_move_played(board: np.ndarray, x1: int, y1: int, x2: int, y2: int, isBlack: bool, stats=None, piece_lists=None) -> Tuple[bool, float, int]:
+    """
+    Same as `make_a_move`, also returns action that was actually played (illegal moves are replaced), -1 if none
+    """
     #print("chosed move", x1, y1, x2, y2)
-    move, reward = generate_move(board, x1, y1, x2, y2, isBlack) # type: ignore
+    if stats is not None:
+        stats[STAT_MOVES] += 1
+    move, reward = generate_move(board, x1, y1, x2, y2, isBlack, stats, piece_lists) # type: ignore
     if move is None:
-        return True, 0
+        if stats is not None:
+            stats[STAT_NO_LEGAL_MOVES] += 1
+        return True, 0, -1
     else:
         x1, y1, x2, y2 = move
         #print("used move", x1, y1, x2, y2)
@@ -546,6 +908,11 @@ def make_a_move(board: np.ndarray, x1: int, y1: int, x2: int, y2: int, isBlack:
 
         # get reward
         reward += capture_reward(target_piece)
+        if stats is not None and target_piece != 0:
+            stats[STAT_CAPTURES] += 1
+
+        if piece_lists is not None:
+            move_piece(piece_lists, piece, target_piece, y1 * 8 + x1, y2 * 8 + x2)
 
         # move piece
         board[y2, x2] = piece
@@ -553,20 +920,683 @@ def make_a_move(board: np.ndarray, x1: int, y1: int, x2: int, y2: int, isBlack:
         # remove piece from old position
         board[y1, x1] = 0
     
-    return False, reward
+    return False, reward, move_to_int(x1, y1, x2, y2)
+
+@nb.njit(cache=True)
+def make_a_move(board: np.ndarray, x1: int, y1: int, x2: int, y2: int, isBlack: bool, stats=None, piece_lists=None) -> Tuple[bool, float]:
+    done, reward, _ = make_a_move_played(board, x1, y1, x2, y2, isBlack, stats, piece_lists)
+    return done, reward
 
 @nb.njit(cache=True)
-def make_move_from_action(board: np.ndarray, action: int, isBlack: bool) -> Tuple[bool, float]:
+def make_move_from_action(board: np.ndarray, action: int, isBlack: bool, stats=None, piece_lists=None) -> Tuple[bool, float]:
     x1, y1, x2, y2 = int_action_to_move(action)
-    return make_a_move(board, x1, y1, x2, y2, isBlack)
+    return make_a_move(board, x1, y1, x2, y2, isBlack, stats, piece_lists)
 
 @nb.njit(cache=True)
-def make_move_from_prob(board: np.ndarray, prob: np.ndarray, isBlack: bool) -> Tuple[bool, float]:
+def make_move_from_action_played(board: np.ndarray, action: int, isBlack: bool, stats=None, piece_lists=None) -> Tuple[bool, float, int]:
+    x1, y1, x2, y2 = int_action_to_move(action)
+    return make_a_move_played(board, x1, y1, x2, y2, isBlack, stats, piece_lists)
+
+@nb.njit(cache=True)
+def make_move_from_prob(board: np.ndarray, prob: np.ndarray, isBlack: bool, stats=None, piece_lists=None) -> Tuple[bool, float]:
     action = array_action_to_move(board, prob, isBlack)
     if action is None:
         return True, 0
     
-    return make_move_from_action(board, action, isBlack)
+    return make_move_from_action(board, action, isBlack, stats, piece_lists)
+
+# Strict (check aware) move generation. `legal_moves` is pseudo-legal: pieces can leave their own king
+# attacked and the game only ends when a side has no moves at all. Strict variants remove moves that
+# leave the king attacked, so games end on checkmate (or stalemate) like in a real game.
+# King safety of a position is computed once (attacks, checkers, pins) and reused to filter moves of every piece.
+
+# (dx, dy) of lines, first four are rook lines, last four bishop lines
+LINE_DIRECTIONS = np.array([(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1), (1, -1), (-1, 1)], dtype=np.int64)
+KNIGHT_OFFSETS = np.array([(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)], dtype=np.int64)
+
+@nb.njit(cache=True)
+def _moves_along(piece_value: int, direction: int) -> bool:
+    """
+    whether slider `piece_value` moves along line `direction` (index into `LINE_DIRECTIONS`)
+    """
+    kind = abs(piece_value)
+    if kind == QUEEN:
+        return True
+    if direction < 4:
+        return kind == ROOK
+    return kind == BISHOP
+
+@nb.njit(cache=True)
+def _find_king(board: np.ndarray, isBlack: bool, piece_lists=None) -> Tuple[int, int]:
+    king = KING if isBlack else -KING
+    if piece_lists is not None:
+        color = 1 if isBlack else 0
+        for i in range(piece_lists[color, PIECE_COUNT]):
+            square = piece_lists[color, i]
+            if board[square // 8, square % 8] == king:
+                return square % 8, square // 8
+        return -1, -1
+
+    for y in range(8):
+        for x in range(8):
+            if board[y, x] == king:
+                return x, y
+    return -1, -1
+
+@nb.njit(cache=True)
+def attack_map(board: np.ndarray, byBlack: bool, ignore_x: int = -1, ignore_y: int = -1) -> np.ndarray:
+    """
+    Returns (8, 8) boolean map of squares attacked by pieces of given color
+    (squares they could capture on, occupied or not). Square (`ignore_x`, `ignore_y`) is treated as empty,
+    used to see through the king that is being attacked.
+    """
+    attacked = np.zeros((8, 8), dtype=np.bool_)
+
+    for y in range(8):
+        for x in range(8):
+            piece_value = board[y, x]
+            if piece_value == 0 or (piece_value > 0) != byBlack:
+                continue
+            kind = abs(piece_value)
+
+            if kind == PAWN:
+                direction = 1 if piece_value > 0 else -1
+                if inbounds(y + direction, x - direction):
+                    attacked[y + direction, x - direction] = True
+                if inbounds(y - direction, x - direction):
+                    attacked[y - direction, x - direction] = True
+                if inbounds(y + direction, x + direction):
+                    attacked[y + direction, x + direction] = True
+            elif kind == KNIGHT:
+                for i in range(8):
+                    new_x, new_y = x + KNIGHT_OFFSETS[i, 0], y + KNIGHT_OFFSETS[i, 1]
+                    if inbounds(new_y, new_x):
+                        attacked[new_y, new_x] = True
+            elif kind == KING:
+                for i in range(8):
+                    new_x, new_y = x + LINE_DIRECTIONS[i, 0], y + LINE_DIRECTIONS[i, 1]
+                    if inbounds(new_y, new_x):
+                        attacked[new_y, new_x] = True
+            else:
+                for i in range(8):
+                    if not _moves_along(piece_value, i):
+                        continue
+                    new_x, new_y = x + LINE_DIRECTIONS[i, 0], y + LINE_DIRECTIONS[i, 1]
+                    while inbounds(new_y, new_x):
+                        attacked[new_y, new_x] = True
+                        if board[new_y, new_x] != 0 and not (new_x == ignore_x and new_y == ignore_y):
+                            break
+                        new_x += LINE_DIRECTIONS[i, 0]
+                        new_y += LINE_DIRECTIONS[i, 1]
+
+    return attacked
+
+@nb.njit(cache=True)
+def _attacks_square(board: np.ndarray, x: int, y: int, target_x: int, target_y: int) -> bool:
+    """
+    whether piece on (x, y) attacks (target_x, target_y)
+    """
+    piece_value = board[y, x]
+    kind = abs(piece_value)
+    dx, dy = target_x - x, target_y - y
+
+    if kind == PAWN:
+        direction = 1 if piece_value > 0 else -1
+        return (dy == direction and dx == -direction) or (dy == -direction and dx == -direction) or (dy == direction and dx == direction)
+    if kind == KNIGHT:
+        return (abs(dx) == 1 and abs(dy) == 2) or (abs(dx) == 2 and abs(dy) == 1)
+    if kind == KING:
+        return max(abs(dx), abs(dy)) == 1
+
+    for i in range(8):
+        if not _moves_along(piece_value, i):
+            continue
+        step_x, step_y = LINE_DIRECTIONS[i, 0], LINE_DIRECTIONS[i, 1]
+        new_x, new_y = x + step_x, y + step_y
+        while inbounds(new_y, new_x):
+            if new_x == target_x and new_y == target_y:
+                return True
+            if board[new_y, new_x] != 0:
+                break
+            new_x += step_x
+            new_y += step_y
+    return False
+
+@nb.njit(cache=True)
+def _square_attacked(board: np.ndarray, x: int, y: int, byBlack: bool, ignore_x: int = -1, ignore_y: int = -1) -> bool:
+    """
+    whether pieces of given color attack (x, y), same as `attack_map(...)[y, x]` but only looks from the square outwards
+    """
+    sign = 1 if byBlack else -1
+
+    # pawn on (x - dx, y - dy) attacks (x, y), see `attack_map`
+    for dx, dy in ((-sign, sign), (-sign, -sign), (sign, sign)):
+        if inbounds(y - dy, x - dx) and board[y - dy, x - dx] == sign * PAWN:
+            return True
+
+    for i in range(8):
+        new_x, new_y = x + KNIGHT_OFFSETS[i, 0], y + KNIGHT_OFFSETS[i, 1]
+        if inbounds(new_y, new_x) and board[new_y, new_x] == sign * KNIGHT:
+            return True
+
+    for i in range(8):
+        step_x, step_y = LINE_DIRECTIONS[i, 0], LINE_DIRECTIONS[i, 1]
+        new_x, new_y = x + step_x, y + step_y
+        if inbounds(new_y, new_x) and board[new_y, new_x] == sign * KING:
+            return True
+
+        while inbounds(new_y, new_x):
+            piece_value = board[new_y, new_x]
+            if piece_value != 0 and not (new_x == ignore_x and new_y == ignore_y):
+                kind = abs(piece_value)
+                if piece_value * sign > 0 and (kind == ROOK or kind == BISHOP or kind == QUEEN) and _moves_along(piece_value, i):
+                    return True
+                break
+            new_x += step_x
+            new_y += step_y
+
+    return False
+
+@nb.njit(cache=True)
+def king_safety(board: np.ndarray, isBlack: bool, piece_lists=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int, int]:
+    """
+    Computes what moves of given color must respect to keep its king safe
+    * attacked - (8, 8) squares attacked by the opponent, only filled for the king and squares next to it
+      (the only ones `filter_legal_moves` looks at)
+    * targets - (8, 8) squares other pieces may move to (all if not in check,
+      checker and blocking squares if in check, none if in double check)
+    * pins - (8, 8) line direction of pinned pieces, -1 for pieces that are not pinned
+    * king_x, king_y - position of the king, -1 if there is no king (then all moves are safe)
+    `piece_lists` - optional piece lists of the board, the king and checkers are looked up in them
+    """
+    king_x, king_y = _find_king(board, isBlack, piece_lists)
+    attacked = np.zeros((8, 8), dtype=np.bool_)
+    targets = np.ones((8, 8), dtype=np.bool_)
+    pins = np.full((8, 8), -1, dtype=np.int8)
+
+    if king_x < 0:
+        return attacked, targets, pins, king_x, king_y
+
+    # attacks see through the king, it can't step back along the line it is attacked on
+    for y in range(max(king_y - 1, 0), min(king_y + 2, 8)):
+        for x in range(max(king_x - 1, 0), min(king_x + 2, 8)):
+            attacked[y, x] = _square_attacked(board, x, y, not isBlack, king_x, king_y)
+
+    if attacked[king_y, king_x]:
+        checkers = 0
+        targets[:, :] = False
+        for square in piece_squares(board, not isBlack, piece_lists):
+            y, x = square // 8, square % 8
+            if _attacks_square(board, x, y, king_x, king_y):
+                checkers += 1
+                targets[y, x] = True
+                kind = abs(board[y, x])
+                if kind == ROOK or kind == BISHOP or kind == QUEEN:
+                    # squares between checker and king block the check
+                    step_x, step_y = np.sign(king_x - x), np.sign(king_y - y)
+                    new_x, new_y = x + step_x, y + step_y
+                    while new_x != king_x or new_y != king_y:
+                        targets[new_y, new_x] = True
+                        new_x += step_x
+                        new_y += step_y
+        if checkers > 1:
+            targets[:, :] = False
+
+    for i in range(8):
+        step_x, step_y = LINE_DIRECTIONS[i, 0], LINE_DIRECTIONS[i, 1]
+        new_x, new_y = king_x + step_x, king_y + step_y
+        pinned_x, pinned_y = -1, -1
+        while inbounds(new_y, new_x):
+            piece_value = board[new_y, new_x]
+            if piece_value != 0:
+                if (piece_value > 0) == isBlack:
+                    if pinned_x >= 0:
+                        break
+                    pinned_x, pinned_y = new_x, new_y
+                else:
+                    if pinned_x >= 0 and _moves_along(piece_value, i):
+                        pins[pinned_y, pinned_x] = i
+                    break
+            new_x += step_x
+            new_y += step_y
+
+    return attacked, targets, pins, king_x, king_y
+
+@nb.njit(cache=True)
+def _may_be_filtered(x: int, y: int, attacked: np.ndarray, pins: np.ndarray, king_x: int, king_y: int) -> bool:
+    # in check, pinned piece or the king, otherwise all moves of the piece are safe
+    return king_x >= 0 and ((x == king_x and y == king_y) or pins[y, x] >= 0 or attacked[king_y, king_x])
+
+@nb.njit(cache=True)
+def filter_legal_moves(board: np.ndarray, x: int, y: int, moves: np.ndarray, attacked: np.ndarray, targets: np.ndarray, pins: np.ndarray, king_x: int, king_y: int) -> np.ndarray:
+    """
+    Removes (in place) moves of piece on (x, y) that would leave its king attacked, `moves` are from `legal_moves`
+    and the rest from `king_safety` of the piece color
+    """
+    if not _may_be_filtered(x, y, attacked, pins, king_x, king_y):
+        return moves
+
+    is_king = x == king_x and y == king_y
+    pin = pins[y, x]
+
+    filtered = moves
+
+    for y2 in range(8):
+        for x2 in range(8):
+            if filtered[y2, x2] == 0:
+                continue
+            if is_king:
+                safe = not attacked[y2, x2]
+            else:
+                safe = targets[y2, x2]
+                if safe and pin >= 0:
+                    # pinned piece can move only along the pin line
+                    safe = (x2 - king_x) * LINE_DIRECTIONS[pin, 1] == (y2 - king_y) * LINE_DIRECTIONS[pin, 0]
+            if not safe:
+                filtered[y2, x2] = 0
+
+    return filtered
+
+@nb.njit(cache=True)
+def strict_legal_moves(board: np.ndarray, x: int, y: int) -> np.ndarray:
+    """
+    Same as `legal_moves` but without moves that leave own king attacked
+    """
+    attacked, targets, pins, king_x, king_y = king_safety(board, board[y, x] > 0)
+    return filter_legal_moves(board, x, y, legal_moves(board, x, y), attacked, targets, pins, king_x, king_y)
+
+@nb.njit(cache=True)
+def is_in_check(board: np.ndarray, isBlack: bool, piece_lists=None) -> bool:
+    king_x, king_y = _find_king(board, isBlack, piece_lists)
+    if king_x < 0:
+        return False
+    return _square_attacked(board, king_x, king_y, not isBlack)
+
+@nb.njit(cache=True)
+def _piece_moves(board: np.ndarray, x: int, y: int, stats, piece_moves) -> np.ndarray:
+    # `legal_moves` of the piece, copied from `piece_moves` of incremental state if given (filtering is in place)
+    if piece_moves is not None:
+        return piece_moves[y * 8 + x].copy()
+    if stats is not None:
+        stats[STAT_LEGAL_MOVES_CALLS] += 1
+    return legal_moves(board, x, y)
+
+@nb.njit(cache=True)
+def get_strict_legal_moves_mask(board: np.ndarray, isBlack: bool, stats=None, piece_lists=None, incremental=None) -> np.ndarray:
+    """
+    Same as `get_legal_moves_mask` but without moves that leave own king attacked.
+    `incremental` - optional incremental state (see `incremental_state`) of the board, its pseudo-legal mask is copied
+    and only moves of pieces that can lose some are checked, no moves are generated
+    """
+    if stats is not None:
+        stats[STAT_MASKS] += 1
+
+    attacked, targets, pins, king_x, king_y = king_safety(board, isBlack, piece_lists)
+
+    if incremental is not None:
+        piece_moves, _, masks, _ = incremental
+        mask = masks[1 if isBlack else 0].copy()
+        for square in piece_squares(board, isBlack, piece_lists):
+            y, x = square // 8, square % 8
+            if not _may_be_filtered(x, y, attacked, pins, king_x, king_y):
+                continue
+            moves = piece_moves[square]
+            legal = filter_legal_moves(board, x, y, moves.copy(), attacked, targets, pins, king_x, king_y)
+            for y2 in range(8):
+                for x2 in range(8):
+                    if moves[y2, x2] != 0 and legal[y2, x2] == 0:
+                        mask[move_to_int(x, y, x2, y2)] = 0
+        return mask
+
+    mask = np.zeros((4096), dtype=np.int8)
+    for square in piece_squares(board, isBlack, piece_lists):
+        y, x = square // 8, square % 8
+        legal = filter_legal_moves(board, x, y, legal_moves(board, x, y), attacked, targets, pins, king_x, king_y)
+        if stats is not None:
+            stats[STAT_LEGAL_MOVES_CALLS] += 1
+        for y2 in range(8):
+            for x2 in range(8):
+                if legal[y2, x2] != 0:
+                    mask[move_to_int(x, y, x2, y2)] = 1
+
+    return mask
+
+@nb.njit(cache=True)
+def board_to_observation_and_strict_mask(board: np.ndarray, isBlack: bool, stats=None, piece_lists=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Same as `board_to_observation_and_mask` with the mask of `get_strict_legal_moves_mask`, from the same single pass
+    """
+    return _observation_and_mask(board, isBlack, king_safety(board, isBlack, piece_lists), stats, piece_lists)
+
+@nb.njit(cache=True)
+def _keeps_king_safe(board: np.ndarray, x: int, y: int, x2: int, y2: int, king_x: int, king_y: int) -> bool:
+    """
+    whether moving piece from (x, y) to (x2, y2) leaves its king (on king_x, king_y) unattacked, the move is
+    played on the board and taken back. Cheaper than `king_safety` when only a few moves are checked.
+    """
+    if king_x < 0:
+        return True
+
+    piece_value, captured = board[y, x], board[y2, x2]
+    board[y2, x2] = piece_value
+    board[y, x] = 0
+    if x == king_x and y == king_y:
+        king_x, king_y = x2, y2
+    safe = not _square_attacked(board, king_x, king_y, piece_value < 0)
+    board[y, x] = piece_value
+    board[y2, x2] = captured
+    return safe
+
+@nb.njit(cache=True)
+def _remove_unsafe(board: np.ndarray, x: int, y: int, moves: np.ndarray, king_x: int, king_y: int) -> np.ndarray:
+    # same result as `filter_legal_moves`, by playing every move
+    for y2 in range(8):
+        for x2 in range(8):
+            if moves[y2, x2] != 0 and not _keeps_king_safe(board, x, y, x2, y2, king_x, king_y):
+                moves[y2, x2] = 0
+    return moves
+
+@nb.njit(cache=True)
+def has_strict_legal_move(board: np.ndarray, isBlack: bool, piece_lists=None, piece_moves=None) -> bool:
+    king_x, king_y = _find_king(board, isBlack, piece_lists)
+
+    # usually one of the first moves is legal, so they are checked one by one instead of computing `king_safety`
+    for square in piece_squares(board, isBlack, piece_lists):
+        y, x = square // 8, square % 8
+        moves = _piece_moves(board, x, y, None, piece_moves)
+        for y2 in range(8):
+            for x2 in range(8):
+                if moves[y2, x2] != 0 and _keeps_king_safe(board, x, y, x2, y2, king_x, king_y):
+                    return True
+    return False
+
+@nb.njit(cache=True)
+def generate_move_strict(board: np.ndarray, x1: int, y1: int, x2: int, y2: int, isBlack: bool, stats=None, piece_lists=None,
+                         piece_moves=None) -> Tuple[Optional[Tuple[int, int, int, int]], float]:
+    """
+    Same rules and penalties as `generate_move`, but only strictly legal moves are played.
+    `piece_moves` - optional moves of incremental state (see `incremental_state`), then no moves are generated
+    """
+    king_x, king_y = _find_king(board, isBlack, piece_lists)
+
+    if (board[y1, x1] > 0) == isBlack and board[y1, x1] != 0:
+        legal = _piece_moves(board, x1, y1, stats, piece_moves)
+
+        if legal[y2, x2] != 0 and _keeps_king_safe(board, x1, y1, x2, y2, king_x, king_y):
+            if stats is not None:
+                stats[STAT_LEGAL] += 1
+            return (x1, y1, x2, y2), LEGAL_MOVE_REWARD
+
+        legal = np.argwhere(_remove_unsafe(board, x1, y1, legal, king_x, king_y) != 0)
+        if len(legal) != 0:
+            if stats is not None:
+                stats[STAT_ILLEGAL_1] += 1
+            y2, x2 = legal[np.random.randint(0, len(legal))]
+            return (x1, y1, x2, y2), ILLEGAL_MOVE_PENALTY_1
+
+        penalty = ILLEGAL_MOVE_PENALTY_2
+        if stats is not None:
+            stats[STAT_ILLEGAL_2] += 1
+    else:
+        penalty = WRONG_PIECE_COLOR_PENALTY
+        if stats is not None:
+            stats[STAT_WRONG_COLOR] += 1
+
+    # random strictly legal move, random piece first like `random_legal_move`
+    if stats is not None:
+        stats[STAT_RANDOM_FALLBACKS] += 1
+
+    pieces = piece_squares(board, isBlack, piece_lists)
+    np.random.shuffle(pieces)
+
+    for square in pieces:
+        y1, x1 = square // 8, square % 8
+        legal = _remove_unsafe(board, x1, y1, _piece_moves(board, x1, y1, stats, piece_moves), king_x, king_y)
+
+        legal = np.argwhere(legal != 0)
+        if len(legal) == 0:
+            continue
+
+        y2, x2 = legal[np.random.randint(0, len(legal))]
+        return (x1, y1, x2, y2), penalty
+
+    # checkmate or stalemate
+    return None, 0
+
+@nb.njit(cache=True)
+def make_a_move_strict_played(board: np.ndarray, x1: int, y1: int, x2: int, y2: int, isBlack: bool, stats=None, piece_lists=None,
+                              incremental=None) -> Tuple[bool, float, int]:
+    """
+    Same as `make_a_move_played` with strictly legal moves. Game also ends right after a move that leaves
+    the opponent without legal moves, checkmate is rewarded like capturing the king.
+    `incremental` - optional incremental state (piece_moves, move_sums, masks, observation), moves are taken from it
+    and it is updated after the move
+    """
+    if stats is not None:
+        stats[STAT_MOVES] += 1
+    if incremental is None:
+        piece_moves = None
+    else:
+        piece_moves = incremental[0]
+    move, reward = generate_move_strict(board, x1, y1, x2, y2, isBlack, stats, piece_lists, piece_moves) # type: ignore
+    if move is None:
+        if stats is not None:
+            stats[STAT_NO_LEGAL_MOVES] += 1
+        return True, 0, -1
+
+    x1, y1, x2, y2 = move
+    target_piece = board[y2, x2]
+    reward += capture_reward(target_piece)
+    if stats is not None and target_piece != 0:
+        stats[STAT_CAPTURES] += 1
+
+    if piece_lists is not None:
+        move_piece(piece_lists, board[y1, x1], target_piece, y1 * 8 + x1, y2 * 8 + x2)
+
+    board[y2, x2] = board[y1, x1]
+    board[y1, x1] = 0
+
+    played = move_to_int(x1, y1, x2, y2)
+
+    if incremental is not None:
+        update_incremental(board, y1 * 8 + x1, y2 * 8 + x2, *incremental, stats, piece_lists)
+
+    if not has_strict_legal_move(board, not isBlack, piece_lists, piece_moves):
+        if is_in_check(board, not isBlack, piece_lists):
+            reward += KING_CAPTURE_REWARD
+        return True, reward, played
+
+    return False, reward, played
+
+@nb.njit(cache=True)
+def make_a_move_strict(board: np.ndarray, x1: int, y1: int, x2: int, y2: int, isBlack: bool, stats=None, piece_lists=None) -> Tuple[bool, float]:
+    """
+    Same as `make_a_move` with strictly legal moves, see `make_a_move_strict_played`
+    """
+    done, reward, _ = make_a_move_strict_played(board, x1, y1, x2, y2, isBlack, stats, piece_lists)
+    return done, reward
+
+@nb.njit(cache=True)
+def make_move_from_action_strict(board: np.ndarray, action: int, isBlack: bool, stats=None, piece_lists=None) -> Tuple[bool, float]:
+    x1, y1, x2, y2 = int_action_to_move(action)
+    return make_a_move_strict(board, x1, y1, x2, y2, isBlack, stats, piece_lists)
+
+@nb.njit(cache=True)
+def make_move_from_action_strict_played(board: np.ndarray, action: int, isBlack: bool, stats=None, piece_lists=None) -> Tuple[bool, float, int]:
+    x1, y1, x2, y2 = int_action_to_move(action)
+    return make_a_move_strict_played(board, x1, y1, x2, y2, isBlack, stats, piece_lists)
+
+@nb.njit(cache=True)
+def make_move_from_action_strict_incremental(board: np.ndarray, action: int, isBlack: bool, piece_moves: np.ndarray, move_sums: np.ndarray,
+                                             masks: np.ndarray, observation: np.ndarray, stats=None, piece_lists=None) -> Tuple[bool, float, int]:
+    """
+    Same as `make_move_from_action_strict_played`, also updates incremental state
+    """
+    x1, y1, x2, y2 = int_action_to_move(action)
+    return make_a_move_strict_played(board, x1, y1, x2, y2, isBlack, stats, piece_lists, (piece_moves, move_sums, masks, observation))
+
+# Captures. Pieces are valued by `capture_reward` of their kind (regardless of color),
+# exchanges are resolved with pseudo-legal attacks like `legal_moves`.
+
+@nb.njit(cache=True)
+def material_value(piece: int) -> int:
+    return capture_reward(abs(piece))
+
+@nb.njit(cache=True)
+def capture_moves(board: np.ndarray, isBlack: bool, piece_lists=None) -> np.ndarray:
+    """
+    Returns capturing actions of given color, most valuable victim first, ties by least valuable attacker
+    """
+    pieces = piece_squares(board, isBlack, piece_lists)
+    actions = np.empty(len(pieces) * 8, dtype=np.int64)
+    keys = np.empty(len(pieces) * 8, dtype=np.int64)
+    count = 0
+
+    for square in pieces:
+        y1, x1 = square // 8, square % 8
+        attacker = material_value(board[y1, x1])
+        legal = legal_moves(board, x1, y1)
+        for y2 in range(8):
+            for x2 in range(8):
+                # `legal_moves` only allows empty squares or opponent pieces
+                if legal[y2, x2] != 0 and board[y2, x2] != 0:
+                    if count == len(actions):
+                        actions = np.concatenate((actions, np.empty_like(actions)))
+                        keys = np.concatenate((keys, np.empty_like(keys)))
+                    actions[count] = move_to_int(x1, y1, x2, y2)
+                    keys[count] = attacker - material_value(board[y2, x2]) * 1024
+                    count += 1
+
+    order = np.argsort(keys[:count], kind='mergesort')
+    return actions[:count][order]
+
+@nb.njit(cache=True)
+def _least_valuable_attacker(board: np.ndarray, byBlack: bool, x: int, y: int) -> Tuple[int, int]:
+    best_x, best_y, best_value = -1, -1, 1 << 30
+    for square in piece_squares(board, byBlack):
+        ay, ax = square // 8, square % 8
+        value = material_value(board[ay, ax])
+        if value < best_value and _attacks_square(board, ax, ay, x, y):
+            best_x, best_y, best_value = ax, ay, value
+    return best_x, best_y
+
+@nb.njit(cache=True)
+def static_exchange(board: np.ndarray, action: int) -> int:
+    """
+    Static exchange evaluation of a capture: material won by the moving side once all captures on the target square
+    are played out, least valuable attacker first, every side can stop capturing when it would lose material
+    """
+    x1, y1, x2, y2 = int_action_to_move(action)
+    board = board.copy()
+
+    # gains[i] - material won by the side making capture i if the exchange stops after it
+    gains = np.zeros(33, dtype=np.int64)
+    victim = board[y2, x2]
+    gains[0] = material_value(victim)
+    depth = 0
+
+    isBlack = board[y1, x1] > 0
+    board[y2, x2] = board[y1, x1]
+    board[y1, x1] = 0
+
+    # captured king ends the game
+    while abs(victim) != KING and depth < len(gains) - 1:
+        isBlack = not isBlack
+        ax, ay = _least_valuable_attacker(board, isBlack, x2, y2)
+        if ax < 0:
+            break
+        depth += 1
+        victim = board[y2, x2]
+        gains[depth] = material_value(victim) - gains[depth - 1]
+        board[y2, x2] = board[ay, ax]
+        board[ay, ax] = 0
+
+    while depth > 0:
+        gains[depth - 1] = -max(-gains[depth - 1], gains[depth])
+        depth -= 1
+
+    return gains[0]
+
+@nb.njit(cache=True)
+def greedy_capture_action(board: np.ndarray, isBlack: bool, piece_lists=None) -> int:
+    """
+    Opponent policy: capture with the best static exchange if it doesn't lose material (king first), otherwise
+    random legal move (same as `random_legal_move`). Returns -1 if there are no legal moves.
+    Moves are pseudo-legal, with strict rules they may be replaced by the engine.
+    """
+    captures = capture_moves(board, isBlack, piece_lists)
+
+    best, best_gain = -1, 0
+    for action in captures:
+        x1, y1, x2, y2 = int_action_to_move(action)
+        if abs(board[y2, x2]) == KING:
+            return action
+        gain = static_exchange(board, action)
+        if gain >= 0 and (best < 0 or gain > best_gain):
+            best, best_gain = action, gain
+
+    if best >= 0:
+        return best
+
+    move = random_legal_move(board, isBlack, None, piece_lists)
+    if move is None:
+        return -1
+    x1, y1, x2, y2 = move
+    return move_to_int(x1, y1, x2, y2)
+
+@nb.njit('uint64(int8[:,:], boolean)', cache=True)
+def board_hash(board: np.ndarray, isBlack: bool) -> int:
+    """
+    Zobrist hash of the position (board and side to move)
+    """
+    h = np.uint64(0)
+    for y in range(8):
+        for x in range(8):
+            if board[y, x] != 0:
+                h ^= ZOBRIST_PIECE_KEYS[board[y, x] + 6, y * 8 + x]
+    if isBlack:
+        h ^= ZOBRIST_BLACK_KEY
+    return h
+
+@nb.njit('uint8[:](int8[:,:], boolean)', cache=True)
+def pack_snapshot(board: np.ndarray, isBlack: bool) -> np.ndarray:
+    """
+    packs board, side to move and hash into SNAPSHOT_SIZE bytes
+    """
+    snapshot = np.zeros(SNAPSHOT_SIZE, dtype=np.uint8)
+    for y in range(8):
+        for x in range(8):
+            snapshot[y * 8 + x] = np.uint8(board[y, x] & 0xFF)
+    snapshot[64] = 1 if isBlack else 0
+
+    h = board_hash(board, isBlack)
+    for i in range(8):
+        snapshot[65 + i] = np.uint8((h >> np.uint64(8 * i)) & np.uint64(0xFF))
+
+    return snapshot
+
+@nb.njit('Tuple((int8[:,:], boolean, uint64))(uint8[:])', cache=True)
+def unpack_snapshot(snapshot: np.ndarray) -> Tuple[np.ndarray, bool, int]:
+    """
+    unpacks snapshot made by `pack_snapshot`, returns board, side to move and stored hash
+    """
+    board = np.zeros((8, 8), dtype=np.int8)
+    for y in range(8):
+        for x in range(8):
+            board[y, x] = np.int8(snapshot[y * 8 + x])
+
+    h = np.uint64(0)
+    for i in range(8):
+        h |= np.uint64(snapshot[65 + i]) << np.uint64(8 * i)
+
+    return board, snapshot[64] != 0, h
+
+@nb.njit(cache=True)
+def seed(value: int):
+    """
+    seeds random generator used by jitted functions (it is separate from numpy's global generator)
+    """
+    np.random.seed(value)
 
 def fen_to_svg(fen: str) -> str:
     return chess.svg.board(chess.Board(fen), size=500)
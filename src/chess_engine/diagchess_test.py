@@ -15,6 +15,29 @@ def array_equal_print(arr1: np.ndarray, arr2: np.ndarray) -> bool:
         print(arr2)
         return False
 
+def random_play(steps: int, seed_value: int, play_step, new_game=generate_start_board):
+    """
+    Plays `steps` random actions, a game from `new_game()` starts whenever the previous one ends.
+    `play_step(game, isBlack, action)` checks the position, plays `action` and returns done.
+    Actions and replacements of illegal moves (engine generator is seeded too) repeat between runs.
+    """
+    rng = np.random.default_rng(seed_value)
+    seed(seed_value)
+    done = True
+    for _ in range(steps):
+        if done:
+            game, isBlack = new_game(), False
+        done = play_step(game, isBlack, int(rng.integers(0, 4096)))
+        isBlack = not isBlack
+
+def new_game_with_lists():
+    board = generate_start_board()
+    return board, build_piece_lists(board)
+
+def new_incremental_game():
+    board = generate_start_board()
+    return board, build_piece_lists(board), incremental_state(board)
+
 
 class TestLegalMoves(unittest.TestCase):
     def test_pawn_legal_moves(self):
@@ -427,3 +450,302 @@ class TestMoveChoosing(unittest.TestCase):
         # try moving king
         _, reward = generate_move(board, 0, 7, 0, 6, False)
         self.assertEqual(reward, ILLEGAL_MOVE_PENALTY_2)
+
+
+class TestRules(unittest.TestCase):
+    """
+    Rules the backends are checked against: kings move like every other piece
+    and the random fallback moves a piece of the side to move.
+    """
+    def test_king_moves(self):
+        board = np.zeros((8, 8), dtype=np.int8)
+        board[5,5] = -piece("KING")
+        board[0,0] = piece("KING")
+
+        # kings are dispatched by legal_moves like every other piece
+        self.assertEqual(np.count_nonzero(legal_moves(board, 5, 5)), 8)
+        self.assertEqual(generate_move(board, 5, 5, 6, 4, False), ((5, 5, 6, 4), LEGAL_MOVE_REWARD))
+
+    def test_random_legal_move_fallback(self):
+        board = np.zeros((8, 8), dtype=np.int8)
+        board[2,6] = -piece("KNIGHT")
+        board[0,0] = piece("KING")
+
+        for isBlack, (x, y) in ((False, (6, 2)), (True, (0, 0))):
+            for _ in range(10):
+                # moves a piece of the side to move, coordinates are (x, y)
+                x1, y1, x2, y2 = random_legal_move(board, isBlack)
+                self.assertEqual((x1, y1), (x, y))
+                self.assertNotEqual(legal_moves(board, x1, y1)[y2, x2], 0)
+
+
+class TestStrictLegalMoves(unittest.TestCase):
+    def test_pinned_piece(self):
+        board = np.zeros((8, 8), dtype=np.int8)
+        board[7, 4] = piece("king")
+        board[5, 4] = piece("rook")
+        board[0, 4] = piece("ROOK")
+        board[0, 0] = piece("KING")
+
+        moves = strict_legal_moves(board, 4, 5)
+
+        # pinned rook can only move along the file
+        self.assertTrue(np.all(moves[:, :4] == 0))
+        self.assertTrue(np.all(moves[:, 5:] == 0))
+        self.assertEqual(moves[0, 4], piece("rook"))
+        self.assertEqual(moves[6, 4], piece("rook"))
+
+    def test_check_must_be_answered(self):
+        board = np.zeros((8, 8), dtype=np.int8)
+        board[7, 4] = piece("king")
+        board[5, 0] = piece("rook")
+        board[4, 4] = piece("QUEEN")
+        board[0, 0] = piece("KING")
+
+        self.assertTrue(is_in_check(board, False))
+
+        mask = get_strict_legal_moves_mask(board, False)
+
+        # rook can only block on the file of the king
+        self.assertEqual(mask[move_to_int(0, 5, 4, 5)], 1)
+        self.assertEqual(mask[move_to_int(0, 5, 1, 5)], 0)
+        # king can't stay on the file
+        self.assertEqual(mask[move_to_int(4, 7, 4, 6)], 0)
+        self.assertEqual(mask[move_to_int(4, 7, 3, 7)], 1)
+
+    def test_checkmate_ends_game(self):
+        board = np.zeros((8, 8), dtype=np.int8)
+        board[0, 0] = piece("KING")
+        board[1, 7] = piece("rook")
+        board[5, 6] = piece("rook")
+        board[7, 7] = piece("king")
+
+        done, reward = make_move_from_action_strict(board, move_to_int(6, 5, 6, 0), False)
+
+        self.assertTrue(done)
+        self.assertEqual(reward, LEGAL_MOVE_REWARD + KING_CAPTURE_REWARD)
+
+    def test_strict_moves_keep_king_safe(self):
+        def play_step(board, isBlack, action):
+            for y in range(8):
+                for x in range(8):
+                    if board[y, x] == 0 or (board[y, x] > 0) != isBlack:
+                        continue
+                    moves = legal_moves(board, x, y)
+                    strict = strict_legal_moves(board, x, y)
+                    for y2, x2 in np.argwhere(moves != 0):
+                        after = board.copy()
+                        after[y2, x2] = after[y, x]
+                        after[y, x] = 0
+                        self.assertEqual(strict[y2, x2] != 0, not is_in_check(after, isBlack), (to_fen(board), x, y, x2, y2))
+
+            done, _ = make_move_from_action_strict(board, action, isBlack)
+            return done
+
+        random_play(200, 0, play_step)
+
+
+class TestPieceLists(unittest.TestCase):
+    def assert_lists_match(self, piece_lists, board):
+        for color, isBlack in ((0, False), (1, True)):
+            listed = np.sort(piece_lists[color, :piece_lists[color, PIECE_COUNT]])
+            self.assertTrue(np.array_equal(listed, np.flatnonzero(((board > 0) == isBlack) & (board != 0))))
+
+    def test_lists_follow_moves(self):
+        for strict in (False, True):
+            def play_step(game, isBlack, action):
+                board, piece_lists = game
+                self.assert_lists_match(piece_lists, board)
+
+                if strict:
+                    mask = get_strict_legal_moves_mask(board, isBlack, None, piece_lists)
+                    self.assertTrue(np.array_equal(mask, get_strict_legal_moves_mask(board, isBlack)))
+                    done, _ = make_move_from_action_strict(board, action, isBlack, None, piece_lists)
+                else:
+                    observation, mask = board_to_observation_and_mask(board, isBlack, None, piece_lists)
+                    expected_observation, expected_mask = board_to_observation_and_mask(board, isBlack)
+                    self.assertTrue(np.array_equal(observation, expected_observation))
+                    self.assertTrue(np.array_equal(mask, expected_mask))
+                    self.assertTrue(np.array_equal(all_legal_moves(board, isBlack, piece_lists), all_legal_moves(board, isBlack)))
+                    done, _ = make_move_from_action(board, action, isBlack, None, piece_lists)
+                return done
+
+            random_play(300, 1, play_step, new_game_with_lists)
+
+    def test_lists_follow_captures(self):
+        board = np.zeros((8, 8), dtype=np.int8)
+        board[7, 7] = piece("king")
+        board[0, 0] = piece("KING")
+        board[4, 4] = piece("pawn")
+        board[3, 5] = piece("QUEEN")
+        board[3, 1] = piece("ROOK")
+        piece_lists = build_piece_lists(board)
+
+        # pawn takes the queen, black list loses the captured square
+        make_move_from_action(board, move_to_int(4, 4, 5, 3), False, None, piece_lists)
+        self.assert_lists_match(piece_lists, board)
+        # rook takes the pawn on the same square again
+        make_move_from_action(board, move_to_int(1, 3, 5, 3), True, None, piece_lists)
+        self.assert_lists_match(piece_lists, board)
+
+
+class TestCaptures(unittest.TestCase):
+    def test_capture_moves(self):
+        def play_step(board, isBlack, action):
+            captures = capture_moves(board, isBlack)
+            mask = get_legal_moves_mask(board, isBlack)
+            expected = [action for action in np.flatnonzero(mask) if board[action % 8, action // 8 % 8] != 0]
+            self.assertEqual(sorted(captures), sorted(expected))
+
+            victims = [material_value(board[action % 8, action // 8 % 8]) for action in captures]
+            self.assertEqual(victims, sorted(victims, reverse=True))
+
+            done, _ = make_move_from_action(board, action, isBlack)
+            return done
+
+        random_play(200, 2, play_step)
+
+    def test_capture_order(self):
+        board = np.zeros((8, 8), dtype=np.int8)
+        board[7, 7] = piece("king")
+        board[0, 0] = piece("KING")
+        board[4, 4] = piece("pawn")
+        board[3, 5] = piece("QUEEN")
+        board[3, 1] = piece("rook")
+        board[3, 0] = piece("KNIGHT")
+
+        # queen before knight, queen taken by the pawn before the rook
+        expected = [move_to_int(4, 4, 5, 3), move_to_int(1, 3, 5, 3), move_to_int(1, 3, 0, 3)]
+        self.assertEqual(list(capture_moves(board, False)), expected)
+        self.assertEqual(list(capture_moves(board, False, build_piece_lists(board))), expected)
+
+    def test_static_exchange(self):
+        board = np.zeros((8, 8), dtype=np.int8)
+        board[0, 0] = piece("rook")
+        board[4, 0] = piece("PAWN")
+        board[6, 1] = piece("KNIGHT")
+        board[0, 5] = piece("QUEEN")
+
+        # pawn is defended by the knight
+        self.assertEqual(static_exchange(board, move_to_int(0, 0, 0, 4)), PAWN_CAPTURE_REWARD - ROOK_CAPTURE_REWARD)
+        self.assertEqual(static_exchange(board, move_to_int(0, 0, 5, 0)), QUEEN_CAPTURE_REWARD)
+        self.assertEqual(greedy_capture_action(board, False), move_to_int(0, 0, 5, 0))
+
+        # defended queen is still worth a rook
+        board[2, 6] = piece("KNIGHT")
+        self.assertEqual(static_exchange(board, move_to_int(0, 0, 5, 0)), QUEEN_CAPTURE_REWARD - ROOK_CAPTURE_REWARD)
+
+        # nothing to win, random legal move
+        board[0, 5] = 0
+        action = greedy_capture_action(board, False)
+        self.assertNotEqual(action, move_to_int(0, 0, 0, 4))
+        self.assertEqual(get_legal_moves_mask(board, False)[action], 1)
+
+
+class TestIncrementalState(unittest.TestCase):
+    def assert_state_matches(self, board, isBlack, state):
+        piece_moves, move_sums, masks, observation = state
+        expected_observation, expected_mask = board_to_observation_and_mask(board, isBlack)
+        self.assertTrue(np.array_equal(observation, expected_observation), to_fen(board))
+        self.assertTrue(np.array_equal(masks[int(isBlack)], expected_mask), to_fen(board))
+        self.assertTrue(np.array_equal(masks[int(not isBlack)], get_legal_moves_mask(board, not isBlack)))
+
+    def assert_move_matches(self, board, isBlack, action):
+        """
+        plays `action` on a copy of `board` with incremental state, checks state and piece lists after it
+        """
+        board = board.copy()
+        piece_lists = build_piece_lists(board)
+        state = incremental_state(board)
+        _, _, played = make_move_from_action_incremental(board, action, isBlack, *state, None, piece_lists)
+        self.assertEqual(played, action)
+
+        self.assert_state_matches(board, not isBlack, state)
+        expected_lists = build_piece_lists(board)
+        for color in (0, 1):
+            # same squares, order of the lists can differ
+            self.assertEqual(sorted(piece_lists[color, :piece_lists[color, PIECE_COUNT]]),
+                             sorted(expected_lists[color, :expected_lists[color, PIECE_COUNT]]))
+        strict = get_strict_legal_moves_mask(board, not isBlack)
+        self.assertTrue(np.array_equal(get_strict_legal_moves_mask(board, not isBlack, None, piece_lists, state), strict), to_fen(board))
+        return board
+
+    def test_matches_full_recompute(self):
+        def play_step(game, isBlack, action):
+            board, piece_lists, state = game
+            self.assert_state_matches(board, isBlack, state)
+            done, _, _ = make_move_from_action_incremental(board, action, isBlack, *state, None, piece_lists)
+            return done
+
+        random_play(400, 3, play_step, new_incremental_game)
+
+    def test_strict_matches_full_recompute(self):
+        def play_step(game, isBlack, action):
+            board, piece_lists, state = game
+            observation, mask = board_to_observation_and_strict_mask(board, isBlack, None, piece_lists)
+            self.assertTrue(np.array_equal(observation, board_to_observation(board)), to_fen(board))
+            self.assertTrue(np.array_equal(mask, get_strict_legal_moves_mask(board, isBlack)), to_fen(board))
+            self.assertTrue(np.array_equal(get_strict_legal_moves_mask(board, isBlack, None, piece_lists, state), mask), to_fen(board))
+
+            # checks are found by looking out from the king, same as the full attack map
+            for color in (True, False):
+                king = np.argwhere(board == (KING if color else -KING))
+                if len(king):
+                    self.assertEqual(is_in_check(board, color, piece_lists), attack_map(board, not color)[king[0, 0], king[0, 1]])
+
+            # same piece order, random replacements of illegal moves shuffle it
+            expected = board.copy()
+            seed(action)
+            expected_result = make_move_from_action_strict_played(expected, action, isBlack, None, piece_lists.copy())
+            seed(action)
+            result = make_move_from_action_strict_incremental(board, action, isBlack, *state, None, piece_lists)
+            self.assertEqual(result, expected_result)
+            self.assertTrue(np.array_equal(board, expected))
+            # moves are checked by playing them, they agree with the mask filtered by `king_safety`
+            self.assertEqual(result[2] < 0, not mask.any())
+            if result[2] >= 0:
+                self.assertEqual(mask[result[2]], 1)
+            return result[0]
+
+        random_play(400, 4, play_step, new_incremental_game)
+
+    def test_pin(self):
+        board = np.zeros((8, 8), dtype=np.int8)
+        board[7, 0] = piece("king")
+        board[5, 2] = piece("knight")
+        board[3, 4] = piece("BISHOP")
+        board[0, 7] = piece("KING")
+
+        # knight is pinned on the diagonal of the king
+        state = incremental_state(board)
+        mask = get_strict_legal_moves_mask(board, False, None, build_piece_lists(board), state)
+        self.assertTrue(np.array_equal(mask, get_strict_legal_moves_mask(board, False)))
+        self.assertFalse(mask[move_to_int(2, 5, 0, 4)])
+        self.assertTrue(get_legal_moves_mask(board, False)[move_to_int(2, 5, 0, 4)])
+
+        # pseudo-legal rules let it go, bishop now sees the king
+        after = self.assert_move_matches(board, False, move_to_int(2, 5, 0, 4))
+        self.assertTrue(is_in_check(after, False))
+
+    def test_discovered_attack(self):
+        board = np.zeros((8, 8), dtype=np.int8)
+        board[7, 7] = piece("king")
+        board[4, 0] = piece("rook")
+        board[4, 2] = piece("knight")
+        board[4, 6] = piece("QUEEN")
+        board[0, 0] = piece("KING")
+
+        # knight uncovers the rook, rook moves along the row are refreshed
+        after = self.assert_move_matches(board, False, move_to_int(2, 4, 3, 2))
+        self.assertTrue(get_legal_moves_mask(after, False)[move_to_int(0, 4, 6, 4)])
+
+    def test_last_row_pawn(self):
+        board = np.zeros((8, 8), dtype=np.int8)
+        board[7, 0] = piece("king")
+        board[1, 7] = piece("pawn")
+        board[3, 3] = piece("KING")
+
+        # there is no promotion, pawn on the last row stays a pawn without moves
+        after = self.assert_move_matches(board, False, move_to_int(7, 1, 7, 0))
+        self.assertEqual(after[0, 7], piece("pawn"))
+        self.assertFalse(legal_moves(after, 7, 0).any())
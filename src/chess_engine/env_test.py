@@ -3,7 +3,9 @@ import random
 import unittest
 
 import numpy as np
-from . import DiagonalChess, action
+from . import DiagonalChess, action, internal
+from .constants import LEGAL_MOVE_REWARD
+from .diagchess_test import random_play
 
 
 
@@ -24,6 +26,100 @@ class DiagonalChessTests(unittest.TestCase):
         
         self.assertTrue(True)
             
+    def test_step_with_mask(self):
+        # observation and mask shall match separate observation and mask calls
+        env = DiagonalChess()
+        observation, mask = env.reset_with_mask()
+
+        self.assertTrue(np.array_equal(observation, internal.board_to_observation(env.board)))
+        self.assertTrue(np.array_equal(mask, internal.get_legal_moves_mask(env.board, env.isBlack)))
+
+        for _ in range(100):
+            random_action = random.randrange(4096)
+            observation, mask, _, done = env.step_with_mask(random_action)
+
+            self.assertEqual(mask.shape, (4096,))
+            self.assertTrue(np.array_equal(observation, internal.board_to_observation(env.board)))
+            self.assertTrue(np.array_equal(mask, internal.get_legal_moves_mask(env.board, env.isBlack)))
+
+            if done:
+                env.reset()
+
+    def test_snapshot_restore(self):
+        env = DiagonalChess()
+        for _ in range(10):
+            env.step(random.randrange(4096))
+
+        snapshot = env.snapshot()
+        board, isBlack = env.board.copy(), env.isBlack
+
+        for _ in range(10):
+            env.step(random.randrange(4096))
+
+        env.restore(snapshot.tobytes())
+        self.assertTrue(np.array_equal(env.board, board))
+        self.assertEqual(env.isBlack, isBlack)
+
+        # corrupted snapshot shall be rejected
+        snapshot[0] ^= 1
+        self.assertRaises(ValueError, env.restore, snapshot)
+
+    def test_clone_many(self):
+        env = DiagonalChess()
+        env.step(random.randrange(4096))
+
+        clones = env.clone_many(4)
+        self.assertEqual(len(clones), 4)
+
+        for clone in clones:
+            self.assertEqual(clone.hash(), env.hash())
+
+        clones[0].step(random.randrange(4096))
+
+        self.assertNotEqual(clones[0].hash(), env.hash())
+        self.assertEqual(clones[1].hash(), env.hash())
+
+    def test_stats(self):
+        self.assertEqual(DiagonalChess().stats(), {})
+
+        env = DiagonalChess(collect_stats=True)
+        env.reset_stats()
+        env.reset_with_mask()
+
+        steps = 20
+        for _ in range(steps):
+            _, _, _, done = env.step_with_mask(random.randrange(4096))
+            if done:
+                break
+
+        stats = env.stats()
+        outcomes = stats['legal'] + stats['wrong_color'] + stats['illegal_1'] + stats['illegal_2']
+
+        self.assertGreater(stats['moves'], 0)
+        self.assertEqual(stats['moves'], outcomes)
+        self.assertEqual(stats['random_fallbacks'], stats['wrong_color'] + stats['illegal_2'])
+        self.assertEqual(stats['masks'], stats['moves'] + 1)
+        self.assertGreater(stats['legal_moves_calls'], 0)
+
+        env.reset_stats()
+        self.assertTrue(all(value == 0 for value in env.stats().values()))
+
+        # observation expands moves of every piece on the board
+        env.reset()
+        self.assertEqual(env.stats()['legal_moves_calls'], np.count_nonzero(env.board))
+
+    def test_strict_rules(self):
+        env = DiagonalChess(strict=True)
+        _, mask = env.reset_with_mask()
+
+        for _ in range(100):
+            legal = np.flatnonzero(mask)
+            _, mask, reward, done = env.step_with_mask(int(np.random.choice(legal)))
+            if done:
+                break
+            self.assertGreaterEqual(reward, LEGAL_MOVE_REWARD)
+            self.assertTrue(np.array_equal(mask, internal.get_strict_legal_moves_mask(env.board, env.isBlack)))
+
     def test_move_to_action(self):
         self.assertEqual(action('a1a1'), 0+0*8+0*64+0*512)
         self.assertEqual(action('a1a2'), 0+0*8+0*64+1*512)
@@ -38,5 +134,65 @@ class DiagonalChessTests(unittest.TestCase):
         self.assertEqual(action('a1c1'), 0+0*8+2*64+0*512)
         self.assertEqual(action('a1c2'), 0+0*8+2*64+1*512)
 
-    
+    def test_incremental(self):
+        env = DiagonalChess(incremental=True, collect_stats=True)
+
+        def assert_matches(observation, mask):
+            expected_observation, expected_mask = internal.board_to_observation_and_mask(env.board, env.isBlack)
+            self.assertTrue(np.array_equal(observation, expected_observation))
+            self.assertTrue(np.array_equal(mask, expected_mask))
+
+        def new_game():
+            assert_matches(*env.reset_with_mask())
+
+        def play_step(_, isBlack, action):
+            observation, mask, _, done = env.step_with_mask(action)
+            if not done:
+                assert_matches(observation, mask)
+            return done
+
+        random_play(200, 5, play_step, new_game)
+
+        stats = env.stats()
+        self.assertGreater(stats['legal_moves_calls'], 0)
+
+    def test_strict_incremental(self):
+        env = DiagonalChess(strict=True, incremental=True)
+        reference = DiagonalChess(strict=True)
+
+        def new_game():
+            env.reset_with_mask()
+            reference.reset_with_mask()
+
+        def play_step(_, isBlack, action):
+            # same seed, both environments pick the same replacement for illegal moves
+            internal.seed(action)
+            observation, mask, reward, done = env.step_with_mask(action)
+            internal.seed(action)
+            expected_observation, expected_mask, expected_reward, expected_done = reference.step_with_mask(action)
+
+            self.assertTrue(np.array_equal(env.board, reference.board))
+            self.assertTrue(np.array_equal(observation, expected_observation))
+            self.assertTrue(np.array_equal(mask, expected_mask))
+            self.assertEqual((reward, done), (expected_reward, expected_done))
+            return done
+
+        random_play(200, 6, play_step, new_game)
+
+    def test_history(self):
+        for incremental in (False, True):
+            env = DiagonalChess(history=3, incremental=incremental)
+            observation, _ = env.reset_with_mask()
+            self.assertEqual(observation.shape, (8, 8, 24))
+            self.assertTrue(np.shares_memory(observation, env._history.buffer))
+            self.assertFalse(observation[:, :, :16].any())
+
+            frames = [internal.board_to_observation(env.board)]
+            for _ in range(50):
+                observation, _, _, done = env.step_with_mask(random.randrange(4096))
+                if done:
+                    break
+                frames.append(internal.board_to_observation(env.board))
 
+                expected = np.concatenate([np.zeros((8, 8, 8), dtype=np.float32)] * 2 + frames, axis=2)[:, :, -24:]
+                self.assertTrue(np.array_equal(observation, expected))
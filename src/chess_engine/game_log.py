@@ -0,0 +1,210 @@
+"""
+Compact append-only log of played games.
+
+Moves are stored as ordinals: index of the played action among legal actions of the position
+(ascending action ids, pseudo-legal or strict depending on the game), there is no promotion so it always fits in one byte.
+Games are decoded by replaying them inside numba kernels, so any position of any game can be rebuilt in batches.
+
+Two files share a path prefix:
+* `<path>.games` - games one after another: header byte, start board (64 bytes, only if it is not the standard one)
+  and one byte per move
+* `<path>.index` - (offset, moves) int64 pair per game
+
+```
+log = GameLog('games/run')
+env = DiagonalChess(record=True)
+...
+log.append(*env.game_record(), strict=env.strict)
+boards, is_black = log.replay(np.arange(len(log)), plies=10)
+```
+"""
+import os
+from typing import Optional, Tuple
+import numpy as np
+import numba as nb
+
+from .diagchess import (generate_start_board, get_legal_moves_mask, get_strict_legal_moves_mask, make_move_from_action,
+                        make_move_from_action_strict)
+
+# header bits
+HEADER_BOARD = 1
+HEADER_BLACK = 2
+HEADER_STRICT = 4
+
+BOARD_BYTES = 64
+
+
+@nb.njit(cache=True)
+def game_start(data: np.ndarray, offset: int) -> Tuple[np.ndarray, bool, bool, int]:
+    """
+    Decodes header of the game at `offset`, returns start board, side to move, strict rules and offset of the first move
+    """
+    header = data[offset]
+    offset += 1
+
+    if header & HEADER_BOARD:
+        board = np.empty((8, 8), dtype=np.int8)
+        for i in range(BOARD_BYTES):
+            board[i // 8, i % 8] = np.int8(data[offset + i])
+        offset += BOARD_BYTES
+    else:
+        board = generate_start_board()
+
+    return board, header & HEADER_BLACK != 0, header & HEADER_STRICT != 0, offset
+
+@nb.njit(cache=True)
+def legal_actions(board: np.ndarray, isBlack: bool, strict: bool) -> np.ndarray:
+    """
+    Ascending legal actions, move ordinals index into it
+    """
+    if strict:
+        return np.flatnonzero(get_strict_legal_moves_mask(board, isBlack))
+    return np.flatnonzero(get_legal_moves_mask(board, isBlack))
+
+@nb.njit(cache=True)
+def play(board: np.ndarray, action: int, isBlack: bool, strict: bool) -> bool:
+    if strict:
+        done, _ = make_move_from_action_strict(board, action, isBlack)
+    else:
+        done, _ = make_move_from_action(board, action, isBlack)
+    return done
+
+@nb.njit(cache=True)
+def encode_moves(board: np.ndarray, isBlack: bool, strict: bool, actions: np.ndarray, ordinals: np.ndarray) -> int:
+    """
+    Replays `actions` on `board` (in place) and writes their ordinals.
+    Returns number of encoded moves, less than `len(actions)` if a move is not legal (or comes after end of the game)
+    """
+    for i in range(len(actions)):
+        legal = legal_actions(board, isBlack, strict)
+        ordinal = np.searchsorted(legal, actions[i])
+        if ordinal >= len(legal) or legal[ordinal] != actions[i] or ordinal > 255:
+            return i
+        ordinals[i] = ordinal
+
+        done = play(board, actions[i], isBlack, strict)
+        isBlack = not isBlack
+        if done and i + 1 < len(actions):
+            return i + 1
+    return len(actions)
+
+@nb.njit(cache=True)
+def _replay_game(data: np.ndarray, offset: int, moves: int, plies: int, actions: np.ndarray) -> Tuple[np.ndarray, bool]:
+    """
+    Replays first `plies` moves of the game at `offset`, fills `actions` with played actions if it is not empty
+    """
+    board, isBlack, strict, offset = game_start(data, offset)
+
+    for ply in range(min(plies, moves)):
+        action = legal_actions(board, isBlack, strict)[data[offset + ply]]
+        if len(actions) > 0:
+            actions[ply] = action
+        play(board, action, isBlack, strict)
+        isBlack = not isBlack
+
+    return board, isBlack
+
+@nb.njit(parallel=True, cache=True)
+def replay_batch(data: np.ndarray, offsets: np.ndarray, moves: np.ndarray, plies: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Positions after `plies[i]` moves of games starting at `offsets[i]` (whole game if it is shorter),
+    returns boards (N, 8, 8) and side to move (N,)
+    """
+    n = len(offsets)
+    boards = np.empty((n, 8, 8), dtype=np.int8)
+    is_black = np.empty(n, dtype=np.bool_)
+    no_actions = np.empty(0, dtype=np.int64)
+
+    for i in nb.prange(n):
+        board, isBlack = _replay_game(data, offsets[i], moves[i], plies[i], no_actions)
+        boards[i] = board
+        is_black[i] = isBlack
+
+    return boards, is_black
+
+
+class GameLog:
+    """
+    Append-only game log stored in `<path>.games` and `<path>.index`, see module docs
+    """
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.data_path = path + '.games'
+        self.index_path = path + '.index'
+
+        for file_path in (self.data_path, self.index_path):
+            open(file_path, 'ab').close()
+
+    def __len__(self) -> int:
+        return os.path.getsize(self.index_path) // 16
+
+    def append(self, actions: np.ndarray, board: Optional[np.ndarray] = None, isBlack: bool = False, strict: bool = False) -> int:
+        """
+        Appends game of `actions` played from `board` (standard start board if None) with `isBlack` moving first.
+        Actions have to be legal (as returned by `DiagonalChess.game_record`). Returns id of the game.
+        """
+        start_board = generate_start_board() if board is None else np.array(board, dtype=np.int8)
+        actions = np.asarray(actions, dtype=np.int64)
+
+        ordinals = np.empty(len(actions), dtype=np.uint8)
+        encoded = encode_moves(start_board.copy(), bool(isBlack), bool(strict), actions, ordinals)
+        if encoded != len(actions):
+            raise ValueError(f"move {encoded} ({actions[encoded]}) is not legal")
+
+        header = (HEADER_BLACK if isBlack else 0) | (HEADER_STRICT if strict else 0)
+        chunks = []
+        if not np.array_equal(start_board, generate_start_board()):
+            header |= HEADER_BOARD
+            chunks.append(start_board.tobytes())
+
+        with open(self.data_path, 'ab') as f:
+            offset = f.tell()
+            f.write(bytes([header]))
+            for chunk in chunks:
+                f.write(chunk)
+            f.write(ordinals.tobytes())
+
+        with open(self.index_path, 'ab') as f:
+            f.write(np.array([offset, len(actions)], dtype=np.int64).tobytes())
+
+        return len(self) - 1
+
+    def index(self) -> np.ndarray:
+        """
+        (N, 2) int64 - offset and number of moves of every game
+        """
+        return np.fromfile(self.index_path, dtype=np.int64).reshape(-1, 2)
+
+    def data(self) -> np.ndarray:
+        """
+        Memory mapped contents of `.games` file, see `game_start` for decoding
+        """
+        if os.path.getsize(self.data_path) == 0:
+            return np.empty(0, dtype=np.uint8)
+        return np.asarray(np.memmap(self.data_path, dtype=np.uint8, mode='r'))
+
+    def moves(self, game: int) -> Tuple[np.ndarray, np.ndarray, bool]:
+        """
+        Decodes game, returns actions, starting board and side that moved first (same as `DiagonalChess.game_record`)
+        """
+        offset, moves = self.index()[game]
+        data = self.data()
+
+        actions = np.empty(moves, dtype=np.int64)
+        _replay_game(data, offset, moves, moves, actions)
+        board, isBlack = _replay_game(data, offset, moves, 0, actions[:0])
+
+        return actions.astype(np.int32), board, isBlack
+
+    def replay(self, games: np.ndarray, plies: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rebuilds positions after `plies` moves of `games` (final positions if None), returns boards (N, 8, 8) and side to move (N,)
+        """
+        games = np.asarray(games, dtype=np.int64)
+        index = self.index()[games]
+        plies = index[:, 1] if plies is None else np.broadcast_to(np.asarray(plies, dtype=np.int64), games.shape)
+
+        return replay_batch(self.data(), np.ascontiguousarray(index[:, 0]), np.ascontiguousarray(index[:, 1]), np.array(plies))
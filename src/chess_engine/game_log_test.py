@@ -0,0 +1,86 @@
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+from . import DiagonalChess, internal
+from .game_log import GameLog
+
+
+class GameLogTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log = GameLog(os.path.join(self.directory.name, 'games'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def play(self, env, steps):
+        positions = []
+        for _ in range(steps):
+            _, _, done = env.step(random.randrange(4096))
+            positions.append((env.board.copy(), env.isBlack))
+            if done:
+                break
+        return positions
+
+    def test_round_trip(self):
+        for strict in (False, True):
+            env = DiagonalChess(strict=strict, record=True)
+            positions = self.play(env, 60)
+
+            actions, board, isBlack = env.game_record()
+            self.assertEqual(len(actions), len(positions))
+
+            game = self.log.append(actions, board, isBlack, strict=strict)
+            decoded, decoded_board, decoded_black = self.log.moves(game)
+            self.assertTrue(np.array_equal(decoded, actions))
+            self.assertTrue(np.array_equal(decoded_board, board))
+            self.assertEqual(decoded_black, isBlack)
+
+            boards, is_black = self.log.replay(np.full(len(positions), game), np.arange(1, len(positions) + 1))
+            for i, (position, side) in enumerate(positions):
+                self.assertTrue(np.array_equal(boards[i], position))
+                self.assertEqual(is_black[i], side)
+
+        # one byte header and one byte per move for standard start
+        self.assertEqual(os.path.getsize(self.log.data_path), sum(1 + n for n in self.log.index()[:, 1]))
+
+    def test_custom_start(self):
+        env = DiagonalChess(record=True)
+        self.play(env, 10)
+
+        # continue from position reached, black could be to move
+        env.restore(env.snapshot())
+        positions = self.play(env, 10)
+
+        game = self.log.append(*env.game_record())
+        boards, is_black = self.log.replay([game])
+        self.assertTrue(np.array_equal(boards[0], positions[-1][0]))
+        self.assertEqual(is_black[0], positions[-1][1])
+
+    def test_moves_after_end_are_not_recorded(self):
+        env = DiagonalChess(record=True)
+        board = np.zeros((8, 8), dtype=np.int8)
+        board[0, 0] = 6
+        board[7, 7] = 5
+        env.restore(internal.pack_snapshot(board, False))
+
+        # white has no pieces, its move ends the game and black still answers
+        _, _, done = env.step_board_obs(0)
+        self.assertTrue(done)
+        env.step_with_mask(int(np.flatnonzero(internal.get_legal_moves_mask(env.board, True))[0]))
+
+        actions, start_board, isBlack = env.game_record()
+        self.assertEqual(len(actions), 0)
+        self.assertEqual(self.log.append(actions, start_board, isBlack), 0)
+
+    def test_illegal_move(self):
+        self.assertRaises(ValueError, self.log.append, [0])
+        self.assertEqual(len(self.log), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
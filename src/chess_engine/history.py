@@ -0,0 +1,47 @@
+"""
+Ring buffer of the last `k` observation frames, stacked along the plane axis without copying.
+
+Every frame is written twice, at slot `i` and `i + k` of a buffer holding `2 * k` frames, so the last `k` frames
+are always one contiguous run of slots and the stack (8, 8, planes * k) is a reshaped view into the buffer.
+Frames are ordered oldest first, planes of the newest frame are the last `planes` ones.
+"""
+from typing import Tuple
+import numpy as np
+
+
+class FrameHistory:
+    def __init__(self, k: int, frame_shape: Tuple[int, int, int] = (8, 8, 8), dtype=np.float32):
+        if k < 1:
+            raise ValueError(f"history length should be at least 1, got {k}")
+
+        self.k = k
+        height, width, self.planes = frame_shape
+        self.buffer = np.zeros((height, width, 2 * k, self.planes), dtype=dtype)
+        self.position = 0
+
+    def clear(self):
+        """
+        Forgets all frames, missing history is zeros
+        """
+        self.buffer[:] = 0
+        self.position = 0
+
+    def push(self, frame: np.ndarray):
+        slot = self.position % self.k
+        self.buffer[:, :, slot] = frame
+        self.buffer[:, :, slot + self.k] = frame
+        self.position += 1
+
+    def stacked(self) -> np.ndarray:
+        """
+        View (8, 8, planes * k) of the last `k` frames, it changes with the next `push`
+        """
+        start = self.position % self.k
+        height, width = self.buffer.shape[:2]
+        return self.buffer[:, :, start:start + self.k].reshape(height, width, self.k * self.planes)
+
+    def copy(self) -> 'FrameHistory':
+        clone = FrameHistory.__new__(FrameHistory)
+        clone.k, clone.planes, clone.position = self.k, self.planes, self.position
+        clone.buffer = self.buffer.copy()
+        return clone
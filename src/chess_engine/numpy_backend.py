@@ -0,0 +1,522 @@
+"""
+Pure numpy implementation of the engine, used when numba is not available (or DIAGCHESS_BACKEND=numpy).
+
+Works on whole batches of boards (N, 8, 8) at once. Move generation gathers squares along precomputed
+rays for every square of every board and scatters reachable targets into (N, 64, 64) move tables.
+Single board functions have the same names and results as the ones in `diagchess.py`,
+only random fallbacks (illegal actions) use numpy's generator so they are not bit identical.
+
+Squares are indexed as `y * 8 + x` (row major, same as `board.reshape(-1)`).
+"""
+from typing import Optional, Tuple
+import numpy as np
+
+from .constants import (WRONG_PIECE_COLOR_PENALTY, ILLEGAL_MOVE_PENALTY_1, ILLEGAL_MOVE_PENALTY_2, LEGAL_MOVE_REWARD,
+                        ZOBRIST_PIECE_KEYS, ZOBRIST_BLACK_KEY, SNAPSHOT_SIZE, CAPTURE_REWARDS, STAT_MOVES, STAT_LEGAL,
+                        STAT_WRONG_COLOR, STAT_ILLEGAL_1, STAT_ILLEGAL_2, STAT_RANDOM_FALLBACKS, STAT_NO_LEGAL_MOVES,
+                        STAT_CAPTURES, STAT_LEGAL_MOVES_CALLS, STAT_MASKS, PAWN, ROOK, KNIGHT, BISHOP, QUEEN, KING)
+
+PIECES = {
+    'PAWN': 1,
+    'pawn': -1,
+    'ROOK': 2,
+    'rook': -2,
+    'KNIGHT': 3,
+    'knight': -3,
+    'BISHOP': 4,
+    'bishop': -4,
+    'QUEEN': 5,
+    'queen': -5,
+    'KING': 6,
+    'king': -6,
+}
+
+# indexed by piece value, negative values index from the end
+FEN_PIECES = ' prnbqkKQBNRP'
+
+OFF_BOARD = 64
+
+# (dx, dy) of sliding directions, first four are rook directions, last four bishop directions
+SLIDER_DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1), (1, -1), (-1, 1)]
+KNIGHT_OFFSETS = [(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)]
+KING_OFFSETS = [(1, 1), (1, -1), (-1, 1), (-1, -1), (1, 0), (-1, 0), (0, 1), (0, -1)]
+
+
+def _square(x: int, y: int) -> int:
+    if 0 <= x < 8 and 0 <= y < 8:
+        return y * 8 + x
+    return OFF_BOARD
+
+def _build_tables():
+    slider = np.full((64, 8, 7), OFF_BOARD, dtype=np.intp)
+    knight = np.full((64, 8), OFF_BOARD, dtype=np.intp)
+    king = np.full((64, 8), OFF_BOARD, dtype=np.intp)
+    # [color, square, (forward, side), step], color 0 is black (positive pieces) and 1 is white
+    pawn_push = np.full((2, 64, 2, 2), OFF_BOARD, dtype=np.intp)
+    pawn_capture = np.full((2, 64, 3), OFF_BOARD, dtype=np.intp)
+    near = np.zeros((64, 64), dtype=np.float32)
+
+    for s in range(64):
+        y, x = divmod(s, 8)
+
+        for d, (dx, dy) in enumerate(SLIDER_DIRECTIONS):
+            for k in range(7):
+                slider[s, d, k] = _square(x + dx * (k + 1), y + dy * (k + 1))
+                if slider[s, d, k] == OFF_BOARD:
+                    break
+
+        for i, (dx, dy) in enumerate(KNIGHT_OFFSETS):
+            knight[s, i] = _square(x + dx, y + dy)
+
+        # king can not go within one square of the opponent king, its own square included
+        near[s, s] = 1
+        for i, (dx, dy) in enumerate(KING_OFFSETS):
+            king[s, i] = _square(x + dx, y + dy)
+            if king[s, i] != OFF_BOARD:
+                near[s, king[s, i]] = 1
+
+        for color, direction in enumerate((1, -1)):
+            for k in range(2):
+                pawn_push[color, s, 0, k] = _square(x, y + direction * (k + 1))
+                pawn_push[color, s, 1, k] = _square(x - direction * (k + 1), y)
+            pawn_capture[color, s, 0] = _square(x - direction, y + direction)
+            pawn_capture[color, s, 1] = _square(x - direction, y - direction)
+            pawn_capture[color, s, 2] = _square(x + direction, y + direction)
+
+    return slider, knight, king, pawn_push, pawn_capture, near
+
+SLIDER_RAYS, KNIGHT_TARGETS, KING_TARGETS, PAWN_PUSH, PAWN_CAPTURE, KING_NEAR = _build_tables()
+
+# which of SLIDER_DIRECTIONS each piece (by absolute value) uses
+SLIDER_PIECE_DIRECTIONS = np.zeros((7, 8), dtype=np.bool_)
+SLIDER_PIECE_DIRECTIONS[2, :4] = True
+SLIDER_PIECE_DIRECTIONS[4, 4:] = True
+SLIDER_PIECE_DIRECTIONS[5, :] = True
+
+
+def piece(name: str) -> int:
+    return PIECES[name]
+
+def piece_to_fen(piece: int) -> str:
+    return FEN_PIECES[int(piece)]
+
+def to_fen(board: np.ndarray) -> str:
+    """
+    converts the board to a fen string
+    """
+    rows = []
+    for row in board:
+        fen = ''
+        empty = 0
+        for value in row:
+            if value == 0:
+                empty += 1
+            else:
+                if empty > 0:
+                    fen += str(empty)
+                    empty = 0
+                fen += piece_to_fen(value)
+        if empty > 0:
+            fen += str(empty)
+        rows.append(fen)
+    return '/'.join(rows)
+
+def fen_to_svg(fen: str) -> str:
+    import chess
+    import chess.svg
+    return chess.svg.board(chess.Board(fen), size=500)
+
+START_BOARD = np.array([
+    [ 0,  0,  0,  1,  2,  4,  3,  6],
+    [ 0,  0,  0,  0,  1,  1,  5,  3],
+    [ 0,  0,  0,  0,  0,  1,  1,  4],
+    [-1,  0,  0,  0,  0,  0,  1,  2],
+    [-2, -1,  0,  0,  0,  0,  0,  1],
+    [-4, -1, -1,  0,  0,  0,  0,  0],
+    [-3, -5, -1, -1,  0,  0,  0,  0],
+    [-6, -3, -4, -2, -1,  0,  0,  0],
+], dtype=np.int8)
+
+def generate_start_board() -> np.ndarray:
+    return START_BOARD.copy()
+
+def generate_start_boards(n: int) -> np.ndarray:
+    return np.repeat(START_BOARD[np.newaxis], n, axis=0)
+
+def seed(value: int):
+    """
+    seeds random generator used by random fallbacks
+    """
+    np.random.seed(value)
+
+
+def _as_batch(isBlack, n: int) -> np.ndarray:
+    return np.broadcast_to(np.asarray(isBlack, dtype=np.bool_), (n,))
+
+def legal_moves_batch(boards: np.ndarray) -> np.ndarray:
+    """
+    Returns boolean move tables (N, 64, 64) `moves[n, from, to]` for every piece of every board
+    (same moves as `legal_moves` in `diagchess.py`)
+    """
+    boards = np.asarray(boards, dtype=np.int8).reshape(-1, 64)
+    n = len(boards)
+    rows = np.arange(n)
+
+    padded = np.zeros((n, 65), dtype=np.int8)
+    padded[:, :64] = boards
+
+    kind = np.abs(boards)
+    black = boards > 0
+
+    moves = np.zeros((n, 64, 65), dtype=np.bool_)
+
+    def enemy(occupied: np.ndarray, extra_dims: int) -> np.ndarray:
+        black_source = black.reshape(black.shape + (1,) * extra_dims)
+        return (occupied != 0) & ((occupied > 0) != black_source)
+
+    # rooks, bishops, queens, walk the rays until the first occupied square
+    occupied = padded[:, SLIDER_RAYS]
+    free = (occupied == 0) & (SLIDER_RAYS != OFF_BOARD)
+    clear_before = np.ones_like(free)
+    clear_before[..., 1:] = np.logical_and.accumulate(free[..., :-1], axis=-1)
+    reach = clear_before & (free | enemy(occupied, 2))
+    reach &= SLIDER_PIECE_DIRECTIONS[kind][..., np.newaxis]
+
+    b, s, d, k = np.nonzero(reach)
+    moves[b, s, SLIDER_RAYS[s, d, k]] = True
+
+    # knights
+    occupied = padded[:, KNIGHT_TARGETS]
+    reach = (KNIGHT_TARGETS != OFF_BOARD) & ((occupied == 0) | enemy(occupied, 1)) & (kind == 3)[..., np.newaxis]
+
+    b, s, i = np.nonzero(reach)
+    moves[b, s, KNIGHT_TARGETS[s, i]] = True
+
+    # kings, can not step next to the opponent king
+    near_black = np.zeros((n, 65), dtype=np.bool_)
+    near_white = np.zeros((n, 65), dtype=np.bool_)
+    near_black[:, :64] = (boards == 6).astype(np.float32) @ KING_NEAR > 0
+    near_white[:, :64] = (boards == -6).astype(np.float32) @ KING_NEAR > 0
+    forbidden = np.where(black[..., np.newaxis], near_white[:, KING_TARGETS], near_black[:, KING_TARGETS])
+
+    occupied = padded[:, KING_TARGETS]
+    reach = (KING_TARGETS != OFF_BOARD) & ((occupied == 0) | enemy(occupied, 1)) & ~forbidden & (kind == 6)[..., np.newaxis]
+
+    b, s, i = np.nonzero(reach)
+    moves[b, s, KING_TARGETS[s, i]] = True
+
+    # pawns, pushes forward and to the side (two squares from starting position) and three captures
+    color = (~black).astype(np.intp)
+    squares = np.arange(64)
+    is_pawn = kind == 1
+
+    push = PAWN_PUSH[color, squares]
+    occupied = padded[rows[:, None, None, None], push]
+    free = (occupied == 0) & (push != OFF_BOARD)
+    at_start = (boards == START_BOARD.reshape(-1)) & is_pawn
+    reach = np.zeros_like(free)
+    reach[..., 0] = free[..., 0] & is_pawn[..., np.newaxis]
+    reach[..., 1] = free[..., 0] & free[..., 1] & at_start[..., np.newaxis]
+
+    b, s, line, k = np.nonzero(reach)
+    moves[b, s, push[b, s, line, k]] = True
+
+    capture = PAWN_CAPTURE[color, squares]
+    occupied = padded[rows[:, None, None], capture]
+    reach = (capture != OFF_BOARD) & enemy(occupied, 1) & is_pawn[..., np.newaxis]
+
+    b, s, i = np.nonzero(reach)
+    moves[b, s, capture[b, s, i]] = True
+
+    return moves[:, :, :64]
+
+def _moves_to_actions(moves: np.ndarray) -> np.ndarray:
+    """
+    (N, 64, 64) tables indexed by `y * 8 + x` squares -> (N, 4096) indexed by `move_to_int` actions
+    """
+    n = len(moves)
+    return moves.reshape(n, 8, 8, 8, 8).transpose(0, 2, 1, 4, 3).reshape(n, 4096)
+
+def _side_moves(boards: np.ndarray, moves: np.ndarray, isBlack: np.ndarray) -> np.ndarray:
+    side = (boards != 0) & ((boards > 0) == isBlack[:, np.newaxis])
+    return moves & side[..., np.newaxis]
+
+def _attack_planes(boards: np.ndarray, moves: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    sums of piece values over the move targets, for black and white pieces (planes 6 and 7 of observation)
+    wraps around like int8 accumulation in `all_legal_moves`
+    """
+    values = boards.astype(np.float32)
+    moves = moves.astype(np.float32)
+
+    black = np.matmul(np.maximum(values, 0)[:, np.newaxis, :], moves)[:, 0]
+    white = np.matmul(np.minimum(values, 0)[:, np.newaxis, :], moves)[:, 0]
+
+    return black.astype(np.int64).astype(np.int8), white.astype(np.int64).astype(np.int8)
+
+def _observation(boards: np.ndarray, moves: np.ndarray) -> np.ndarray:
+    n = len(boards)
+    observation = np.zeros((n, 64, 8), dtype=np.float32)
+
+    for i in range(6):
+        observation[:, :, i] = (boards == -(i + 1)).astype(np.int8) - (boards == i + 1).astype(np.int8)
+
+    observation[:, :, 6], observation[:, :, 7] = _attack_planes(boards, moves)
+
+    return observation.reshape(n, 8, 8, 8)
+
+def board_to_observation_batch(boards: np.ndarray) -> np.ndarray:
+    boards = np.asarray(boards, dtype=np.int8).reshape(-1, 64)
+    return _observation(boards, legal_moves_batch(boards))
+
+def get_legal_moves_mask_batch(boards: np.ndarray, isBlack, packed: bool = False) -> np.ndarray:
+    """
+    Returns masks of legal moves for given boards and colors (one color or one per board),
+    dense (N x 4096) int8 or bit-packed (N x 512) uint8 in `np.packbits` order
+    """
+    boards = np.asarray(boards, dtype=np.int8).reshape(-1, 64)
+    moves = _moves_to_actions(_side_moves(boards, legal_moves_batch(boards), _as_batch(isBlack, len(boards))))
+    if packed:
+        return np.packbits(moves, axis=1)
+    return moves.astype(np.int8)
+
+def get_factored_legal_moves_mask_batch(boards: np.ndarray, isBlack) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns from masks (N, 64) int8 and bit-packed to masks (N, 64, 8) uint8 indexed by `y * 8 + x` squares
+    """
+    boards = np.asarray(boards, dtype=np.int8).reshape(-1, 64)
+    moves = _side_moves(boards, legal_moves_batch(boards), _as_batch(isBlack, len(boards)))
+    return moves.any(axis=2).astype(np.int8), np.packbits(moves, axis=2)
+
+def legal_moves_csr_batch(boards: np.ndarray, isBlack) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns legal moves in CSR form, offsets (N + 1,) int64 and actions (offsets[N],) int32
+    """
+    mask = get_legal_moves_mask_batch(boards, isBlack)
+    rows, actions = np.nonzero(mask)
+    offsets = np.zeros(len(mask) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(mask)), out=offsets[1:])
+    return offsets, actions.astype(np.int32)
+
+def board_to_observation_and_mask_batch(boards: np.ndarray, isBlack) -> Tuple[np.ndarray, np.ndarray]:
+    boards = np.asarray(boards, dtype=np.int8).reshape(-1, 64)
+    moves = legal_moves_batch(boards)
+    side_moves = _side_moves(boards, moves, _as_batch(isBlack, len(boards)))
+    return _observation(boards, moves), _moves_to_actions(side_moves).astype(np.int8)
+
+def _choose(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    picks uniformly one True index in each row, returns indices and whether row had any True
+    """
+    keys = np.where(mask, np.random.random(mask.shape), -1.0)
+    return keys.argmax(axis=-1), mask.any(axis=-1)
+
+def _random_legal_moves(side_moves: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    like `random_legal_move`: random piece that can move, then its random target
+    """
+    rows = np.arange(len(side_moves))
+    from_square, any_move = _choose(side_moves.any(axis=2))
+    to_square, _ = _choose(side_moves[rows, from_square])
+    return from_square, to_square, any_move
+
+def int_action_to_move(action):
+    x1 = (action // 8 // 8 // 8) % 8
+    y1 = (action // 8 // 8) % 8
+    x2 = (action // 8) % 8
+    y2 = (action) % 8
+
+    return x1, y1, x2, y2
+
+def move_to_int(x1, y1, x2, y2):
+    return (x1%8) * 8*8*8 + (y1%8) * 8*8 + (x2%8) * 8 + (y2%8)
+
+def capture_reward(captured_piece: int) -> int:
+    return int(CAPTURE_REWARDS[captured_piece + 6])
+
+def make_moves_batch(boards: np.ndarray, from_squares: np.ndarray, to_squares: np.ndarray, isBlack, stats=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Applies moves (given as `y * 8 + x` squares) to boards in place, same rules as `make_a_move`:
+    illegal moves are replaced with legal ones and penalized.
+    `stats` - optional int64 array of counters (see `STAT_*` in constants) summed over the batch
+    Returns dones (N,) and rewards (N,)
+    """
+    dones, rewards, _ = make_moves_batch_played(boards, from_squares, to_squares, isBlack, stats)
+    return dones, rewards
+
+def make_moves_batch_played(boards: np.ndarray, from_squares: np.ndarray, to_squares: np.ndarray, isBlack, stats=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Same as `make_moves_batch`, also returns played actions (N,) (`move_to_int`, -1 where game ended)
+    """
+    flat = boards.reshape(-1, 64)
+    n = len(flat)
+    rows = np.arange(n)
+    isBlack = _as_batch(isBlack, n)
+
+    moves = legal_moves_batch(flat)
+    side_moves = _side_moves(flat, moves, isBlack)
+
+    random_from, random_to, any_move = _random_legal_moves(side_moves)
+
+    piece_moves = moves[rows, from_squares]
+    random_target, has_target = _choose(piece_moves)
+
+    wrong_color = (flat[rows, from_squares] > 0) != isBlack
+    legal = ~wrong_color & piece_moves[rows, to_squares]
+    other_target = ~wrong_color & ~legal & has_target
+    fallback = ~(legal | other_target)
+
+    move_from = np.where(fallback, random_from, from_squares)
+    move_to = np.where(fallback, random_to, np.where(other_target, random_target, to_squares))
+
+    rewards = np.select(
+        [wrong_color, legal, other_target],
+        [WRONG_PIECE_COLOR_PENALTY, LEGAL_MOVE_REWARD, ILLEGAL_MOVE_PENALTY_1],
+        ILLEGAL_MOVE_PENALTY_2,
+    ).astype(np.int32)
+
+    # no legal moves, game over
+    dones = fallback & ~any_move
+    rewards[dones] = 0
+
+    played = np.where(dones, -1, move_to_int(move_from % 8, move_from // 8, move_to % 8, move_to // 8))
+
+    play = ~dones
+    rows, move_from, move_to = rows[play], move_from[play], move_to[play]
+
+    captured = flat[rows, move_to]
+    rewards[play] += CAPTURE_REWARDS[captured + 6]
+    flat[rows, move_to] = flat[rows, move_from]
+    flat[rows, move_from] = 0
+
+    if stats is not None:
+        stats[STAT_MOVES] += n
+        stats[STAT_LEGAL] += np.count_nonzero(legal)
+        stats[STAT_WRONG_COLOR] += np.count_nonzero(wrong_color)
+        stats[STAT_ILLEGAL_1] += np.count_nonzero(other_target)
+        stats[STAT_ILLEGAL_2] += np.count_nonzero(fallback & ~wrong_color)
+        stats[STAT_RANDOM_FALLBACKS] += np.count_nonzero(fallback)
+        stats[STAT_NO_LEGAL_MOVES] += np.count_nonzero(dones)
+        stats[STAT_CAPTURES] += np.count_nonzero(captured)
+        stats[STAT_LEGAL_MOVES_CALLS] += n * 64
+
+    return dones, rewards, played
+
+def make_move_from_action_batch(boards: np.ndarray, actions: np.ndarray, isBlack, stats=None) -> Tuple[np.ndarray, np.ndarray]:
+    x1, y1, x2, y2 = int_action_to_move(np.asarray(actions, dtype=np.int64))
+    return make_moves_batch(boards, y1 * 8 + x1, y2 * 8 + x2, isBlack, stats)
+
+def array_action_to_move_batch(boards: np.ndarray, actions: np.ndarray, isBlack) -> np.ndarray:
+    """
+    same as `array_action_to_move` for batch of boards (N, 8, 8) and actions (N, 8, 8, 2)
+    """
+    flat = np.asarray(boards, dtype=np.int8).reshape(-1, 64)
+    n = len(flat)
+    rows = np.arange(n)
+    isBlack = _as_batch(isBlack, n)
+    actions = np.asarray(actions, dtype=np.float32).reshape(n, 64, 2)
+
+    moves = legal_moves_batch(flat)
+
+    legal_from = (flat < 0) != isBlack[:, np.newaxis]
+    from_squares = np.argmax(actions[:, :, 0] * legal_from, axis=1)
+
+    legal_to = moves[rows, from_squares] * np.abs(flat[rows, from_squares]).astype(np.float32)[:, np.newaxis]
+    moves_to = actions[:, :, 1] * legal_to
+    to_squares = np.argmax(moves_to, axis=1)
+
+    random_from, random_to, any_move = _random_legal_moves(_side_moves(flat, moves, isBlack))
+
+    fallback = moves_to.sum(axis=1) == 0
+    from_squares = np.where(fallback, random_from, from_squares)
+    to_squares = np.where(fallback, random_to, to_squares)
+
+    output = move_to_int(from_squares % 8, from_squares // 8, to_squares % 8, to_squares // 8).astype(np.int32)
+    output[fallback & ~any_move] = 0
+
+    return output
+
+def board_hash_batch(boards: np.ndarray, isBlack) -> np.ndarray:
+    """
+    Zobrist hashes (N,) of positions, same as `board_hash`
+    """
+    flat = np.asarray(boards, dtype=np.int8).reshape(-1, 64)
+    keys = ZOBRIST_PIECE_KEYS[flat.astype(np.intp) + 6, np.arange(64)]
+    keys[flat == 0] = 0
+    hashes = np.bitwise_xor.reduce(keys, axis=1)
+    return np.where(_as_batch(isBlack, len(flat)), hashes ^ ZOBRIST_BLACK_KEY, hashes)
+
+
+# single board api, same as in `diagchess.py`
+
+def legal_moves(board: np.ndarray, x: int, y: int) -> np.ndarray:
+    targets = legal_moves_batch(board)[0, y * 8 + x].reshape(8, 8)
+    return (targets * board[y, x]).astype(np.int8)
+
+def all_legal_moves(board: np.ndarray, isBlack: bool) -> np.ndarray:
+    black, white = _attack_planes(board.reshape(1, 64), legal_moves_batch(board))
+    return (black if isBlack else white).reshape(8, 8)
+
+def board_to_observation(board: np.ndarray) -> np.ndarray:
+    return board_to_observation_batch(board)[0]
+
+def _count_mask(stats):
+    if stats is not None:
+        stats[STAT_MASKS] += 1
+        stats[STAT_LEGAL_MOVES_CALLS] += 64
+
+def get_legal_moves_mask(board: np.ndarray, isBlack: bool, stats=None) -> np.ndarray:
+    _count_mask(stats)
+    return get_legal_moves_mask_batch(board, isBlack)[0]
+
+def get_factored_legal_moves_mask(board: np.ndarray, isBlack: bool, stats=None) -> Tuple[np.ndarray, np.ndarray]:
+    _count_mask(stats)
+    from_masks, to_masks = get_factored_legal_moves_mask_batch(board, isBlack)
+    return from_masks[0], to_masks[0]
+
+def board_to_observation_and_mask(board: np.ndarray, isBlack: bool, stats=None) -> Tuple[np.ndarray, np.ndarray]:
+    _count_mask(stats)
+    observation, mask = board_to_observation_and_mask_batch(board, isBlack)
+    return observation[0], mask[0]
+
+def random_legal_move(board: np.ndarray, isBlack: bool, stats=None) -> Optional[Tuple[int, int, int, int]]:
+    if stats is not None:
+        stats[STAT_LEGAL_MOVES_CALLS] += 64
+    flat = board.reshape(1, 64)
+    from_square, to_square, any_move = _random_legal_moves(_side_moves(flat, legal_moves_batch(flat), _as_batch(isBlack, 1)))
+    if not any_move[0]:
+        return None
+    return int(from_square[0] % 8), int(from_square[0] // 8), int(to_square[0] % 8), int(to_square[0] // 8)
+
+def make_a_move(board: np.ndarray, x1: int, y1: int, x2: int, y2: int, isBlack: bool, stats=None) -> Tuple[bool, float]:
+    dones, rewards = make_moves_batch(board, np.array([y1 * 8 + x1]), np.array([y2 * 8 + x2]), isBlack, stats)
+    return bool(dones[0]), int(rewards[0])
+
+def make_move_from_action(board: np.ndarray, action: int, isBlack: bool, stats=None) -> Tuple[bool, float]:
+    x1, y1, x2, y2 = int_action_to_move(int(action))
+    return make_a_move(board, x1, y1, x2, y2, isBlack, stats)
+
+def make_move_from_action_played(board: np.ndarray, action: int, isBlack: bool, stats=None) -> Tuple[bool, float, int]:
+    x1, y1, x2, y2 = int_action_to_move(int(action))
+    dones, rewards, played = make_moves_batch_played(board, np.array([y1 * 8 + x1]), np.array([y2 * 8 + x2]), isBlack, stats)
+    return bool(dones[0]), int(rewards[0]), int(played[0])
+
+def array_action_to_move(board: np.ndarray, action: np.ndarray, isBlack: bool) -> int:
+    return int(array_action_to_move_batch(board, action, isBlack)[0])
+
+def make_move_from_prob(board: np.ndarray, prob: np.ndarray, isBlack: bool, stats=None) -> Tuple[bool, float]:
+    return make_move_from_action(board, array_action_to_move(board, prob, isBlack), isBlack, stats)
+
+def board_hash(board: np.ndarray, isBlack: bool) -> np.uint64:
+    return board_hash_batch(board, isBlack)[0]
+
+def pack_snapshot(board: np.ndarray, isBlack: bool) -> np.ndarray:
+    snapshot = np.zeros(SNAPSHOT_SIZE, dtype=np.uint8)
+    snapshot[:64] = board.reshape(-1).view(np.uint8)
+    snapshot[64] = 1 if isBlack else 0
+    snapshot[65:] = np.array([board_hash(board, isBlack)], dtype='<u8').view(np.uint8)
+    return snapshot
+
+def unpack_snapshot(snapshot: np.ndarray) -> Tuple[np.ndarray, bool, np.uint64]:
+    board = snapshot[:64].view(np.int8).reshape(8, 8).copy()
+    return board, bool(snapshot[64] != 0), snapshot[65:].copy().view('<u8')[0]
@@ -0,0 +1,156 @@
+import unittest
+
+import numpy as np
+
+from . import numpy_backend
+
+try:
+    from . import diagchess
+except ImportError:
+    diagchess = None
+
+
+def random_boards(n: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    random positions with a few pieces of every kind, kings included
+    """
+    boards = np.zeros((n, 64), dtype=np.int8)
+    for board in boards:
+        count = rng.integers(2, 24)
+        squares = rng.choice(64, size=count, replace=False)
+        board[squares] = rng.choice([-6, -5, -4, -3, -2, -1, 1, 2, 3, 4, 5, 6], size=count)
+    return boards.reshape(n, 8, 8)
+
+def played_boards(n: int) -> np.ndarray:
+    """
+    positions from games with random actions
+    """
+    boards = []
+    board = diagchess.generate_start_board()
+    isBlack = False
+    for _ in range(n):
+        done, _ = diagchess.make_move_from_action(board, np.random.randint(0, 4096), isBlack)
+        isBlack = not isBlack
+        if done:
+            board = diagchess.generate_start_board()
+            isBlack = False
+        boards.append(board.copy())
+    return np.array(boards)
+
+
+@unittest.skipIf(diagchess is None, "numba is not installed")
+class NumpyBackendTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.boards = np.concatenate([random_boards(200, rng), played_boards(200)])
+
+    def test_legal_moves(self):
+        moves = numpy_backend.legal_moves_batch(self.boards)
+        for board, board_moves in zip(self.boards, moves):
+            for y in range(8):
+                for x in range(8):
+                    expected = diagchess.legal_moves(board, x, y)
+                    actual = (board_moves[y * 8 + x].reshape(8, 8) * board[y, x]).astype(np.int8)
+                    self.assertTrue(np.array_equal(expected, actual), (numpy_backend.to_fen(board), x, y))
+
+    def test_observations(self):
+        observations = numpy_backend.board_to_observation_batch(self.boards)
+        expected = diagchess.board_to_observation_batch(self.boards)
+        self.assertTrue(np.array_equal(observations, expected))
+
+    def test_masks(self):
+        for isBlack in (False, True):
+            masks = numpy_backend.get_legal_moves_mask_batch(self.boards, isBlack)
+            for board, mask in zip(self.boards, masks):
+                self.assertTrue(np.array_equal(mask, diagchess.get_legal_moves_mask(board, isBlack)))
+
+    def test_mask_batch_kernel(self):
+        isBlack = np.arange(len(self.boards)) % 2 == 1
+        dense = diagchess.get_legal_moves_mask_batch(self.boards, isBlack)
+        packed = diagchess.get_legal_moves_mask_batch(self.boards, isBlack, packed=True)
+
+        self.assertEqual(packed.shape, (len(self.boards), 512))
+        self.assertTrue(np.array_equal(dense, numpy_backend.get_legal_moves_mask_batch(self.boards, isBlack)))
+        self.assertTrue(np.array_equal(packed, numpy_backend.get_legal_moves_mask_batch(self.boards, isBlack, packed=True)))
+        self.assertTrue(np.array_equal(np.unpackbits(packed, axis=1), dense))
+
+    def test_factored_masks(self):
+        isBlack = np.arange(len(self.boards)) % 2 == 1
+        from_masks, to_masks = diagchess.get_factored_legal_moves_mask_batch(self.boards, isBlack)
+        expected_from, expected_to = numpy_backend.get_factored_legal_moves_mask_batch(self.boards, isBlack)
+        self.assertEqual(to_masks.shape, (len(self.boards), 64, 8))
+        self.assertTrue(np.array_equal(from_masks, expected_from))
+        self.assertTrue(np.array_equal(to_masks, expected_to))
+
+        dense = numpy_backend.get_legal_moves_mask_batch(self.boards, isBlack)
+        for i in range(len(self.boards)):
+            board_from, board_to = diagchess.get_factored_legal_moves_mask(self.boards[i], isBlack[i])
+            self.assertTrue(np.array_equal(board_from, from_masks[i]))
+            self.assertTrue(np.array_equal(board_to, to_masks[i]))
+
+            # (from y, from x, to y, to x) -> move_to_int order (x1, y1, x2, y2)
+            moves = np.unpackbits(board_to, axis=1).reshape(8, 8, 8, 8).transpose(1, 0, 3, 2).reshape(4096)
+            self.assertTrue(np.array_equal(moves, dense[i]))
+
+    def test_legal_moves_csr(self):
+        isBlack = np.arange(len(self.boards)) % 2 == 1
+        masks = numpy_backend.get_legal_moves_mask_batch(self.boards, isBlack)
+        offsets, actions = diagchess.legal_moves_csr_batch(self.boards, isBlack)
+
+        self.assertEqual(offsets[-1], len(actions))
+        for i, mask in enumerate(masks):
+            self.assertTrue(np.array_equal(actions[offsets[i]:offsets[i + 1]], np.flatnonzero(mask)))
+
+        expected_offsets, expected_actions = numpy_backend.legal_moves_csr_batch(self.boards, isBlack)
+        self.assertTrue(np.array_equal(offsets, expected_offsets))
+        self.assertTrue(np.array_equal(actions, expected_actions))
+
+    def test_legal_move_application(self):
+        isBlack = np.arange(len(self.boards)) % 2 == 1
+        masks = numpy_backend.get_legal_moves_mask_batch(self.boards, isBlack)
+        has_moves = masks.any(axis=1)
+
+        boards = self.boards[has_moves]
+        isBlack = isBlack[has_moves]
+        actions = np.array([np.random.choice(np.flatnonzero(mask)) for mask in masks[has_moves]])
+
+        expected_boards = boards.copy()
+        expected_rewards = []
+        for board, action, color in zip(expected_boards, actions, isBlack):
+            done, reward = diagchess.make_move_from_action(board, action, color)
+            self.assertFalse(done)
+            expected_rewards.append(reward)
+
+        dones, rewards = numpy_backend.make_move_from_action_batch(boards, actions, isBlack)
+
+        self.assertFalse(dones.any())
+        self.assertTrue(np.array_equal(rewards, expected_rewards))
+        self.assertTrue(np.array_equal(boards, expected_boards))
+
+    def test_fallback_moves_are_legal(self):
+        boards = self.boards.copy()
+        isBlack = np.arange(len(boards)) % 2 == 1
+        before = boards.copy()
+        masks = numpy_backend.get_legal_moves_mask_batch(boards, isBlack)
+
+        actions = np.random.randint(0, 4096, size=len(boards))
+        dones, rewards = numpy_backend.make_move_from_action_batch(boards, actions, isBlack)
+
+        self.assertTrue(np.array_equal(dones, ~masks.any(axis=1)))
+        for board, after, mask, color, done in zip(before, boards, masks, isBlack, dones):
+            if done:
+                self.assertTrue(np.array_equal(board, after))
+                continue
+            changed = np.flatnonzero((board != after).reshape(-1))
+            self.assertEqual(len(changed), 2)
+
+    def test_hash_and_fen(self):
+        for board in self.boards[:50]:
+            self.assertEqual(numpy_backend.board_hash(board, True), diagchess.board_hash(board, True))
+            self.assertEqual(numpy_backend.to_fen(board), diagchess.to_fen(board))
+            snapshot = numpy_backend.pack_snapshot(board, False)
+            self.assertTrue(np.array_equal(snapshot, diagchess.pack_snapshot(board, False)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+"""
+Opening book built from recorded games (see `GameLog`).
+
+Every position reached in the first `max_plies` plies of logged games is keyed by its zobrist hash (`board_hash`),
+together with counts of moves played from it. Keys are kept in a sorted array and looked up by binary search,
+so opponents and evaluators can answer book positions without running the model.
+
+```
+python -m chess_engine.opening_book games/chess_v6.0_20230101-120000 book.npz --max-plies 16
+```
+"""
+from typing import Callable, Optional, Tuple
+import numpy as np
+import numba as nb
+
+from .diagchess import board_hash
+from .game_log import GameLog, game_start, legal_actions, play
+
+
+@nb.njit(cache=True)
+def _book_entries(data: np.ndarray, offsets: np.ndarray, moves: np.ndarray, max_plies: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns hash of position and action played from it for first `max_plies` plies of every game
+    """
+    total = 0
+    for i in range(len(moves)):
+        total += min(moves[i], max_plies)
+
+    hashes = np.empty(total, dtype=np.uint64)
+    actions = np.empty(total, dtype=np.int32)
+
+    count = 0
+    for i in range(len(offsets)):
+        board, isBlack, strict, offset = game_start(data, offsets[i])
+        for ply in range(min(moves[i], max_plies)):
+            action = legal_actions(board, isBlack, strict)[data[offset + ply]]
+            hashes[count] = board_hash(board, isBlack)
+            actions[count] = action
+            count += 1
+
+            play(board, action, isBlack, strict)
+            isBlack = not isBlack
+
+    return hashes, actions
+
+@nb.njit(cache=True)
+def _probe_batch(keys: np.ndarray, offsets: np.ndarray, actions: np.ndarray, counts: np.ndarray,
+                 hashes: np.ndarray, sample: bool) -> np.ndarray:
+    """
+    Book action of every hash, most played one or (`sample`) chosen in proportion to counts, -1 if it is not in the book
+    """
+    result = np.full(len(hashes), -1, dtype=np.int32)
+    for i in range(len(hashes)):
+        index = np.searchsorted(keys, hashes[i])
+        if index >= len(keys) or keys[index] != hashes[i]:
+            continue
+
+        first, last = offsets[index], offsets[index + 1]
+        if not sample:
+            result[i] = actions[first]
+            continue
+
+        total = 0
+        for j in range(first, last):
+            total += counts[j]
+        pick = np.random.randint(0, total)
+        for j in range(first, last):
+            pick -= counts[j]
+            if pick < 0:
+                result[i] = actions[j]
+                break
+
+    return result
+
+
+class OpeningBook:
+    """
+    Sorted zobrist keys of book positions, moves of key `i` are `actions[offsets[i]:offsets[i + 1]]`
+    ordered by `counts` (most played first)
+    """
+    def __init__(self, keys: np.ndarray, offsets: np.ndarray, actions: np.ndarray, counts: np.ndarray):
+        self.keys = np.asarray(keys, dtype=np.uint64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.actions = np.asarray(actions, dtype=np.int32)
+        self.counts = np.asarray(counts, dtype=np.int32)
+
+    @classmethod
+    def from_games(cls, log: GameLog, max_plies: int = 16, min_count: int = 1) -> 'OpeningBook':
+        """
+        Builds book from first `max_plies` plies of all games in the log,
+        moves played less than `min_count` times are dropped
+        """
+        index = log.index()
+        hashes, actions = _book_entries(log.data(), np.ascontiguousarray(index[:, 0]), np.ascontiguousarray(index[:, 1]), max_plies)
+
+        # unique (position, move) pairs with counts
+        pairs = np.zeros(len(hashes), dtype=[('hash', np.uint64), ('action', np.int32)])
+        pairs['hash'], pairs['action'] = hashes, actions
+        pairs, counts = np.unique(pairs, return_counts=True)
+
+        keep = counts >= min_count
+        pairs, counts = pairs[keep], counts[keep]
+
+        # by position, most played moves first
+        order = np.lexsort((pairs['action'], -counts, pairs['hash']))
+        pairs, counts = pairs[order], counts[order]
+
+        keys, starts = np.unique(pairs['hash'], return_index=True)
+        offsets = np.append(starts, len(pairs))
+
+        return cls(keys, offsets, pairs['action'], counts)
+
+    @classmethod
+    def load(cls, path: str) -> 'OpeningBook':
+        with np.load(path) as data:
+            return cls(data['keys'], data['offsets'], data['actions'], data['counts'])
+
+    def save(self, path: str):
+        np.savez(path, keys=self.keys, offsets=self.offsets, actions=self.actions, counts=self.counts)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def probe_batch(self, boards: np.ndarray, is_black, sample: bool = False) -> np.ndarray:
+        """
+        Book actions (N,) of boards (N, 8, 8), -1 for positions that are not in the book.
+        `sample` - choose moves in proportion to how often they were played instead of the most played one
+        """
+        is_black = np.broadcast_to(np.asarray(is_black, dtype=np.bool_), (len(boards),))
+        hashes = np.array([board_hash(board, bool(isBlack)) for board, isBlack in zip(boards, is_black)], dtype=np.uint64)
+        return _probe_batch(self.keys, self.offsets, self.actions, self.counts, hashes, sample)
+
+    def probe(self, board: np.ndarray, isBlack: bool, sample: bool = False) -> int:
+        return int(self.probe_batch(board[np.newaxis], isBlack, sample)[0])
+
+    def actions_or(self, boards: np.ndarray, is_black, policy: Callable[[np.ndarray, np.ndarray], np.ndarray],
+                   sample: bool = False) -> np.ndarray:
+        """
+        Book actions where available, `policy(boards, is_black)` is called only for positions out of book
+        """
+        is_black = np.broadcast_to(np.asarray(is_black, dtype=np.bool_), (len(boards),))
+        actions = self.probe_batch(boards, is_black, sample)
+
+        missing = np.flatnonzero(actions < 0)
+        if len(missing) > 0:
+            actions[missing] = policy(boards[missing], is_black[missing])
+        return actions
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="builds opening book from a game log")
+    parser.add_argument("log", type=str, help="game log path (without .games/.index)")
+    parser.add_argument("output", type=str, help="where to save the book (.npz)")
+    parser.add_argument("--max-plies", type=int, default=16, help="plies of every game to include")
+    parser.add_argument("--min-count", type=int, default=1, help="drop moves played less often")
+
+    args = parser.parse_args()
+
+    book = OpeningBook.from_games(GameLog(args.log), args.max_plies, args.min_count)
+    book.save(args.output)
+    print(f"{len(book)} positions, {len(book.actions)} moves")
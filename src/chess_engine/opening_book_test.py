@@ -0,0 +1,77 @@
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+from . import DiagonalChess
+from .diagchess import generate_start_board, make_move_from_action
+from .game_log import GameLog
+from .opening_book import OpeningBook
+
+
+class OpeningBookTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.log = GameLog(os.path.join(cls.directory.name, 'games'))
+
+        env = DiagonalChess(record=True)
+        for _ in range(20):
+            env.reset()
+            for _ in range(12):
+                if env.step(random.randrange(4096))[2]:
+                    break
+            cls.log.append(*env.game_record())
+
+        cls.book = OpeningBook.from_games(cls.log, max_plies=6)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_start_position(self):
+        first_moves = [self.log.moves(game)[0][0] for game in range(len(self.log))]
+        values, counts = np.unique(first_moves, return_counts=True)
+
+        action = self.book.probe(generate_start_board(), False)
+        self.assertIn(action, values[counts == counts.max()])
+        self.assertIn(self.book.probe(generate_start_board(), False, sample=True), values)
+
+        # same board with other side to move is a different position
+        self.assertEqual(self.book.probe(generate_start_board(), True), -1)
+
+    def test_book_moves_follow_games(self):
+        actions, _, _ = self.log.moves(0)
+        board = generate_start_board()
+        isBlack = False
+        for ply in range(6):
+            # every position of the game is in the book
+            self.assertGreaterEqual(self.book.probe(board, isBlack), 0)
+            make_move_from_action(board, actions[ply], isBlack)
+            isBlack = not isBlack
+
+    def test_actions_or(self):
+        boards = np.stack([generate_start_board(), np.zeros((8, 8), dtype=np.int8)])
+        calls = []
+
+        def policy(boards, is_black):
+            calls.append(len(boards))
+            return np.full(len(boards), 7)
+
+        actions = self.book.actions_or(boards, False, policy)
+        self.assertEqual(calls, [1])
+        self.assertGreaterEqual(actions[0], 0)
+        self.assertEqual(actions[1], 7)
+
+    def test_save_load(self):
+        path = os.path.join(self.directory.name, 'book.npz')
+        self.book.save(path)
+        book = OpeningBook.load(path)
+        self.assertEqual(len(book), len(self.book))
+        self.assertEqual(book.probe(generate_start_board(), False), self.book.probe(generate_start_board(), False))
+
+
+if __name__ == '__main__':
+    unittest.main()
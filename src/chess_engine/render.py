@@ -0,0 +1,237 @@
+"""
+Batched board renderer, draws boards (N, 8, 8) straight into uint8 RGB frames (N, 8 * size, 8 * size, 3).
+
+Piece sprites are built once per square size from small bitmaps, a batch is drawn with a handful of numpy gathers
+(no FEN, SVG or per position python work), so sample games can be rendered during training.
+Row `y = 0` of the board is drawn at the top (rank 8), same as `to_fen`.
+"""
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple
+import numpy as np
+
+LIGHT_SQUARE = (240, 217, 181)
+DARK_SQUARE = (181, 136, 99)
+HIGHLIGHT = (205, 210, 106)
+
+# fill and outline colors, positive pieces are black
+BLACK_PIECE = ((40, 40, 40), (230, 230, 230))
+WHITE_PIECE = ((250, 250, 250), (20, 20, 20))
+
+# 16x16 silhouettes of pawn, rook, knight, bishop, queen, king (same order as piece values 1..6)
+_BITMAPS = (
+    [
+        "................",
+        "................",
+        "................",
+        "......####......",
+        ".....######.....",
+        ".....######.....",
+        "......####......",
+        ".....######.....",
+        "......####......",
+        "......####......",
+        ".....######.....",
+        "....########....",
+        "...##########...",
+        "...##########...",
+        "................",
+        "................",
+    ],
+    [
+        "................",
+        "................",
+        "...##.####.##...",
+        "...##.####.##...",
+        "...##########...",
+        "....########....",
+        ".....######.....",
+        ".....######.....",
+        ".....######.....",
+        ".....######.....",
+        ".....######.....",
+        "....########....",
+        "...##########...",
+        "...##########...",
+        "................",
+        "................",
+    ],
+    [
+        "................",
+        "................",
+        ".......##.......",
+        ".....######.....",
+        "....########....",
+        "...####.#####...",
+        "...#########....",
+        "....##.#####....",
+        ".......#####....",
+        "......######....",
+        ".....#######....",
+        "....########....",
+        "...##########...",
+        "...##########...",
+        "................",
+        "................",
+    ],
+    [
+        "................",
+        ".......##.......",
+        "......####......",
+        ".....##.###.....",
+        ".....#.####.....",
+        ".....######.....",
+        "......####......",
+        "......####......",
+        ".....######.....",
+        "......####......",
+        "......####......",
+        ".....######.....",
+        "...##########...",
+        "...##########...",
+        "................",
+        "................",
+    ],
+    [
+        "................",
+        "..#....##....#..",
+        "..##..####..##..",
+        "..###.####.###..",
+        "..############..",
+        "...##########...",
+        "...##########...",
+        "....########....",
+        "....########....",
+        ".....######.....",
+        ".....######.....",
+        "....########....",
+        "...##########...",
+        "...##########...",
+        "................",
+        "................",
+    ],
+    [
+        ".......##.......",
+        "......####......",
+        ".......##.......",
+        "......####......",
+        "..############..",
+        "..############..",
+        "...##########...",
+        "....########....",
+        "....########....",
+        ".....######.....",
+        ".....######.....",
+        "....########....",
+        "...##########...",
+        "...##########...",
+        "................",
+        "................",
+    ],
+)
+
+
+def _silhouette(bitmap: Sequence[str], size: int) -> np.ndarray:
+    mask = np.array([[c == '#' for c in row] for row in bitmap], dtype=np.bool_)
+    # nearest neighbour scaling to the square size
+    rows = np.arange(size) * len(bitmap) // size
+    cols = np.arange(size) * len(bitmap[0]) // size
+    return mask[rows][:, cols]
+
+def _dilate(mask: np.ndarray) -> np.ndarray:
+    padded = np.pad(mask, 1)
+    out = np.zeros_like(mask)
+    for dy in range(3):
+        for dx in range(3):
+            out |= padded[dy:dy + mask.shape[0], dx:dx + mask.shape[1]]
+    return out
+
+@lru_cache(maxsize=None)
+def sprites(size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns sprites (13, size, size, 3) uint8 and their masks (13, size, size) indexed by piece + 6 (index 6 is empty)
+    """
+    colors = np.zeros((13, size, size, 3), dtype=np.uint8)
+    masks = np.zeros((13, size, size), dtype=np.bool_)
+
+    for kind, bitmap in enumerate(_BITMAPS, start=1):
+        fill = _silhouette(bitmap, size)
+        outline = _dilate(fill)
+        for piece_value, (fill_color, outline_color) in ((kind, BLACK_PIECE), (-kind, WHITE_PIECE)):
+            colors[piece_value + 6][outline] = outline_color
+            colors[piece_value + 6][fill] = fill_color
+            masks[piece_value + 6] = outline
+
+    return colors, masks
+
+@lru_cache(maxsize=None)
+def _tiles(size: int) -> np.ndarray:
+    """
+    (13, 3, size, size, 3) every sprite drawn over light, dark and highlighted square
+    """
+    colors, masks = sprites(size)
+    backgrounds = np.array([LIGHT_SQUARE, DARK_SQUARE, HIGHLIGHT], dtype=np.uint8)
+    return np.where(masks[:, np.newaxis, :, :, np.newaxis], colors[:, np.newaxis], backgrounds[np.newaxis, :, np.newaxis, np.newaxis])
+
+# (8, 8) background of every square, 0 light 1 dark, a1 (x = 0, y = 7) is dark
+_PARITY = np.add.outer(np.arange(8), np.arange(8)) % 2
+
+
+def render_boards(boards: np.ndarray, size: int = 32, actions: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Draws boards (N, 8, 8) into RGB frames (N, 8 * size, 8 * size, 3) uint8.
+    `actions` - optional (N,) actions to highlight (from and to squares), negative ones are skipped
+    """
+    boards = np.asarray(boards, dtype=np.int8)
+    n = len(boards)
+
+    backgrounds = np.broadcast_to(_PARITY, (n, 8, 8)).copy()
+    if actions is not None:
+        actions = np.asarray(actions, dtype=np.int64)
+        rows = np.flatnonzero(actions >= 0)
+        played = actions[rows]
+        backgrounds[rows, played // 64 % 8, played // 512] = 2
+        backgrounds[rows, played % 8, played // 8 % 8] = 2
+
+    # (N, 8, 8, size, size, 3) pre-drawn tiles
+    tiles = _tiles(size)[boards.astype(np.int64) + 6, backgrounds]
+
+    # (N, y, row, x, col, 3) -> (N, 8 * size, 8 * size, 3)
+    return tiles.transpose(0, 1, 3, 2, 4, 5).reshape(n, 8 * size, 8 * size, 3)
+
+def render_board(board: np.ndarray, size: int = 32, action: int = -1) -> np.ndarray:
+    return render_boards(board[np.newaxis], size, np.array([action]))[0]
+
+def tile_frames(frames: np.ndarray, columns: int = 8, padding: int = 2) -> np.ndarray:
+    """
+    Arranges frames (N, H, W, 3) into one grid image, row by row
+    """
+    n, height, width, _ = frames.shape
+    rows = (n + columns - 1) // columns
+    grid = np.zeros((rows * (height + padding) - padding, columns * (width + padding) - padding, 3), dtype=np.uint8)
+    for i in range(n):
+        y, x = (i // columns) * (height + padding), (i % columns) * (width + padding)
+        grid[y:y + height, x:x + width] = frames[i]
+    return grid
+
+
+def write_gif(path: str, frames: np.ndarray, duration: float = 0.5, loop: int = 0):
+    """
+    Saves frames (N, H, W, 3) as animated GIF, `duration` is seconds per frame. Needs Pillow (installed with matplotlib).
+    """
+    from PIL import Image
+
+    images = [Image.fromarray(frame) for frame in frames]
+    images[0].save(path, save_all=True, append_images=images[1:], duration=int(duration * 1000), loop=loop)
+
+def image_summary(name: str, boards: np.ndarray, step: int, size: int = 32, actions: Optional[np.ndarray] = None,
+                  columns: Optional[int] = None):
+    """
+    Writes boards to the default TensorBoard writer, as one grid image if `columns` is given (a whole game fits
+    into one summary) or as separate images otherwise
+    """
+    import tensorflow as tf
+
+    frames = render_boards(boards, size, actions)
+    if columns is not None:
+        frames = tile_frames(frames, columns)[np.newaxis]
+    return tf.summary.image(name, frames, step=step, max_outputs=len(frames))
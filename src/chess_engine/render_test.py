@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from .diagchess import generate_start_board, move_to_int
+from .render import render_boards, render_board, tile_frames, write_gif, sprites, LIGHT_SQUARE, DARK_SQUARE, HIGHLIGHT
+
+try:
+    import PIL
+except ImportError:
+    PIL = None
+
+
+class RenderTests(unittest.TestCase):
+    def test_frames(self):
+        size = 16
+        boards = np.stack([generate_start_board(), np.zeros((8, 8), dtype=np.int8)])
+        frames = render_boards(boards, size)
+
+        self.assertEqual(frames.shape, (2, 8 * size, 8 * size, 3))
+        self.assertEqual(frames.dtype, np.uint8)
+
+        # empty board is just squares, a8 (top left) light and a1 (bottom left) dark
+        self.assertTrue((frames[1, :size, :size] == LIGHT_SQUARE).all())
+        self.assertTrue((frames[1, -size:, :size] == DARK_SQUARE).all())
+
+        # every occupied square shows its sprite
+        colors, masks = sprites(size)
+        for y, x in np.argwhere(boards[0] != 0):
+            tile = frames[0, y * size:(y + 1) * size, x * size:(x + 1) * size]
+            mask = masks[boards[0, y, x] + 6]
+            self.assertTrue((tile[mask] == colors[boards[0, y, x] + 6][mask]).all())
+
+        # batch matches single boards
+        self.assertTrue(np.array_equal(frames[0], render_board(boards[0], size)))
+
+    def test_highlight(self):
+        size = 8
+        frame = render_boards(np.zeros((1, 8, 8), dtype=np.int8), size, np.array([move_to_int(1, 2, 3, 4)]))[0]
+        self.assertTrue((frame[2 * size:3 * size, 1 * size:2 * size] == HIGHLIGHT).all())
+        self.assertTrue((frame[4 * size:5 * size, 3 * size:4 * size] == HIGHLIGHT).all())
+
+    def test_tile_frames(self):
+        frames = np.ones((5, 4, 4, 3), dtype=np.uint8)
+        grid = tile_frames(frames, columns=2, padding=1)
+        self.assertEqual(grid.shape, (3 * 5 - 1, 2 * 5 - 1, 3))
+        self.assertEqual(grid.sum(), frames.sum())
+
+    @unittest.skipIf(PIL is None, "Pillow is not installed")
+    def test_gif(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'game.gif')
+            write_gif(path, render_boards(np.stack([generate_start_board()] * 3), 8))
+            self.assertGreater(os.path.getsize(path), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,451 @@
+"""
+Endgame tablebases for positions with few pieces (both kings and 1-2 other pieces), strict rules
+(see `strict_legal_moves`): checkmate wins, stalemate is a draw.
+
+Table of one material (e.g. `KQvk` - white king and queen against black king) stores value of every placement
+of its pieces, indexed by `position_index`: placement of both kings (only pairs of squares that don't touch,
+see `KING_PAIRS`), then every other piece in material order as a digit of its square (`y * 8 + x`) among squares
+not taken by pieces before it, then side to move. Pieces never share a square, so a table has
+`len(KING_PAIRS) * 62 * 61 * ... * 2` entries instead of `64 ** pieces * 2`. Values are int16 from the side to move
+point of view:
+* `TB_MATE - n` - side to move wins, mates in `n` plies
+* `n - TB_MATE` - side to move loses, gets mated in `n` plies
+* `0` - draw
+* `TB_INVALID` - position can't happen (side not to move in check)
+
+Tables are built by forward iteration (every pass resolves positions one ply deeper), captures are looked up
+in tables with one piece less, which are built first. Each table is saved as `<name>.npy` and memory mapped by `Tablebase`.
+
+```
+python -m chess_engine.tablebase tables KQvk KRvk KQvkr
+```
+"""
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import numba as nb
+
+from .diagchess import legal_moves, king_safety, filter_legal_moves, is_in_check, move_to_int, piece_to_fen
+
+TB_MATE = 1000
+TB_INVALID = np.iinfo(np.int16).min
+
+MaterialType = Tuple[int, ...]
+
+
+def material_key(pieces: Iterable[int]) -> MaterialType:
+    """
+    Canonical order of pieces of a table: white king, black king, then other pieces sorted by value
+    """
+    pieces = sorted(int(p) for p in pieces if p != 0)
+    pieces.remove(-6)
+    pieces.remove(6)
+    return (-6, 6, *pieces)
+
+def material_name(material: MaterialType) -> str:
+    white = ''.join(piece_to_fen(p) for p in material if p < 0)
+    black = ''.join(piece_to_fen(p) for p in material if p > 0)
+    return f"{white}v{black}"
+
+def parse_material(name: str) -> MaterialType:
+    """
+    `KQvkr` -> material key, inverse of `material_name`
+    """
+    fen_to_piece = {piece_to_fen(p): p for p in range(-6, 7) if p != 0}
+    return material_key(fen_to_piece[c] for c in name.replace('v', ''))
+
+def table_size(material: MaterialType) -> int:
+    return _table_size(len(material))
+
+def _sub_materials(material: MaterialType) -> List[Optional[MaterialType]]:
+    """
+    material left after capturing each piece, None for kings (can't be captured)
+    """
+    return [None if abs(p) == 6 else material_key(material[:i] + material[i + 1:]) for i, p in enumerate(material)]
+
+
+def _king_pairs() -> Tuple[np.ndarray, np.ndarray]:
+    pairs = [(white, black) for white in range(64) for black in range(64)
+             if max(abs(white // 8 - black // 8), abs(white % 8 - black % 8)) > 1]
+    index = np.full((64, 64), -1, dtype=np.int64)
+    for i, (white, black) in enumerate(pairs):
+        index[white, black] = i
+    return np.array(pairs, dtype=np.int64), index
+
+# squares of white and black king that don't touch, and index of each pair (-1 for touching kings or one square)
+KING_PAIRS, KING_PAIR_INDEX = _king_pairs()
+
+
+@nb.njit(cache=True)
+def _table_size(pieces: int) -> int:
+    size = len(KING_PAIRS) * 2
+    for i in range(2, pieces):
+        size *= 64 - i
+    return size
+
+@nb.njit(cache=True)
+def _free_digit(squares: np.ndarray, i: int, skipped: int = -1) -> int:
+    """
+    rank of square of piece `i` among squares not taken by pieces before it (except piece `skipped`)
+    """
+    digit = squares[i]
+    for j in range(i):
+        if j != skipped and squares[j] < squares[i]:
+            digit -= 1
+    return digit
+
+@nb.njit(cache=True)
+def position_index(squares: np.ndarray, isBlack: bool) -> int:
+    """
+    index of a placement of pieces in material order, -1 if kings touch or pieces share a square
+    """
+    index = KING_PAIR_INDEX[squares[0], squares[1]]
+    if index < 0:
+        return -1
+    for i in range(2, len(squares)):
+        for j in range(i):
+            if squares[j] == squares[i]:
+                return -1
+        index = index * (64 - i) + _free_digit(squares, i)
+    return index * 2 + (1 if isBlack else 0)
+
+@nb.njit(cache=True)
+def position_indices(squares: np.ndarray, isBlack: np.ndarray) -> np.ndarray:
+    """
+    `position_index` of every row of `squares` (N, pieces)
+    """
+    indices = np.empty(len(squares), dtype=np.int64)
+    for k in range(len(squares)):
+        indices[k] = position_index(squares[k], isBlack[k])
+    return indices
+
+@nb.njit(cache=True)
+def _decode(index: int, squares: np.ndarray) -> bool:
+    isBlack = index % 2 == 1
+    index //= 2
+    for i in range(len(squares) - 1, 1, -1):
+        squares[i] = index % (64 - i)
+        index //= 64 - i
+    squares[0], squares[1] = KING_PAIRS[index, 0], KING_PAIRS[index, 1]
+
+    # digits to squares, skipping squares taken by pieces before
+    for i in range(2, len(squares)):
+        digit = squares[i]
+        for square in range(64):
+            taken = False
+            for j in range(i):
+                if squares[j] == square:
+                    taken = True
+            if not taken:
+                if digit == 0:
+                    squares[i] = square
+                    break
+                digit -= 1
+    return isBlack
+
+@nb.njit(cache=True)
+def _sub_index(squares: np.ndarray, captured: int, isBlack: bool) -> int:
+    """
+    `position_index` of the placement without piece `captured` (never a king)
+    """
+    index = KING_PAIR_INDEX[squares[0], squares[1]]
+    digits = 2
+    for i in range(2, len(squares)):
+        if i != captured:
+            index = index * (64 - digits) + _free_digit(squares, i, captured)
+            digits += 1
+    return index * 2 + (1 if isBlack else 0)
+
+@nb.njit(cache=True)
+def _setup(material: np.ndarray, squares: np.ndarray, board: np.ndarray) -> bool:
+    """
+    places pieces on empty board, returns False if two pieces share a square or kings touch (never for decoded indices)
+    """
+    board[:, :] = 0
+    for i in range(len(material)):
+        y, x = squares[i] // 8, squares[i] % 8
+        if board[y, x] != 0:
+            return False
+        board[y, x] = material[i]
+
+    # material starts with both kings
+    return max(abs(squares[0] // 8 - squares[1] // 8), abs(squares[0] % 8 - squares[1] % 8)) > 1
+
+@nb.njit(cache=True)
+def _resolve(material: np.ndarray, sub_tables: np.ndarray, values: np.ndarray, index: int, depth: int, board: np.ndarray, squares: np.ndarray, child: np.ndarray) -> int:
+    """
+    value of position `index` if it is resolved at `depth` plies, 0 if it is not (yet)
+    """
+    isBlack = _decode(index, squares)
+    _setup(material, squares, board)
+    attacked, targets, pins, king_x, king_y = king_safety(board, isBlack)
+
+    best_loss = 1 << 30  # shortest mate among children lost by the opponent
+    worst_win = -1       # longest mate among children won by the opponent
+    all_wins = True
+
+    for i in range(len(material)):
+        if (material[i] > 0) != isBlack:
+            continue
+        x, y = squares[i] % 8, squares[i] // 8
+        moves = filter_legal_moves(board, x, y, legal_moves(board, x, y), attacked, targets, pins, king_x, king_y)
+
+        for y2 in range(8):
+            for x2 in range(8):
+                if moves[y2, x2] == 0:
+                    continue
+
+                child[:] = squares
+                child[i] = y2 * 8 + x2
+                if board[y2, x2] != 0:
+                    captured = 0
+                    for j in range(len(material)):
+                        if j != i and squares[j] == y2 * 8 + x2:
+                            captured = j
+                    value = sub_tables[captured, _sub_index(child, captured, not isBlack)]
+                else:
+                    value = values[position_index(child, not isBlack)]
+
+                if value < 0 and value != TB_INVALID:
+                    best_loss = min(best_loss, TB_MATE + value)
+                    all_wins = False
+                elif value > 0:
+                    worst_win = max(worst_win, TB_MATE - value)
+                else:
+                    # draw or not resolved yet
+                    all_wins = False
+
+    if best_loss + 1 == depth:
+        return TB_MATE - depth
+    if all_wins and worst_win + 1 == depth:
+        return depth - TB_MATE
+    return 0
+
+@nb.njit(cache=True)
+def _initial_values(material: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    marks invalid positions, mates and stalemates, returns values and indices of positions to resolve
+    """
+    size = _table_size(len(material))
+    values = np.zeros(size, dtype=np.int16)
+    pending = np.zeros(size, dtype=np.bool_)
+
+    board = np.zeros((8, 8), dtype=np.int8)
+    squares = np.zeros(len(material), dtype=np.int64)
+
+    for index in range(size):
+        isBlack = _decode(index, squares)
+        if not _setup(material, squares, board) or is_in_check(board, not isBlack):
+            values[index] = TB_INVALID
+            continue
+
+        attacked, targets, pins, king_x, king_y = king_safety(board, isBlack)
+        has_move = False
+        for i in range(len(material)):
+            if (material[i] > 0) != isBlack:
+                continue
+            x, y = squares[i] % 8, squares[i] // 8
+            moves = filter_legal_moves(board, x, y, legal_moves(board, x, y), attacked, targets, pins, king_x, king_y)
+            if np.any(moves != 0):
+                has_move = True
+                break
+
+        if has_move:
+            pending[index] = True
+        elif attacked[king_y, king_x]:
+            values[index] = -TB_MATE # checkmated
+
+    return values, np.flatnonzero(pending)
+
+@nb.njit(cache=True, parallel=True)
+def _resolve_pass(material: np.ndarray, sub_tables: np.ndarray, values: np.ndarray, pending: np.ndarray, depth: int) -> np.ndarray:
+    resolved = np.zeros(len(pending), dtype=np.int16)
+    for k in nb.prange(len(pending)):
+        board = np.zeros((8, 8), dtype=np.int8)
+        squares = np.zeros(len(material), dtype=np.int64)
+        child = np.zeros(len(material), dtype=np.int64)
+        resolved[k] = _resolve(material, sub_tables, values, pending[k], depth, board, squares, child)
+    return resolved
+
+def build_table(material: MaterialType, sub_tables: Dict[MaterialType, np.ndarray]) -> np.ndarray:
+    """
+    Builds table of given material, `sub_tables` must contain tables of every material with one piece captured
+    """
+    sub_materials = _sub_materials(material)
+    stacked = np.zeros((len(material), _table_size(len(material) - 1)), dtype=np.int16)
+    for i, sub in enumerate(sub_materials):
+        if sub is not None:
+            stacked[i] = sub_tables[sub]
+
+    values, pending = _initial_values(np.array(material, dtype=np.int8))
+
+    # captures can lead to mates longer than anything resolved in this table so far
+    valid = stacked[stacked != TB_INVALID]
+    longest_sub_mate = int((TB_MATE - np.abs(valid[valid != 0].astype(np.int64))).max(initial=0))
+
+    depth = 1
+    while len(pending) > 0:
+        resolved = _resolve_pass(np.array(material, dtype=np.int8), stacked, values, pending, depth)
+        done = resolved != 0
+        values[pending[done]] = resolved[done]
+        pending = pending[~done]
+
+        if not done.any() and depth > longest_sub_mate + 1 and depth > 1:
+            # nothing resolved at this depth and nothing deeper can follow, the rest are draws
+            break
+        depth += 1
+
+    return values
+
+def build_tables(names: Iterable[str], directory: str, verbose: bool = True) -> List[str]:
+    """
+    Builds tables (and all tables they depend on) into `directory`, skips tables that already exist.
+    Returns paths of built tables.
+    """
+    os.makedirs(directory, exist_ok=True)
+    tables: Dict[MaterialType, np.ndarray] = {}
+    built = []
+
+    def build(material: MaterialType) -> np.ndarray:
+        if material in tables:
+            return tables[material]
+
+        path = os.path.join(directory, f"{material_name(material)}.npy")
+        if os.path.exists(path):
+            tables[material] = np.load(path, mmap_mode='r')
+            return tables[material]
+
+        if len(material) == 2:
+            # bare kings, nothing can be won
+            sub_tables = {}
+        else:
+            sub_tables = {sub: build(sub) for sub in _sub_materials(material) if sub is not None}
+
+        if verbose:
+            print(f"building {material_name(material)}")
+        values = build_table(material, sub_tables)
+        np.save(path, values)
+        built.append(path)
+
+        tables[material] = values
+        return values
+
+    for name in names:
+        build(parse_material(name))
+
+    return built
+
+
+def wdl(values: np.ndarray) -> np.ndarray:
+    """
+    1 win, 0 draw (or invalid), -1 loss for the side to move
+    """
+    values = np.asarray(values)
+    return np.where(values == TB_INVALID, 0, np.sign(values)).astype(np.int8)
+
+def dtm(values: np.ndarray) -> np.ndarray:
+    """
+    plies to mate (won or lost), -1 for draws and invalid positions
+    """
+    values = np.asarray(values).astype(np.int32)
+    plies = TB_MATE - np.abs(values)
+    return np.where((values == 0) | (values == TB_INVALID), -1, plies)
+
+
+class Tablebase:
+    """
+    Lookups into tables saved by `build_tables`, tables are memory mapped when first needed
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.tables: Dict[MaterialType, Optional[np.ndarray]] = {}
+
+    def table(self, material: MaterialType) -> Optional[np.ndarray]:
+        if material not in self.tables:
+            path = os.path.join(self.directory, f"{material_name(material)}.npy")
+            self.tables[material] = np.load(path, mmap_mode='r') if os.path.exists(path) else None
+        return self.tables[material]
+
+    def probe_batch(self, boards: np.ndarray, isBlack) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Values of positions (N, 8, 8) for side to move `isBlack` (one color or one per board).
+        Returns values (N,) int16 (see module docs) and found (N,) - False if table is missing
+        (values are 0 then)
+        """
+        flat = np.asarray(boards, dtype=np.int8).reshape(-1, 64)
+        n = len(flat)
+        isBlack = np.broadcast_to(np.asarray(isBlack, dtype=np.bool_), (n,))
+
+        values = np.zeros(n, dtype=np.int16)
+        found = np.zeros(n, dtype=np.bool_)
+
+        # group boards by material
+        groups: Dict[MaterialType, List[int]] = {}
+        for i, board in enumerate(flat):
+            pieces = board[board != 0]
+            if np.count_nonzero(pieces == 6) != 1 or np.count_nonzero(pieces == -6) != 1:
+                continue
+            groups.setdefault(material_key(pieces), []).append(i)
+
+        for material, rows in groups.items():
+            table = self.table(material)
+            if table is None:
+                continue
+            rows = np.array(rows)
+
+            # squares of pieces in material order, same kind pieces in any order (table has all of them)
+            order = np.argsort(flat[rows], axis=1, kind='stable')
+            sorted_pieces = np.take_along_axis(flat[rows], order, axis=1)
+            squares = order[:, sorted_pieces[0] != 0]
+            kinds = sorted_pieces[0][sorted_pieces[0] != 0]
+            squares = squares[:, np.argsort(np.array([material.index(k) for k in kinds]), kind='stable')]
+
+            index = position_indices(squares.astype(np.int64), isBlack[rows])
+
+            # touching kings are not in the table
+            values[rows] = np.where(index >= 0, table[np.maximum(index, 0)], TB_INVALID)
+            found[rows] = True
+
+        return values, found
+
+    def probe(self, board: np.ndarray, isBlack: bool) -> Optional[int]:
+        values, found = self.probe_batch(board[np.newaxis], isBlack)
+        return int(values[0]) if found[0] else None
+
+    def best_action(self, board: np.ndarray, isBlack: bool) -> Optional[int]:
+        """
+        Action (`move_to_int`) of the strictly legal move with the best value, None if position is not in
+        the tablebase or there are no legal moves. Wins as fast as possible, loses as slow as possible.
+        """
+        if self.probe(board, isBlack) is None:
+            return None
+
+        attacked, targets, pins, king_x, king_y = king_safety(board, isBlack)
+        actions, children = [], []
+        for y, x in np.argwhere(((board > 0) == isBlack) & (board != 0)):
+            moves = filter_legal_moves(board, x, y, legal_moves(board, x, y), attacked, targets, pins, king_x, king_y)
+            for y2, x2 in np.argwhere(moves != 0):
+                child = board.copy()
+                child[y2, x2] = child[y, x]
+                child[y, x] = 0
+                actions.append(move_to_int(x, y, x2, y2))
+                children.append(child)
+
+        if len(actions) == 0:
+            return None
+
+        values, _ = self.probe_batch(np.array(children), not isBlack)
+        # child value is from the opponent point of view, smallest is best (draws when table is missing)
+        return actions[int(np.argmin(values.astype(np.int32)))]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="builds endgame tablebases")
+    parser.add_argument("directory", type=str, help="where to save tables")
+    parser.add_argument("materials", type=str, nargs='+', help="materials to build, white pieces uppercase, e.g. KQvk KRvkn")
+
+    args = parser.parse_args()
+
+    build_tables(args.materials, args.directory)
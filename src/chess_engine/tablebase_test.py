@@ -0,0 +1,129 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from . import tablebase
+from .diagchess import piece, legal_moves, king_safety, filter_legal_moves, is_in_check, int_action_to_move
+from .tablebase import Tablebase, TB_MATE, TB_INVALID
+
+
+class TablebaseTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        tablebase.build_tables(['KQvk'], cls.directory.name, verbose=False)
+        cls.tablebase = Tablebase(cls.directory.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def children(self, board, isBlack):
+        attacked, targets, pins, king_x, king_y = king_safety(board, isBlack)
+        children = []
+        for y, x in np.argwhere(((board > 0) == isBlack) & (board != 0)):
+            moves = filter_legal_moves(board, x, y, legal_moves(board, x, y), attacked, targets, pins, king_x, king_y)
+            for y2, x2 in np.argwhere(moves != 0):
+                child = board.copy()
+                child[y2, x2] = child[y, x]
+                child[y, x] = 0
+                children.append(child)
+        return children
+
+    def test_material_names(self):
+        material = tablebase.parse_material('KQvkr')
+        self.assertEqual(material, (-6, 6, -5, 2))
+        self.assertEqual(tablebase.material_name(material), 'KQvkr')
+
+    def test_position_index(self):
+        material = (-6, 6, -5, 2)
+        size = tablebase.table_size(material)
+        self.assertEqual(size, len(tablebase.KING_PAIRS) * 62 * 61 * 2)
+
+        rng = np.random.default_rng(0)
+        squares = np.zeros(len(material), dtype=np.int64)
+        for index in rng.choice(size, size=1000, replace=False):
+            isBlack = tablebase._decode(index, squares)
+            # decoded placements are always valid and index back to themselves
+            self.assertEqual(len(set(squares)), len(material))
+            self.assertTrue(tablebase._setup(np.array(material, dtype=np.int8), squares, np.zeros((8, 8), dtype=np.int8)))
+            self.assertEqual(tablebase.position_index(squares, isBlack), index)
+
+            # without a captured piece it is the index in the sub material table
+            for captured in (2, 3):
+                sub_squares = np.delete(squares, captured)
+                self.assertEqual(tablebase._sub_index(squares, captured, isBlack),
+                                 tablebase.position_index(sub_squares, isBlack))
+
+        # kings next to each other are not indexed
+        self.assertEqual(tablebase.position_index(np.array([0, 9, 20, 30]), False), -1)
+        self.assertEqual(tablebase.position_index(np.array([0, 20, 20, 30]), False), -1)
+
+    def test_checkmate(self):
+        board = np.zeros((8, 8), dtype=np.int8)
+        board[0, 0] = piece("KING")
+        board[1, 1] = piece("queen")
+        board[2, 2] = piece("king")
+
+        self.assertEqual(self.tablebase.probe(board, True), -TB_MATE)
+
+        # white mates in one
+        board[1, 1] = 0
+        board[5, 1] = piece("queen")
+        self.assertEqual(self.tablebase.probe(board, False), TB_MATE - 1)
+
+        action = self.tablebase.best_action(board, False)
+        x1, y1, x2, y2 = int_action_to_move(action)
+        board[y2, x2] = board[y1, x1]
+        board[y1, x1] = 0
+        self.assertEqual(self.tablebase.probe(board, True), -TB_MATE)
+
+    def test_values_match_children(self):
+        table = self.tablebase.table((-6, 6, -5))
+        rng = np.random.default_rng(0)
+        indices = rng.choice(np.flatnonzero(table != TB_INVALID), size=300, replace=False)
+
+        squares = np.zeros(3, dtype=np.int64)
+        for index in indices:
+            isBlack = tablebase._decode(index, squares)
+            board = np.zeros((8, 8), dtype=np.int8)
+            for square, kind in zip(squares, (-6, 6, -5)):
+                board[square // 8, square % 8] = kind
+
+            value = int(table[index])
+            self.assertEqual(self.tablebase.probe(board, isBlack), value)
+
+            children = self.children(board, isBlack)
+            if len(children) == 0:
+                self.assertEqual(value, -TB_MATE if is_in_check(board, isBlack) else 0)
+                continue
+
+            child_values, found = self.tablebase.probe_batch(np.array(children), not isBlack)
+            self.assertTrue(found.all())
+            child_values = child_values.astype(np.int32)
+
+            if value > 0:
+                self.assertEqual(value, TB_MATE - (TB_MATE + child_values.min()) - 1)
+            elif value < 0:
+                self.assertTrue((child_values > 0).all())
+                self.assertEqual(value, (TB_MATE - child_values.min()) + 1 - TB_MATE)
+            else:
+                self.assertFalse((child_values < 0).any())
+                self.assertFalse((child_values > 0).all())
+
+    def test_missing_table(self):
+        boards = np.zeros((2, 8, 8), dtype=np.int8)
+        boards[:, 0, 0] = piece("KING")
+        boards[:, 7, 7] = piece("king")
+        boards[0, 4, 4] = piece("queen")
+        boards[1, 4, 4] = piece("rook")
+
+        values, found = self.tablebase.probe_batch(boards, False)
+        self.assertTrue(found[0])
+        self.assertFalse(found[1])
+        self.assertEqual(values[1], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+"""
+Diagonal chess engine written in tensorflow ops, so whole episodes can run inside one graph
+(see `run_episodes_in_graph` in `reinforce/data_collector.py`).
+
+Boards are batched int8 tensors (N, 8, 8). Uses the same gather tables as `numpy_backend.py`,
+targets are accumulated with one-hot einsums instead of scatters, so all shapes are static
+and functions can be XLA compiled.
+"""
+from typing import Tuple
+import numpy as np
+import tensorflow as tf
+
+from .constants import (WRONG_PIECE_COLOR_PENALTY, ILLEGAL_MOVE_PENALTY_1, ILLEGAL_MOVE_PENALTY_2, LEGAL_MOVE_REWARD,
+                        CAPTURE_REWARDS)
+from . import numpy_backend
+
+def _one_hot_targets(table: np.ndarray) -> tf.Tensor:
+    # (..., 65) one-hot of target squares, OFF_BOARD column is dropped later
+    return tf.constant(np.eye(65, dtype=np.float32)[table])
+
+SLIDER_ONE_HOT = _one_hot_targets(numpy_backend.SLIDER_RAYS)          # (64, 8, 7, 65)
+KNIGHT_ONE_HOT = _one_hot_targets(numpy_backend.KNIGHT_TARGETS)       # (64, 8, 65)
+KING_ONE_HOT = _one_hot_targets(numpy_backend.KING_TARGETS)           # (64, 8, 65)
+PAWN_PUSH_ONE_HOT = _one_hot_targets(numpy_backend.PAWN_PUSH)         # (2, 64, 2, 2, 65)
+PAWN_CAPTURE_ONE_HOT = _one_hot_targets(numpy_backend.PAWN_CAPTURE)   # (2, 64, 3, 65)
+
+SLIDER_RAYS = tf.constant(numpy_backend.SLIDER_RAYS, dtype=tf.int32)
+KNIGHT_TARGETS = tf.constant(numpy_backend.KNIGHT_TARGETS, dtype=tf.int32)
+KING_TARGETS = tf.constant(numpy_backend.KING_TARGETS, dtype=tf.int32)
+PAWN_PUSH = tf.constant(numpy_backend.PAWN_PUSH, dtype=tf.int32)
+PAWN_CAPTURE = tf.constant(numpy_backend.PAWN_CAPTURE, dtype=tf.int32)
+KING_NEAR = tf.constant(numpy_backend.KING_NEAR, dtype=tf.float32)
+SLIDER_PIECE_DIRECTIONS = tf.constant(numpy_backend.SLIDER_PIECE_DIRECTIONS)
+START_SQUARES = tf.constant(numpy_backend.START_BOARD.reshape(-1), dtype=tf.int32)
+CAPTURE_REWARDS_TABLE = tf.constant(CAPTURE_REWARDS, dtype=tf.int32)
+
+OFF_BOARD = numpy_backend.OFF_BOARD
+
+
+def start_boards(n: int) -> tf.Tensor:
+    return tf.tile(tf.constant(numpy_backend.START_BOARD)[tf.newaxis], (n, 1, 1))
+
+def _flat(boards: tf.Tensor) -> tf.Tensor:
+    return tf.reshape(tf.cast(boards, tf.int32), (-1, 64))
+
+def _gather(padded: tf.Tensor, table: tf.Tensor) -> tf.Tensor:
+    """
+    padded (N, 65) board values, table (64, ...) of square indices -> (N, 64, ...)
+    """
+    return tf.gather(padded, table, axis=1)
+
+def _enemy(occupied: tf.Tensor, black: tf.Tensor) -> tf.Tensor:
+    for _ in range(occupied.shape.rank - 2):
+        black = black[..., tf.newaxis]
+    return tf.not_equal(occupied, 0) & tf.not_equal(occupied > 0, black)
+
+def legal_moves_batch(boards: tf.Tensor) -> tf.Tensor:
+    """
+    Returns boolean move tables (N, 64, 64) `moves[n, from, to]`, squares indexed as `y * 8 + x`
+    (same moves as `legal_moves` in `diagchess.py`)
+    """
+    flat = _flat(boards)
+    padded = tf.pad(flat, [[0, 0], [0, 1]])
+
+    kind = tf.abs(flat)
+    black = flat > 0
+
+    # rooks, bishops, queens, walk the rays until the first occupied square
+    occupied = _gather(padded, SLIDER_RAYS)
+    free = tf.equal(occupied, 0) & tf.not_equal(SLIDER_RAYS, OFF_BOARD)
+    clear_before = tf.math.cumprod(tf.cast(free, tf.int32), axis=-1, exclusive=True) > 0
+    reach = clear_before & (free | _enemy(occupied, black))
+    reach &= tf.gather(SLIDER_PIECE_DIRECTIONS, kind)[..., tf.newaxis]
+    moves = tf.einsum('nsdk,sdkt->nst', tf.cast(reach, tf.float32), SLIDER_ONE_HOT)
+
+    # knights
+    occupied = _gather(padded, KNIGHT_TARGETS)
+    reach = tf.not_equal(KNIGHT_TARGETS, OFF_BOARD) & (tf.equal(occupied, 0) | _enemy(occupied, black))
+    reach &= tf.equal(kind, 3)[..., tf.newaxis]
+    moves += tf.einsum('nsi,sit->nst', tf.cast(reach, tf.float32), KNIGHT_ONE_HOT)
+
+    # kings, can not step next to the opponent king
+    near_black = tf.pad(tf.matmul(tf.cast(tf.equal(flat, 6), tf.float32), KING_NEAR) > 0, [[0, 0], [0, 1]])
+    near_white = tf.pad(tf.matmul(tf.cast(tf.equal(flat, -6), tf.float32), KING_NEAR) > 0, [[0, 0], [0, 1]])
+    forbidden = tf.where(black[..., tf.newaxis], _gather(near_white, KING_TARGETS), _gather(near_black, KING_TARGETS))
+
+    occupied = _gather(padded, KING_TARGETS)
+    reach = tf.not_equal(KING_TARGETS, OFF_BOARD) & (tf.equal(occupied, 0) | _enemy(occupied, black)) & ~forbidden
+    reach &= tf.equal(kind, 6)[..., tf.newaxis]
+    moves += tf.einsum('nsi,sit->nst', tf.cast(reach, tf.float32), KING_ONE_HOT)
+
+    # pawns, color 0 are black (positive) pawns, color 1 white ones
+    at_start = tf.equal(flat, START_SQUARES)
+    for color, is_color in enumerate((black, ~black)):
+        is_pawn = tf.equal(kind, 1) & is_color
+
+        occupied = _gather(padded, PAWN_PUSH[color])
+        free = tf.equal(occupied, 0) & tf.not_equal(PAWN_PUSH[color], OFF_BOARD)
+        one_step = free[..., 0] & is_pawn[..., tf.newaxis]
+        two_steps = free[..., 0] & free[..., 1] & (at_start & is_pawn)[..., tf.newaxis]
+        reach = tf.stack([one_step, two_steps], axis=-1)
+        moves += tf.einsum('nslk,slkt->nst', tf.cast(reach, tf.float32), PAWN_PUSH_ONE_HOT[color])
+
+        occupied = _gather(padded, PAWN_CAPTURE[color])
+        reach = tf.not_equal(PAWN_CAPTURE[color], OFF_BOARD) & _enemy(occupied, black) & is_pawn[..., tf.newaxis]
+        moves += tf.einsum('nsi,sit->nst', tf.cast(reach, tf.float32), PAWN_CAPTURE_ONE_HOT[color])
+
+    return moves[:, :, :64] > 0
+
+def _side_moves(flat: tf.Tensor, moves: tf.Tensor, isBlack: tf.Tensor) -> tf.Tensor:
+    isBlack = tf.broadcast_to(tf.cast(isBlack, tf.bool), tf.shape(flat)[:1])
+    side = tf.not_equal(flat, 0) & tf.equal(flat > 0, isBlack[:, tf.newaxis])
+    return moves & side[..., tf.newaxis]
+
+def moves_to_actions(moves: tf.Tensor) -> tf.Tensor:
+    """
+    (N, 64, 64) tables indexed by `y * 8 + x` squares -> (N, 4096) indexed by `move_to_int` actions
+    """
+    moves = tf.reshape(moves, (-1, 8, 8, 8, 8))
+    return tf.reshape(tf.transpose(moves, (0, 2, 1, 4, 3)), (-1, 4096))
+
+def _observation(flat: tf.Tensor, moves: tf.Tensor) -> tf.Tensor:
+    planes = [tf.cast(tf.equal(flat, -(i + 1)), tf.float32) - tf.cast(tf.equal(flat, i + 1), tf.float32) for i in range(6)]
+
+    values = tf.cast(flat, tf.float32)
+    moves = tf.cast(moves, tf.float32)
+    for weights in (tf.maximum(values, 0), tf.minimum(values, 0)):
+        attacks = tf.einsum('ns,nst->nt', weights, moves)
+        # wrap around like int8 accumulation in `all_legal_moves`
+        planes.append(tf.cast(tf.cast(tf.cast(attacks, tf.int32), tf.int8), tf.float32))
+
+    return tf.reshape(tf.stack(planes, axis=-1), (-1, 8, 8, 8))
+
+def board_to_observation_batch(boards: tf.Tensor) -> tf.Tensor:
+    flat = _flat(boards)
+    return _observation(flat, legal_moves_batch(boards))
+
+def legal_moves_mask_batch(boards: tf.Tensor, isBlack) -> tf.Tensor:
+    """
+    Returns boolean masks (N x 4096) of legal moves for given boards and colors
+    """
+    flat = _flat(boards)
+    return moves_to_actions(_side_moves(flat, legal_moves_batch(boards), isBlack))
+
+def board_to_observation_and_mask_batch(boards: tf.Tensor, isBlack) -> Tuple[tf.Tensor, tf.Tensor]:
+    flat = _flat(boards)
+    moves = legal_moves_batch(boards)
+    return _observation(flat, moves), moves_to_actions(_side_moves(flat, moves, isBlack))
+
+def _choose(mask: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+    """
+    picks uniformly one True index in each row, returns indices and whether row had any True
+    """
+    keys = tf.where(mask, tf.random.uniform(tf.shape(mask)), -1.0)
+    return tf.argmax(keys, axis=-1, output_type=tf.int32), tf.reduce_any(mask, axis=-1)
+
+def make_move_from_action_batch(boards: tf.Tensor, actions: tf.Tensor, isBlack) -> Tuple[tf.Tensor, tf.Tensor, tf.Tensor]:
+    """
+    Applies actions to boards with the same rules as `make_a_move`: illegal moves are replaced with legal ones
+    and penalized. Returns new boards (N, 8, 8) int8, dones (N,) bool and rewards (N,) float32
+    """
+    flat = _flat(boards)
+    isBlack = tf.broadcast_to(tf.cast(isBlack, tf.bool), tf.shape(flat)[:1])
+    actions = tf.cast(actions, tf.int32)
+
+    x1 = (actions // 512) % 8
+    y1 = (actions // 64) % 8
+    x2 = (actions // 8) % 8
+    y2 = actions % 8
+    from_squares = y1 * 8 + x1
+    to_squares = y2 * 8 + x2
+
+    moves = legal_moves_batch(boards)
+    side_moves = _side_moves(flat, moves, isBlack)
+
+    # random legal move, random piece that can move and then its random target
+    random_from, any_move = _choose(tf.reduce_any(side_moves, axis=2))
+    random_to, _ = _choose(tf.gather(side_moves, random_from, batch_dims=1))
+
+    piece_moves = tf.gather(moves, from_squares, batch_dims=1)
+    random_target, has_target = _choose(piece_moves)
+
+    wrong_color = tf.not_equal(tf.gather(flat, from_squares, batch_dims=1) > 0, isBlack)
+    legal = ~wrong_color & tf.gather(piece_moves, to_squares, batch_dims=1)
+    other_target = ~wrong_color & ~legal & has_target
+    fallback = ~(legal | other_target)
+
+    move_from = tf.where(fallback, random_from, from_squares)
+    move_to = tf.where(fallback, random_to, tf.where(other_target, random_target, to_squares))
+
+    rewards = tf.where(wrong_color, WRONG_PIECE_COLOR_PENALTY,
+              tf.where(legal, LEGAL_MOVE_REWARD,
+              tf.where(other_target, ILLEGAL_MOVE_PENALTY_1, ILLEGAL_MOVE_PENALTY_2)))
+
+    # no legal moves, game over
+    dones = fallback & ~any_move
+    play = ~dones
+
+    moved_piece = tf.gather(flat, move_from, batch_dims=1)
+    captured = tf.gather(flat, move_to, batch_dims=1)
+    rewards = tf.where(play, rewards + tf.gather(CAPTURE_REWARDS_TABLE, captured + 6), 0)
+
+    to_one_hot = (tf.one_hot(move_to, 64) > 0) & play[:, tf.newaxis]
+    from_one_hot = (tf.one_hot(move_from, 64) > 0) & play[:, tf.newaxis]
+    flat = tf.where(to_one_hot, moved_piece[:, tf.newaxis], flat)
+    flat = tf.where(from_one_hot, 0, flat)
+
+    return tf.reshape(tf.cast(flat, tf.int8), (-1, 8, 8)), dones, tf.cast(rewards, tf.float32)
@@ -0,0 +1,97 @@
+import unittest
+
+import numpy as np
+
+from . import numpy_backend
+from .numpy_backend_test import random_boards
+
+try:
+    import tensorflow as tf
+    from . import tf_engine
+    from reinforce.masking import pack_mask, unpack_mask, legal_argmax, legal_softmax, csr_row_ids, factored_argmax
+except ImportError:
+    tf_engine = None
+
+
+@unittest.skipIf(tf_engine is None, "tensorflow is not installed")
+class TFEngineTests(unittest.TestCase):
+    def setUp(self):
+        self.boards = random_boards(300, np.random.default_rng(1))
+
+    def test_moves_match_numpy_backend(self):
+        moves = tf_engine.legal_moves_batch(tf.constant(self.boards)).numpy()
+        self.assertTrue(np.array_equal(moves, numpy_backend.legal_moves_batch(self.boards)))
+
+    def test_observation_and_mask(self):
+        isBlack = np.arange(len(self.boards)) % 2 == 1
+        observations, masks = tf_engine.board_to_observation_and_mask_batch(tf.constant(self.boards), tf.constant(isBlack))
+        expected_observations, expected_masks = numpy_backend.board_to_observation_and_mask_batch(self.boards, isBlack)
+
+        self.assertTrue(np.array_equal(observations.numpy(), expected_observations))
+        self.assertTrue(np.array_equal(masks.numpy(), expected_masks.astype(np.bool_)))
+
+    def test_legal_move_application(self):
+        isBlack = np.arange(len(self.boards)) % 2 == 1
+        masks = numpy_backend.get_legal_moves_mask_batch(self.boards, isBlack)
+        has_moves = masks.any(axis=1)
+
+        boards = self.boards[has_moves]
+        isBlack = isBlack[has_moves]
+        actions = np.array([np.random.choice(np.flatnonzero(mask)) for mask in masks[has_moves]])
+
+        new_boards, dones, rewards = tf_engine.make_move_from_action_batch(tf.constant(boards), tf.constant(actions), tf.constant(isBlack))
+        expected_dones, expected_rewards = numpy_backend.make_move_from_action_batch(boards, actions, isBlack)
+
+        self.assertTrue(np.array_equal(new_boards.numpy(), boards))
+        self.assertTrue(np.array_equal(dones.numpy(), expected_dones))
+        self.assertTrue(np.array_equal(rewards.numpy(), expected_rewards.astype(np.float32)))
+
+    def test_unpack_mask(self):
+        masks = numpy_backend.get_legal_moves_mask_batch(self.boards, False)
+        packed = numpy_backend.get_legal_moves_mask_batch(self.boards, False, packed=True)
+
+        self.assertTrue(np.array_equal(unpack_mask(tf.constant(packed)).numpy(), masks.astype(np.float32)))
+        self.assertTrue(np.array_equal(pack_mask(tf.constant(masks)).numpy(), packed))
+
+    def test_factored_argmax(self):
+        isBlack = np.arange(len(self.boards)) % 2 == 1
+        from_masks, to_masks = numpy_backend.get_factored_legal_moves_mask_batch(self.boards, isBlack)
+        rng = np.random.default_rng(3)
+        from_logits = rng.normal(size=(len(self.boards), 8, 8)).astype(np.float32)
+        to_logits = rng.normal(size=(len(self.boards), 8, 8)).astype(np.float32)
+
+        actions = factored_argmax(tf.constant(from_logits), tf.constant(to_logits), tf.constant(from_masks), tf.constant(to_masks)).numpy()
+
+        for i in range(len(self.boards)):
+            if not from_masks[i].any():
+                self.assertEqual(actions[i], 0)
+                continue
+            from_square = np.argmax(np.where(from_masks[i] != 0, from_logits[i].ravel(), -np.inf))
+            targets = np.unpackbits(to_masks[i, from_square]) != 0
+            to_square = np.argmax(np.where(targets, to_logits[i].ravel(), -np.inf))
+            self.assertEqual(actions[i], (from_square % 8) * 512 + (from_square // 8) * 64 + (to_square % 8) * 8 + to_square // 8)
+
+    def test_csr_helpers(self):
+        isBlack = np.arange(len(self.boards)) % 2 == 1
+        masks = numpy_backend.get_legal_moves_mask_batch(self.boards, isBlack).astype(np.bool_)
+        offsets, actions = numpy_backend.legal_moves_csr_batch(self.boards, isBlack)
+        logits = np.random.default_rng(2).normal(size=masks.shape).astype(np.float32)
+
+        masked = np.where(masks, logits, -np.inf)
+        expected_actions = np.where(masks.any(axis=1), masked.argmax(axis=1), 0)
+        self.assertTrue(np.array_equal(legal_argmax(tf.constant(logits), offsets, actions).numpy(), expected_actions))
+
+        probs = legal_softmax(tf.constant(logits), offsets, actions).numpy()
+        expected = np.exp(masked - masked.max(axis=1, keepdims=True))
+        expected = expected / expected.sum(axis=1, keepdims=True)
+        rows = csr_row_ids(offsets).numpy()
+        self.assertTrue(np.allclose(probs, expected[rows, actions], atol=1e-6))
+
+    def test_legal_argmax_without_moves(self):
+        logits = tf.zeros((2, 4096))
+        actions = legal_argmax(logits, tf.constant([0, 0, 0], dtype=tf.int64), tf.zeros((0,), dtype=tf.int32))
+        self.assertTrue(np.array_equal(actions.numpy(), [0, 0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
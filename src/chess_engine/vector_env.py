@@ -0,0 +1,242 @@
+import multiprocessing as mp
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import gym
+import numpy as np
+from gym.vector import VectorEnv
+
+from . import DiagonalChess, internal
+
+OBSERVATION_SHAPE = (8, 8, 8)
+N_ACTIONS = 4096
+
+# how often a waiting parent checks that workers are still alive (seconds)
+_POLL_INTERVAL = 0.1
+
+
+def _shared_buffer(ctx, shape: Tuple[int, ...], dtype) -> Tuple[Any, np.ndarray]:
+    """
+    allocates raw shared memory and returns it with numpy view of it
+    """
+    dtype = np.dtype(dtype)
+    raw = ctx.RawArray('b', int(np.prod(shape)) * dtype.itemsize)
+    return raw, _view(raw, shape, dtype)
+
+def _view(raw, shape: Tuple[int, ...], dtype) -> np.ndarray:
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+def _worker(index: int, pipe, parent_pipe, raw_buffers: Dict[str, Any], num_envs: int, auto_reset: bool):
+    """
+    Worker loop. Commands and acknowledgements go through the pipe,
+    actions, observations, masks, rewards and dones are read/written in shared memory.
+    """
+    parent_pipe.close()
+
+    actions = _view(raw_buffers['actions'], (num_envs,), np.int32)
+    observations = _view(raw_buffers['observations'], (num_envs, *OBSERVATION_SHAPE), np.float32)
+    masks = _view(raw_buffers['masks'], (num_envs, N_ACTIONS), np.int8)
+    rewards = _view(raw_buffers['rewards'], (num_envs,), np.float32)
+    dones = _view(raw_buffers['dones'], (num_envs,), np.bool_)
+    final_observations = _view(raw_buffers['final_observations'], (num_envs, *OBSERVATION_SHAPE), np.float32)
+    final_masks = _view(raw_buffers['final_masks'], (num_envs, N_ACTIONS), np.int8)
+
+    env = DiagonalChess()
+
+    try:
+        while True:
+            command, data = pipe.recv()
+
+            if command == 'reset':
+                if data is not None:
+                    internal.seed(data)
+                observations[index], masks[index] = env.reset_with_mask()
+                rewards[index] = 0
+                dones[index] = False
+            elif command == 'step':
+                observation, mask, reward, done = env.step_with_mask(int(actions[index]))
+
+                if done and auto_reset:
+                    # last position of the game is kept for the learner before the reset overwrites it
+                    final_observations[index] = observation
+                    final_masks[index] = mask
+                    observation, mask = env.reset_with_mask()
+
+                observations[index] = observation
+                masks[index] = mask
+                rewards[index] = reward
+                dones[index] = done
+            elif command == 'close':
+                pipe.send((True, None))
+                break
+            else:
+                raise RuntimeError(f"unknown command: {command}")
+
+            pipe.send((True, None))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        pipe.send((False, repr(e)))
+    finally:
+        pipe.close()
+
+
+class AsyncVectorDiagonalChess(VectorEnv):
+    """
+    Runs `num_envs` DiagonalChess environments in worker processes.
+
+    Observations (N, 8, 8, 8), legal moves masks (N, 4096), rewards and dones live in shared memory,
+    so stepping sends only a command through the pipes and nothing gets pickled.
+    Follows the gym vector api: `reset` returns (observations, infos) and `step` returns
+    (observations, rewards, terminateds, truncateds, infos). Legal moves mask for the side to move
+    is available as `infos["action_mask"]` and `masks`.
+
+    With `auto_reset` environment that finished is reset in the same step,
+    returned observation and mask are then from the new game. Observation and mask of the position the game ended in
+    are in `infos["final_observation"]` and `infos["final_mask"]` (None for environments that did not finish,
+    `infos["_final_observation"]` marks the ones that did), as in gym vector environments.
+
+    Workers are started with `spawn` by default, forked children of a process that already initialized
+    TensorFlow (or any other threaded library) can deadlock. Scripts creating it need the usual
+    `if __name__ == '__main__':` guard for spawned workers. Waiting for workers raises if one of them dies
+    or does not answer within `timeout` seconds (None waits as long as they are alive).
+    """
+    def __init__(self, num_envs: int, auto_reset: bool = True, copy: bool = True, context: Optional[str] = 'spawn',
+                 timeout: Optional[float] = 300.0):
+        observation_space = gym.spaces.Box(low=-128, high=127, shape=OBSERVATION_SHAPE, dtype=np.float32)
+        action_space = gym.spaces.Discrete(N_ACTIONS)
+
+        super().__init__(num_envs, observation_space, action_space)
+
+        self.auto_reset = auto_reset
+        self.copy = copy
+        self.timeout = timeout
+
+        ctx = mp.get_context(context)
+
+        raw_actions, self.actions = _shared_buffer(ctx, (num_envs,), np.int32)
+        raw_observations, self.observations = _shared_buffer(ctx, (num_envs, *OBSERVATION_SHAPE), np.float32)
+        raw_masks, self.masks = _shared_buffer(ctx, (num_envs, N_ACTIONS), np.int8)
+        raw_rewards, self.rewards = _shared_buffer(ctx, (num_envs,), np.float32)
+        raw_dones, self.dones = _shared_buffer(ctx, (num_envs,), np.bool_)
+        raw_final_observations, self.final_observations = _shared_buffer(ctx, (num_envs, *OBSERVATION_SHAPE), np.float32)
+        raw_final_masks, self.final_masks = _shared_buffer(ctx, (num_envs, N_ACTIONS), np.int8)
+
+        raw_buffers = {
+            'actions': raw_actions,
+            'observations': raw_observations,
+            'masks': raw_masks,
+            'rewards': raw_rewards,
+            'dones': raw_dones,
+            'final_observations': raw_final_observations,
+            'final_masks': raw_final_masks,
+        }
+
+        self.parent_pipes = []
+        self.processes = []
+        for index in range(num_envs):
+            parent_pipe, child_pipe = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                name=f"DiagonalChessWorker-{index}",
+                args=(index, child_pipe, parent_pipe, raw_buffers, num_envs, auto_reset),
+                daemon=True,
+            )
+            process.start()
+            child_pipe.close()
+
+            self.parent_pipes.append(parent_pipe)
+            self.processes.append(process)
+
+    def _send(self, command: str, data: List[Any]):
+        for pipe, process, value in zip(self.parent_pipes, self.processes, data):
+            if not process.is_alive():
+                raise RuntimeError(f"{process.name} died with exit code {process.exitcode}")
+            pipe.send((command, value))
+
+    def _wait(self):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+
+        results = []
+        for pipe, process in zip(self.parent_pipes, self.processes):
+            while not pipe.poll(_POLL_INTERVAL):
+                if not process.is_alive():
+                    raise RuntimeError(f"{process.name} died with exit code {process.exitcode}")
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError(f"{process.name} did not answer in {self.timeout} seconds")
+            try:
+                results.append(pipe.recv())
+            except (EOFError, ConnectionError) as e:
+                raise RuntimeError(f"{process.name} closed its pipe: {e!r}")
+
+        errors = [error for ok, error in results if not ok]
+        if errors:
+            raise RuntimeError(f"worker failed: {errors[0]}")
+
+    def _infos(self) -> Dict[str, np.ndarray]:
+        masks = self.masks.copy() if self.copy else self.masks
+        return {'action_mask': masks, '_action_mask': np.ones(self.num_envs, dtype=np.bool_)}
+
+    def reset_async(self, seed: Optional[int] = None, options: Optional[dict] = None):
+        seeds = [None] * self.num_envs if seed is None else [seed + i for i in range(self.num_envs)]
+        self._send('reset', seeds)
+
+    def reset_wait(self, seed: Optional[int] = None, options: Optional[dict] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]: # type: ignore
+        self._wait()
+        observations = self.observations.copy() if self.copy else self.observations
+        return observations, self._infos()
+
+    def step_async(self, actions: np.ndarray):
+        self.actions[:] = actions
+        self._send('step', [None] * self.num_envs)
+
+    def step_wait(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, Dict[str, np.ndarray]]: # type: ignore
+        self._wait()
+
+        observations = self.observations.copy() if self.copy else self.observations
+        rewards = self.rewards.copy()
+        terminateds = self.dones.copy()
+        truncateds = np.zeros(self.num_envs, dtype=np.bool_)
+
+        infos = self._infos()
+        if self.auto_reset and terminateds.any():
+            final_observations = np.full(self.num_envs, None, dtype=object)
+            final_masks = np.full(self.num_envs, None, dtype=object)
+            for index in np.flatnonzero(terminateds):
+                final_observations[index] = self.final_observations[index].copy()
+                final_masks[index] = self.final_masks[index].copy()
+            infos.update({'final_observation': final_observations, '_final_observation': terminateds.copy(),
+                          'final_mask': final_masks, '_final_mask': terminateds.copy()})
+
+        return observations, rewards, terminateds, truncateds, infos
+
+    def close_extras(self, timeout: Optional[float] = None, terminate: bool = False):
+        if terminate:
+            for process in self.processes:
+                if process.is_alive():
+                    process.terminate()
+        else:
+            wait = self.timeout if timeout is None else timeout
+            for pipe, process in zip(self.parent_pipes, self.processes):
+                if not process.is_alive():
+                    continue
+                # a worker that hung or died does not answer, it is terminated instead of waited for
+                try:
+                    pipe.send(('close', None))
+                    answered = pipe.poll(wait)
+                    if answered:
+                        pipe.recv()
+                except (EOFError, ConnectionError):
+                    answered = False
+                if not answered and process.is_alive():
+                    process.terminate()
+                    process.join(wait)
+                    if process.is_alive():
+                        # stopped process does not act on SIGTERM
+                        process.kill()
+
+        for pipe in self.parent_pipes:
+            pipe.close()
+        for process in self.processes:
+            process.join(timeout)
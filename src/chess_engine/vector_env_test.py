@@ -0,0 +1,85 @@
+import os
+import signal
+import unittest
+
+import numpy as np
+
+from . import DiagonalChess, internal
+from .vector_env import AsyncVectorDiagonalChess
+
+
+class AsyncVectorDiagonalChessTests(unittest.TestCase):
+    def test_step_legal_moves(self):
+        envs = AsyncVectorDiagonalChess(3)
+        try:
+            observations, infos = envs.reset(seed=0)
+
+            start = internal.board_to_observation(internal.generate_start_board())
+            self.assertEqual(observations.shape, (3, 8, 8, 8))
+            for observation in observations:
+                self.assertTrue(np.array_equal(observation, start))
+
+            for _ in range(10):
+                masks = infos['action_mask']
+                actions = np.array([np.random.choice(np.flatnonzero(mask)) for mask in masks])
+
+                observations, rewards, terminateds, truncateds, infos = envs.step(actions)
+
+                self.assertEqual(observations.shape, (3, 8, 8, 8))
+                self.assertEqual(infos['action_mask'].shape, (3, 4096))
+                self.assertFalse(truncateds.any())
+                # every move was taken from the mask, so no penalties
+                self.assertTrue((rewards >= internal.LEGAL_MOVE_REWARD).all())
+        finally:
+            envs.close()
+
+    def test_final_observation(self):
+        # greedy game played on a local environment, replayed with the same (legal) actions
+        reference = DiagonalChess()
+        internal.seed(0)
+        reference.reset_with_mask()
+
+        envs = AsyncVectorDiagonalChess(1)
+        try:
+            envs.reset(seed=0)
+            for _ in range(1000):
+                action = reference.greedy_action()
+                observation, mask, reward, done = reference.step_with_mask(action)
+                observations, rewards, terminateds, _, infos = envs.step(np.array([action]))
+                if done:
+                    break
+                self.assertNotIn('final_observation', infos)
+                self.assertTrue(np.array_equal(observations[0], observation))
+
+            self.assertTrue(terminateds[0])
+            self.assertEqual(rewards[0], reward)
+            self.assertTrue(infos['_final_observation'][0])
+            self.assertTrue(np.array_equal(infos['final_observation'][0], observation))
+            self.assertTrue(np.array_equal(infos['final_mask'][0], mask))
+            # returned observation is already from the next game
+            self.assertTrue(np.array_equal(observations[0], internal.board_to_observation(internal.generate_start_board())))
+        finally:
+            envs.close()
+
+    def test_close_hung_worker(self):
+        envs = AsyncVectorDiagonalChess(2, timeout=60)
+        envs.reset(seed=0)
+        envs.timeout = 1
+        # stopped worker never answers the close command
+        os.kill(envs.processes[0].pid, signal.SIGSTOP)
+        envs.close()
+        self.assertFalse(any(process.is_alive() for process in envs.processes))
+
+    def test_dead_worker_raises(self):
+        envs = AsyncVectorDiagonalChess(2, timeout=60)
+        try:
+            envs.reset(seed=0)
+            envs.processes[1].kill()
+            envs.processes[1].join()
+            self.assertRaises(RuntimeError, envs.reset)
+        finally:
+            envs.close(terminate=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
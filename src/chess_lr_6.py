@@ -1,5 +1,9 @@
 import chess_engine
+from chess_engine.game_log import GameLog
+from chess_engine.opening_book import OpeningBook
+from chess_engine.render import image_summary
 from typing import List
+import os
 import gym
 import numpy as np
 import tensorflow as tf
@@ -8,25 +12,52 @@ import config_file
 import tensorboard
 from collections import deque
 from reinforce.data_collector import run_episode_and_get_history_4
-from reinforce.replay_memory import ReplayMemory2
+from reinforce.replay_memory import FrameReplayMemory, MemmapReplayMemory, NumpyReplayMemory, read_meta
 from reinforce.train import training_step_dqnet_target_critic
 import argparse
 
 parser = argparse.ArgumentParser()
 
 parser.add_argument("--resume", type=str, default=None, help="resume from a model") 
+parser.add_argument("--opponent", type=str, default='random', choices=['random', 'greedy'], help="random actions or greedy captures")
+parser.add_argument("--book", type=str, default=None, help="opening book (.npz) played by the opponent while in book")
+parser.add_argument("--history", type=int, default=1, help="number of last positions stacked into observations")
+parser.add_argument("--replay-dir", type=str, default=None, help="keep replay memory in memory mapped files of this directory")
+parser.add_argument("--replay-size", type=int, default=15_000, help="replay memory size (transitions)")
+parser.add_argument("--lazy-replay", action='store_true', help="memory map replay saved with the resumed model instead of reading it")
+parser.add_argument("--record-games", action='store_true', help=f"append played games to a game log in {config_file.GAMES_DIR}")
 
 args = parser.parse_args()
+if args.replay_dir is not None and args.history > 1:
+    parser.error("--replay-dir stores full states and does not support --history > 1")
 
-env = chess_engine.DiagonalChess()
+env = chess_engine.DiagonalChess(record=args.record_games, history=args.history)
+book = OpeningBook.load(args.book) if args.book is not None else None
 n_outputs = 4096
 
+# legal moves mask for the side to move, refreshed by every env step
+legal_mask = np.zeros(n_outputs, dtype=np.float32)
+
+def env_reset():
+    global legal_mask
+    state, mask = env.reset_with_mask()
+    legal_mask = mask.astype(np.float32)
+    return state
+
 def env_step(action):
-    state1, reward1, done1 = env.step(int(action))
+    global legal_mask
+    _, reward1, done1 = env.step_board_obs(int(action))
 
 
-    random_action = np.random.randint(0, 4096)
-    state2, reward2, done2 = env.step(int(random_action))
+    opponent_action = book.probe(env.board, env.isBlack, sample=True) if book is not None else -1
+    if opponent_action >= 0:
+        pass
+    elif args.opponent == 'greedy':
+        opponent_action = env.greedy_action()
+    else:
+        opponent_action = np.random.randint(0, 4096)
+    state2, mask, reward2, done2 = env.step_with_mask(int(opponent_action))
+    legal_mask = mask.astype(np.float32)
 
     state = state2
     reward = reward1 - max(reward2, 0)
@@ -39,7 +70,7 @@ def tf_env_step(action: tf.Tensor) -> List[tf.Tensor]:
     return tf.numpy_function(env_step, [action], [tf.float32, tf.float32, tf.int32]) #type: ignore
 
 def moves_mask():
-    return chess_engine.internal.get_legal_moves_mask(env.board, env.isBlack).astype(np.float32)
+    return legal_mask
 
 def tf_moves_mask():
     return tf.numpy_function(moves_mask, [], tf.float32) #type: ignore
@@ -50,7 +81,7 @@ def get_network() -> tf.keras.Model:
         print("loaded model from", args.resume)
         return model # type: ignore
     
-    inputs = tf.keras.Input(shape=(8, 8, 8))
+    inputs = tf.keras.Input(shape=(8, 8, 8 * args.history))
     x = tf.keras.layers.Conv2D(32,  3, activation="elu", padding='same')(inputs)
     x = tf.keras.layers.Conv2D(128,  3, padding='same', activation="elu")(x)
     x = tf.keras.layers.Conv2D(128,  2, padding='same', activation="elu")(x)
@@ -86,8 +117,9 @@ train_iters_per_episode = 8
 train_interval = 1
 max_steps_per_episode = 15
 target_update_freq = 300
-replay_memory_size = 15_000
+replay_memory_size = args.replay_size
 save_freq = 500
+render_freq = 500
 
 eps_decay_len = 100
 eps_min = 0.05
@@ -110,15 +142,35 @@ optimizer = tf.keras.optimizers.Adam(
 
 running_avg = deque(maxlen=500)
 
+def replay_checkpoint(model_path: str) -> str:
+    # replay is saved next to the model checkpoint
+    return os.path.splitext(model_path)[0] + "_replay"
+
 def run():
-    replay_memory = ReplayMemory2(replay_memory_size, (replay_memory_size, 8, 8, 8))
+    resumed_replay = replay_checkpoint(args.resume) if args.resume is not None else None
+    resumed_meta = read_meta(resumed_replay) if resumed_replay is not None and args.replay_dir is None else None
+    if resumed_meta is not None:
+        # frame replays save their history length, stacked states of the replay must match the observations
+        resumed_history = resumed_meta.get('history', 1)
+        if resumed_history != args.history:
+            parser.error(f"replay of {args.resume} stacks {resumed_history} positions, --history is {args.history}")
+        replay_class = FrameReplayMemory if 'history' in resumed_meta else NumpyReplayMemory
+        replay_memory = replay_class.load(resumed_replay, lazy=args.lazy_replay)
+        print("loaded", len(replay_memory), "transitions from", resumed_replay)
+    elif args.replay_dir is not None:
+        # disk backed, can be much larger than RAM
+        replay_memory = MemmapReplayMemory(args.replay_dir, replay_memory_size, (replay_memory_size, 8, 8, 8))
+    else:
+        # every position is stored once, stacked states (--history) are rebuilt when sampled
+        replay_memory = FrameReplayMemory(replay_memory_size, (replay_memory_size, 8, 8, 8 * args.history), args.history)
+    game_log = GameLog(f"{config_file.GAMES_DIR}chess_{RUN_VERSION}_{config_file.RUN_NAME}") if args.record_games else None
 
     t = tqdm.tqdm(range(episodes))
     for episode in t:
         epsilon = max(1 - episode / eps_decay_len, eps_min)
 
         # run episode
-        state = env.reset()
+        state = env_reset()
         state = tf.constant(state)
         (states, action_probs, returns, next_states, dones), total_rewards = run_episode_and_get_history_4(state, 
                                                                                                            actor_model, 
@@ -129,6 +181,9 @@ def run():
                                                                                                            tf_moves_mask,
                                                                                                            )  # type: ignore
 
+        if game_log is not None:
+            game = game_log.append(*env.game_record(), strict=env.strict)
+
         # add to replay memory
         replay_memory.add(states, action_probs, returns, next_states, dones)
         running_avg.append(total_rewards)
@@ -142,6 +197,12 @@ def run():
             tf.summary.scalar('reward_avg', avg, step=episode)
             tf.summary.scalar('lenght', states.shape[0], step=episode)
 
+            if game_log is not None and episode % render_freq == 0:
+                # every position of the episode with played moves highlighted
+                actions, _, _ = game_log.moves(game)
+                boards, _ = game_log.replay(np.full(len(actions) + 1, game), np.arange(len(actions) + 1))
+                image_summary('game', boards, episode, actions=np.append(-1, actions), columns=8)
+
         t.set_description(f"Reward: {total_rewards:.2f} - Avg: {avg:.2f}")
         
         #train
@@ -181,7 +242,13 @@ def run():
 
         # save model
         if episode % save_freq == 0:
-            actor_model.save(f"{config_file.MODELS_DIR}chess_{RUN_VERSION}_{config_file.RUN_NAME}_{episode}.h5")
+            model_path = f"{config_file.MODELS_DIR}chess_{RUN_VERSION}_{config_file.RUN_NAME}_{episode}.h5"
+            actor_model.save(model_path)
+            if isinstance(replay_memory, MemmapReplayMemory):
+                # already on disk, reopened from --replay-dir
+                replay_memory.flush()
+            else:
+                replay_memory.save(replay_checkpoint(model_path))
 
 
 run()
\ No newline at end of file
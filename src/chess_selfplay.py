@@ -22,8 +22,19 @@ args = parser.parse_args()
 env = chess_engine.DiagonalChess()
 n_outputs = 4096
 
+# legal moves mask for the side to move, refreshed by every env step
+legal_mask = np.zeros(n_outputs, dtype=np.float32)
+
+def env_reset():
+    global legal_mask
+    state, mask = env.reset_with_mask()
+    legal_mask = mask.astype(np.float32)
+    return state
+
 def env_step(action):
-    state, reward, done = env.step(int(action))
+    global legal_mask
+    state, mask, reward, done = env.step_with_mask(int(action))
+    legal_mask = mask.astype(np.float32)
  
     return (state.astype(np.float32), np.array(reward, np.float32), np.array(done, np.int32))
 
@@ -31,7 +42,7 @@ def tf_env_step(action: tf.Tensor) -> List[tf.Tensor]:
     return tf.numpy_function(env_step, [action], [tf.float32, tf.float32, tf.int32]) #type: ignore
 
 def moves_mask():
-    return chess_engine.internal.get_legal_moves_mask(env.board, env.isBlack).astype(np.float32)
+    return legal_mask
 
 def tf_moves_mask():
     return tf.numpy_function(moves_mask, [], tf.float32) #type: ignore
@@ -124,7 +135,7 @@ def run():
     for episode in t:
         epsilon = max(1 - episode / eps_decay_len, eps_min)
 
-        state = env.reset()
+        state = env_reset()
         state = tf.constant(state)
 
         history_white, history_black, rewards_white, rewards_black = run_episode_and_get_history_selfplay(
@@ -5,4 +5,5 @@ LOG_DIR_ROOT = 'logs/'
 RUN_NAME = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
 LOG_DIR = os.path.join(LOG_DIR_ROOT, RUN_NAME)
 MODELS_DIR = 'models/'
-RETAIN_DIR = 'retain/'
\ No newline at end of file
+RETAIN_DIR = 'retain/'
+GAMES_DIR = 'games/'
@@ -1,6 +1,7 @@
 from typing import Callable, List, Tuple
 import tensorflow as tf
 
+from chess_engine import tf_engine
 from reinforce.common import ReplayHistoryType
 
 @tf.function
@@ -542,4 +543,93 @@ def run_episode_and_get_history_selfplay(
     rewards_white = white[2]
     rewards_black = black[2]
 
-    return white, black, tf.reduce_sum(rewards_white), tf.reduce_sum(rewards_black)
\ No newline at end of file
+    return white, black, tf.reduce_sum(rewards_white), tf.reduce_sum(rewards_black)
+
+
+def play_episodes_in_graph(
+        initial_boards: tf.Tensor,
+        actor_model: tf.keras.Model,
+        max_steps: int,
+        epsilon: float,
+) -> Tuple[ReplayHistoryType, tf.Tensor]:
+    """
+    Plays a batch of episodes with `chess_engine.tf_engine`, nothing leaves the graph.
+    Model plays white (masked argmax, random action with probability epsilon),
+    opponent plays black with random actions (same as `env_step` in chess_lr_6.py).
+
+    Always runs `max_steps` steps so all shapes are static and it can be XLA compiled,
+    use `play_episodes_in_graph_xla` for that.
+    returns:
+    * (states, actions, rewards, next_states, dones) - each shaped (max_steps, N, ...)
+    * valid - (max_steps, N) flag, False for steps after the episode ended
+    """
+    n = tf.shape(initial_boards)[0]
+
+    states = tf.TensorArray(dtype=tf.float32, size=max_steps)
+    actions = tf.TensorArray(dtype=tf.int32, size=max_steps)
+    rewards = tf.TensorArray(dtype=tf.float32, size=max_steps)
+    next_states = tf.TensorArray(dtype=tf.float32, size=max_steps)
+    dones = tf.TensorArray(dtype=tf.float32, size=max_steps)
+    valid = tf.TensorArray(dtype=tf.bool, size=max_steps)
+
+    boards = tf.cast(initial_boards, tf.int8)
+    state, mask = tf_engine.board_to_observation_and_mask_batch(boards, False)
+    alive = tf.ones((n,), dtype=tf.bool)
+
+    for t in tf.range(max_steps):
+        states = states.write(t, state)
+        valid = valid.write(t, alive)
+
+        action_logits_t, _ = actor_model(state) # type: ignore
+        action_probs_t = tf.nn.softmax(action_logits_t*tf.cast(mask, tf.float32))
+
+        action = tf.where(
+            tf.random.uniform((n,)) < epsilon,
+            # Random int, 0-4096
+            tf.random.uniform((n,), minval=0, maxval=4096, dtype=tf.int32),
+            # argmax action
+            tf.argmax(action_probs_t, axis=1, output_type=tf.int32),
+        )
+        actions = actions.write(t, action)
+
+        # model move and random opponent move
+        boards, done_white, reward_white = tf_engine.make_move_from_action_batch(boards, action, False)
+        random_action = tf.random.uniform((n,), minval=0, maxval=4096, dtype=tf.int32)
+        boards, done_black, reward_black = tf_engine.make_move_from_action_batch(boards, random_action, True)
+
+        state, mask = tf_engine.board_to_observation_and_mask_batch(boards, False)
+        done = done_white | done_black
+
+        next_states = next_states.write(t, state)
+        rewards = rewards.write(t, reward_white - tf.maximum(reward_black, 0.0))
+        dones = dones.write(t, tf.cast(done, tf.float32))
+
+        alive = alive & ~done
+
+    history = (states.stack(), actions.stack(), rewards.stack(), next_states.stack(), dones.stack())
+
+    return history, valid.stack() # type: ignore
+
+play_episodes_in_graph_xla = tf.function(play_episodes_in_graph, jit_compile=True)
+
+@tf.function
+def run_episodes_in_graph(
+        initial_boards: tf.Tensor,
+        actor_model: tf.keras.Model,
+        max_steps: int,
+        epsilon: float,
+) -> Tuple[ReplayHistoryType, tf.Tensor]:
+    """
+    Runs batch of episodes in graph (see `play_episodes_in_graph`) and flattens them for replay memory,
+    steps of every episode are kept together and steps after the end of episode are dropped.
+    returns history and total reward of each episode
+    """
+    history, valid = play_episodes_in_graph(initial_boards, actor_model, max_steps, epsilon)
+
+    total_rewards = tf.reduce_sum(history[2]*tf.cast(valid, tf.float32), axis=0)
+
+    # (max_steps, N, ...) -> (N, max_steps, ...)
+    valid = tf.transpose(valid)
+    history = tuple(tf.boolean_mask(tf.experimental.numpy.swapaxes(x, 0, 1), valid) for x in history)
+
+    return history, total_rewards # type: ignore
@@ -0,0 +1,103 @@
+import unittest
+
+import numpy as np
+
+from chess_engine import diagchess
+
+try:
+    import tensorflow as tf
+    from .data_collector import play_episodes_in_graph, play_episodes_in_graph_xla, run_episodes_in_graph
+except ImportError:
+    tf = None
+
+# white king shuttles between (7, 7) and (6, 7), black pawn on the first column has exactly one move until it
+# reaches the last row, so the games are deterministic whatever random actions the opponent draws
+KING_FORWARD = 7 * 512 + 7 * 64 + 6 * 8 + 7
+KING_BACK = 6 * 512 + 7 * 64 + 7 * 8 + 7
+# from an empty square, replaced with the only legal move of black
+OPPONENT_ACTION = 4 * 512 + 4 * 64 + 4 * 8 + 4
+PAWN_ROWS = (7, 5, 2)
+MAX_STEPS = 8
+
+
+def pawn_race_boards():
+    boards = np.zeros((len(PAWN_ROWS), 8, 8), dtype=np.int8)
+    for i, row in enumerate(PAWN_ROWS):
+        boards[i, row, 0] = diagchess.PAWN
+        boards[i, 7, 7] = -diagchess.KING
+    return boards
+
+
+def shuttle_model(state):
+    # masked argmax picks KING_FORWARD when it is legal and KING_BACK otherwise
+    logits = tf.one_hot(KING_FORWARD, 4096) * 2.0 + tf.one_hot(KING_BACK, 4096)
+    return tf.tile(logits[tf.newaxis], (tf.shape(state)[0], 1)), None
+
+
+def reference_episode(board, actions):
+    # same steps with the numba engine, white action and black reply like `play_episodes_in_graph`
+    board = board.copy()
+    rewards, dones = [], []
+    for action in actions:
+        done_white, reward_white = diagchess.make_move_from_action(board, int(action), False)
+        done_black, reward_black = diagchess.make_move_from_action(board, OPPONENT_ACTION, True)
+        rewards.append(reward_white - max(reward_black, 0.0))
+        dones.append(done_white or done_black)
+        if dones[-1]:
+            break
+    return np.array(rewards, dtype=np.float32), np.array(dones, dtype=np.float32)
+
+
+@unittest.skipIf(tf is None, "tensorflow is not installed")
+class PlayEpisodesInGraphTests(unittest.TestCase):
+    def setUp(self):
+        tf.random.set_seed(0)
+        self.boards = pawn_race_boards()
+
+    def check_history(self, play):
+        history, valid = play(tf.constant(self.boards), shuttle_model, MAX_STEPS, 0.0)
+        states, actions, rewards, next_states, dones = (x.numpy() for x in history)
+        valid = valid.numpy()
+
+        n = len(self.boards)
+        self.assertEqual(states.shape, (MAX_STEPS, n, 8, 8, 8))
+        self.assertEqual(next_states.shape, (MAX_STEPS, n, 8, 8, 8))
+        self.assertEqual(actions.shape, (MAX_STEPS, n))
+        self.assertEqual(rewards.shape, (MAX_STEPS, n))
+        self.assertEqual(dones.shape, (MAX_STEPS, n))
+        self.assertEqual(valid.shape, (MAX_STEPS, n))
+
+        for i, row in enumerate(PAWN_ROWS):
+            length = 8 - row
+            # steps after the end of the game are not part of the episode
+            self.assertTrue(valid[:length, i].all())
+            self.assertFalse(valid[length:, i].any())
+
+            expected_rewards, expected_dones = reference_episode(self.boards[i], actions[:length, i])
+            self.assertEqual(len(expected_dones), length)
+            self.assertTrue(np.array_equal(rewards[:length, i], expected_rewards))
+            self.assertTrue(np.array_equal(dones[:length, i], expected_dones))
+
+    def test_play_episodes(self):
+        self.check_history(tf.function(play_episodes_in_graph))
+
+    def test_play_episodes_xla(self):
+        self.check_history(play_episodes_in_graph_xla)
+
+    def test_run_episodes(self):
+        (states, actions, rewards, next_states, dones), total_rewards = run_episodes_in_graph(
+            tf.constant(self.boards), shuttle_model, MAX_STEPS, 0.0)
+
+        lengths = [8 - row for row in PAWN_ROWS]
+        steps = sum(lengths)
+        self.assertEqual(states.shape, (steps, 8, 8, 8))
+        self.assertEqual(next_states.shape, (steps, 8, 8, 8))
+        self.assertEqual(actions.shape, (steps,))
+
+        # episodes one after another, each ends with its only done step
+        ends = np.cumsum(lengths) - 1
+        self.assertTrue(np.array_equal(np.flatnonzero(dones.numpy()), ends))
+
+        expected_totals = [reference_episode(board, actions.numpy()[end - length + 1:end + 1])[0].sum()
+                           for board, end, length in zip(self.boards, ends, lengths)]
+        self.assertTrue(np.allclose(total_rewards.numpy(), expected_totals))
@@ -0,0 +1,125 @@
+"""
+Tensorflow helpers for legal moves masks produced by the engine
+"""
+import tensorflow as tf
+
+# bit weights of one packed byte, most significant bit first (same order as np.packbits)
+_BITS = tf.constant([128, 64, 32, 16, 8, 4, 2, 1], dtype=tf.uint8)
+
+
+def unpack_mask(packed: tf.Tensor, dtype=tf.float32) -> tf.Tensor:
+    """
+    Unpacks bit-packed masks (..., 512) uint8 (see `get_legal_moves_mask_batch(..., packed=True)`)
+    into dense masks (..., 4096) of given dtype
+    """
+    packed = tf.convert_to_tensor(packed, dtype=tf.uint8)
+    bits = tf.bitwise.bitwise_and(packed[..., tf.newaxis], _BITS) # (..., 512, 8)
+    dense = tf.cast(bits > 0, dtype)
+    return tf.reshape(dense, tf.concat([tf.shape(packed)[:-1], [4096]], axis=0))
+
+
+def pack_mask(mask: tf.Tensor) -> tf.Tensor:
+    """
+    Packs dense masks (..., 4096) into (..., 512) uint8, inverse of `unpack_mask`
+    """
+    mask = tf.convert_to_tensor(mask)
+    bits = tf.reshape(tf.cast(mask != 0, tf.int32), tf.concat([tf.shape(mask)[:-1], [512, 8]], axis=0))
+    packed = tf.reduce_sum(bits * tf.cast(_BITS, tf.int32), axis=-1)
+    return tf.cast(packed, tf.uint8)
+
+
+# Sparse (CSR) legal moves, see `legal_moves_csr_batch` in the engine.
+# `offsets` (N + 1,) - moves of row `i` are `actions[offsets[i]:offsets[i + 1]]`
+# `actions` (M,) - legal action ids of all rows concatenated
+
+def csr_row_ids(offsets: tf.Tensor) -> tf.Tensor:
+    """
+    Returns row (segment) id of every legal move, (M,) int32
+    """
+    offsets = tf.cast(offsets, tf.int32)
+    counts = offsets[1:] - offsets[:-1]
+    return tf.repeat(tf.range(tf.shape(counts)[0]), counts)
+
+
+def gather_legal_logits(logits: tf.Tensor, offsets: tf.Tensor, actions: tf.Tensor) -> tf.Tensor:
+    """
+    Gathers logits (N, 4096) of legal moves only, returns (M,)
+    """
+    indices = tf.stack([csr_row_ids(offsets), tf.cast(actions, tf.int32)], axis=1)
+    return tf.gather_nd(logits, indices)
+
+
+def segment_softmax(values: tf.Tensor, row_ids: tf.Tensor, num_rows) -> tf.Tensor:
+    """
+    Softmax of `values` (M,) computed separately for every row, returns (M,)
+    """
+    values = values - tf.gather(tf.math.unsorted_segment_max(values, row_ids, num_rows), row_ids)
+    exp = tf.exp(values)
+    return exp / tf.gather(tf.math.unsorted_segment_sum(exp, row_ids, num_rows), row_ids)
+
+
+def segment_argmax(values: tf.Tensor, row_ids: tf.Tensor, num_rows) -> tf.Tensor:
+    """
+    Returns position (index into `values`) of largest value of every row, (N,) int32.
+    Ties go to the first position, rows without values get -1.
+    """
+    best = tf.gather(tf.math.unsorted_segment_max(values, row_ids, num_rows), row_ids)
+    positions = tf.range(tf.shape(values)[0])
+    # positions of non best values are pushed past the end
+    candidates = tf.where(values >= best, positions, tf.shape(values)[0])
+    first = tf.math.unsorted_segment_min(candidates, row_ids, num_rows)
+    counts = tf.math.unsorted_segment_sum(tf.ones_like(row_ids), row_ids, num_rows)
+    return tf.where(counts > 0, first, -1)
+
+
+def legal_softmax(logits: tf.Tensor, offsets: tf.Tensor, actions: tf.Tensor) -> tf.Tensor:
+    """
+    Probabilities (M,) of legal moves only, softmax over legal moves of every row of logits (N, 4096)
+    """
+    row_ids = csr_row_ids(offsets)
+    values = gather_legal_logits(logits, offsets, actions)
+    return segment_softmax(values, row_ids, tf.shape(logits)[0])
+
+
+def legal_argmax(logits: tf.Tensor, offsets: tf.Tensor, actions: tf.Tensor) -> tf.Tensor:
+    """
+    Best legal action of every row of logits (N, 4096), (N,) int32. Rows without legal moves get 0
+    (same as `array_action_to_move` when there are no legal moves).
+    """
+    row_ids = csr_row_ids(offsets)
+    values = gather_legal_logits(logits, offsets, actions)
+    positions = segment_argmax(values, row_ids, tf.shape(logits)[0])
+    # padded with one action, so the gather is valid even when no row has legal moves
+    padded = tf.concat([tf.cast(actions, tf.int32), [0]], axis=0)
+    return tf.where(positions >= 0, tf.gather(padded, tf.maximum(positions, 0)), 0)
+
+
+def unpack_to_masks(packed: tf.Tensor, dtype=tf.float32) -> tf.Tensor:
+    """
+    Unpacks to-square masks (..., 8) uint8 of `get_factored_legal_moves_mask` into (..., 64)
+    """
+    packed = tf.convert_to_tensor(packed, dtype=tf.uint8)
+    bits = tf.bitwise.bitwise_and(packed[..., tf.newaxis], _BITS)
+    return tf.reshape(tf.cast(bits > 0, dtype), tf.concat([tf.shape(packed)[:-1], [64]], axis=0))
+
+
+def factored_argmax(from_logits: tf.Tensor, to_logits: tf.Tensor, from_masks: tf.Tensor, to_masks: tf.Tensor) -> tf.Tensor:
+    """
+    Best legal action (N,) int32 of from/to heads (N, 64) (or (N, 8, 8), squares `y * 8 + x`) masked with
+    `get_factored_legal_moves_mask_batch` output: best legal from-square first, then best target of that square.
+    Rows without legal moves get 0.
+    """
+    n = tf.shape(from_masks)[0]
+    from_logits = tf.reshape(tf.cast(from_logits, tf.float32), (n, 64))
+    to_logits = tf.reshape(tf.cast(to_logits, tf.float32), (n, 64))
+    from_masks = tf.reshape(from_masks, (n, 64)) != 0
+
+    lowest = tf.float32.min
+    from_square = tf.argmax(tf.where(from_masks, from_logits, lowest), axis=1, output_type=tf.int32)
+
+    targets = unpack_to_masks(tf.gather(tf.reshape(to_masks, (n, 64, 8)), from_square, batch_dims=1), tf.bool)
+    to_square = tf.argmax(tf.where(targets, to_logits, lowest), axis=1, output_type=tf.int32)
+
+    # move_to_int(x1, y1, x2, y2)
+    action = (from_square % 8) * 512 + (from_square // 8) * 64 + (to_square % 8) * 8 + to_square // 8
+    return tf.where(tf.reduce_any(from_masks, axis=1), action, 0)
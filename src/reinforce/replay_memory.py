@@ -1,5 +1,9 @@
 from collections import deque
+import json
+import os
 import random
+import numpy as np
+import numba as nb
 import tensorflow as tf
 
 from reinforce.common import ReplayHistoryType
@@ -97,6 +101,344 @@ class ReplayMemory2:
     def __len__(self):
         return self.real_size
 
+META_FILE = 'meta.json'
+
+def read_meta(directory):
+    """
+    Counters and shapes of a replay saved in `directory`, None if there is none
+    """
+    path = os.path.join(directory, META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def write_meta(directory, meta):
+    # written last and replaced atomically, a directory with meta always has complete buffers
+    path = os.path.join(directory, META_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(path + '.tmp', path)
+
+def save_buffers(directory, buffers, meta):
+    """
+    Saves arrays (name -> array) as `<name>.npy` files and `meta` as `meta.json`
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name, buffer in buffers.items():
+        np.save(os.path.join(directory, f"{name}.npy"), buffer)
+    write_meta(directory, meta)
+
+def load_buffers(directory, names, lazy=False):
+    """
+    Loads arrays saved by `save_buffers`, returns (name -> array, meta).
+    `lazy` - memory map files copy-on-write instead of reading them, pages are read when touched
+    and changes stay in memory (saved files are not modified)
+    """
+    meta = read_meta(directory)
+    if meta is None:
+        raise FileNotFoundError(f"no saved replay in {directory}")
+    buffers = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='c' if lazy else None) for name in names}
+    return buffers, meta
+
+
+class NumpyReplayMemory:
+    """
+    Drop-in replacement of `ReplayMemory2` on preallocated numpy arrays.
+    An episode is written with one slice assignment per field (two when it wraps around the end of the buffer),
+    batches are gathered with one fancy index per field.
+    """
+    def __init__(self, max_size, state_shape):
+        # same arguments as ReplayMemory2, `state_shape` includes the buffer size
+        state_shape = tuple(state_shape)[1:]
+
+        self.states_buffer = self._allocate('states', (max_size, *state_shape), np.float32)
+        self.actions_buffer = self._allocate('actions', (max_size,), np.int32)
+        self.returns_buffer = self._allocate('returns', (max_size,), np.float32)
+        self.next_states_buffer = self._allocate('next_states', (max_size, *state_shape), np.float32)
+        self.dones_buffer = self._allocate('dones', (max_size,), np.float32)
+
+        self.max_size = max_size
+        self.count = 0
+        self.real_size = 0
+
+    def _allocate(self, name, shape, dtype) -> np.ndarray:
+        return np.zeros(shape, dtype=dtype)
+
+    BUFFER_NAMES = ('states', 'actions', 'returns', 'next_states', 'dones')
+
+    def buffers(self):
+        return (self.states_buffer, self.actions_buffer, self.returns_buffer, self.next_states_buffer, self.dones_buffer)
+
+    def meta(self):
+        return {'max_size': self.max_size, 'state_shape': list(self.states_buffer.shape[1:]),
+                'count': self.count, 'real_size': self.real_size}
+
+    def save(self, directory):
+        """
+        Saves buffers and counters into `directory` (see `save_buffers`), restore with `load`
+        """
+        save_buffers(directory, dict(zip(self.BUFFER_NAMES, self.buffers())), self.meta())
+
+    @classmethod
+    def load(cls, directory, lazy=False) -> 'NumpyReplayMemory':
+        """
+        Restores replay saved by `save`, `lazy` - see `load_buffers`
+        """
+        buffers, meta = load_buffers(directory, cls.BUFFER_NAMES, lazy)
+
+        memory = cls.__new__(cls)
+        (memory.states_buffer, memory.actions_buffer, memory.returns_buffer,
+         memory.next_states_buffer, memory.dones_buffer) = (buffers[name] for name in cls.BUFFER_NAMES)
+        memory.max_size, memory.count, memory.real_size = meta['max_size'], meta['count'], meta['real_size']
+        return memory
+
+    def add(self, states, actions, returns, next_states, dones):
+        n = len(states)
+        # only the last max_size transitions would survive anyway
+        skip = max(n - self.max_size, 0)
+        n -= skip
+
+        first = min(n, self.max_size - self.count)
+        for buffer, values in zip(self.buffers(), (states, actions, returns, next_states, dones)):
+            values = np.asarray(values)[skip:]
+            buffer[self.count:self.count + first] = values[:first]
+            buffer[:n - first] = values[first:]
+
+        self.count = (self.count + n) % self.max_size
+        self.real_size = min(self.real_size + n, self.max_size)
+
+    def add_one(self, state, action, return_, next_state, done):
+        self.add(*(np.asarray(value)[np.newaxis] for value in (state, action, return_, next_state, done)))
+
+    def sample_indices(self, batch_size) -> np.ndarray:
+        assert self.real_size >= batch_size, "buffer contains less samples than batch size"
+        return np.random.randint(0, self.real_size, size=batch_size)
+
+    def sample(self, batch_size) -> ReplayHistoryType:
+        indices = self.sample_indices(batch_size)
+        return tuple(tf.convert_to_tensor(np.take(buffer, indices, axis=0)) for buffer in self.buffers()) # type: ignore
+
+    def __len__(self):
+        return self.real_size
+
+class MemmapReplayMemory(NumpyReplayMemory):
+    """
+    `NumpyReplayMemory` with buffers in memory mapped `.npy` files of `directory`, so it can be much larger than RAM
+    (hot pages stay in the OS page cache). Counters and shapes are kept in a small `meta.json` written by `flush()`,
+    a directory that already holds a buffer of the same size and state shape is reopened with its contents.
+    """
+    def __init__(self, directory, max_size, state_shape):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        meta = read_meta(directory)
+        if meta is not None and (meta['max_size'] != max_size or tuple(meta['state_shape']) != tuple(state_shape)[1:]):
+            raise ValueError(f"replay in {directory} has size {meta['max_size']} and state shape {meta['state_shape']}")
+        self._reopen = meta is not None
+
+        super().__init__(max_size, state_shape)
+
+        if meta is not None:
+            self.count = meta['count']
+            self.real_size = meta['real_size']
+        self.flush()
+
+    def _allocate(self, name, shape, dtype) -> np.ndarray:
+        path = os.path.join(self.directory, f"{name}.npy")
+        if self._reopen:
+            return np.load(path, mmap_mode='r+')
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+
+    def flush(self):
+        """
+        Writes buffers and counters to disk, contents added after the last flush may be lost on a crash
+        """
+        for buffer in self.buffers():
+            buffer.flush()
+        write_meta(self.directory, self.meta())
+
+    @classmethod
+    def load(cls, directory, lazy=False) -> 'MemmapReplayMemory':
+        """
+        Reopens replay saved in `directory` by `save` or `flush`, buffers are memory mapped whatever `lazy` is
+        """
+        meta = read_meta(directory)
+        if meta is None:
+            raise FileNotFoundError(f"no saved replay in {directory}")
+        return cls(directory, meta['max_size'], (meta['max_size'], *meta['state_shape']))
+
+    def sample_indices(self, batch_size) -> np.ndarray:
+        # ascending indices read the files front to back
+        return np.sort(super().sample_indices(batch_size))
+
+class FrameReplayMemory:
+    """
+    Replay that stores every observation once. Within an episode `next_state[t]` is `state[t + 1]`, so transitions
+    keep only the id of their state frame and the next state is the frame after it. A next state that is not followed
+    by its transition's successor (`done`, end of the added chunk or a chunk that does not follow on) is stored
+    as an extra frame and the following state starts a new episode. Same arguments and samples as `ReplayMemory2`.
+    `history` - states are stacks of the last `history` frames along the last axis (see `DiagonalChess(history=k)`),
+    only the newest frame of each is stored and stacks are rebuilt when sampled, with zeros before the start of the episode.
+    `frames_size` - initial number of frames (`max_size + max_size // 8 + history` by default), every episode needs one
+    frame more than it has transitions. The frames grow when short episodes need more, live transitions are never dropped.
+    """
+    BUFFER_NAMES = ('frames', 'state_frames', 'episode_starts', 'actions', 'returns', 'dones')
+
+    def __init__(self, max_size, state_shape, history=1, frames_size=None):
+        state_shape = tuple(state_shape)[1:]
+        self.history = history
+        self.frame_shape = (*state_shape[:-1], state_shape[-1] // history)
+
+        self.frames_size = max_size + max_size // 8 + history if frames_size is None else frames_size
+        self.frames = np.zeros((self.frames_size, *self.frame_shape), dtype=np.float32)
+        self.frame_count = 0
+
+        # absolute frame ids: frame of the state and first frame of its episode
+        self.state_frames = np.zeros(max_size, dtype=np.int64)
+        self.episode_starts = np.zeros(max_size, dtype=np.int64)
+        self.actions = np.zeros(max_size, dtype=np.int32)
+        self.returns = np.zeros(max_size, dtype=np.float32)
+        self.dones = np.zeros(max_size, dtype=np.float32)
+
+        self.max_size = max_size
+        # absolute ids of transitions, live ones are [first_live, transition_count)
+        self.transition_count = 0
+        self.first_live = 0
+        self.count = 0
+        self.real_size = 0
+
+    def add(self, states, actions, returns, next_states, dones):
+        planes = self.frame_shape[-1]
+        # only the last max_size transitions would survive anyway
+        skip = max(len(states) - self.max_size, 0)
+        states = np.asarray(states, dtype=np.float32)[skip:, ..., -planes:]
+        next_frames = np.asarray(next_states, dtype=np.float32)[skip:, ..., -planes:]
+        dones = np.asarray(dones)[skip:]
+        n = len(states)
+        if n == 0:
+            return
+
+        # transitions after which the next state is stored as its own frame
+        breaks = np.ones(n, dtype=np.bool_)
+        breaks[:-1] = (dones[:-1] != 0) | np.any((next_frames[:-1] != states[1:]).reshape(n - 1, -1), axis=1)
+
+        # frame layout of the chunk: state of every transition followed by the next state where it breaks
+        state_positions = np.arange(n) + np.cumsum(breaks) - breaks
+        total = n + int(breaks.sum())
+        frames = np.empty((total, *self.frame_shape), dtype=np.float32)
+        frames[state_positions] = states
+        frames[state_positions[breaks] + 1] = next_frames[breaks]
+
+        # episodes start with the chunk and after every break
+        episode_first = np.zeros(total, dtype=np.int64)
+        starts = np.append(0, state_positions[breaks][:-1] + 2)
+        episode_first[starts] = starts
+        episode_first = np.maximum.accumulate(episode_first)
+
+        # oldest frame still needed once the chunk is added
+        oldest = max(self.first_live, self.transition_count + n - self.max_size)
+        if oldest < self.transition_count:
+            oldest_frame = self._first_frame(oldest)
+        else:
+            position = state_positions[oldest - self.transition_count]
+            oldest_frame = self.frame_count + max(position - self.history + 1, episode_first[position])
+        needed = self.frame_count + total - oldest_frame
+        if needed > self.frames_size:
+            self._grow(max(needed, self.frames_size + self.frames_size // 2), oldest_frame)
+
+        frame_ids = self.frame_count + np.arange(total)
+        self.frames[frame_ids % self.frames_size] = frames
+
+        slots = (self.transition_count + np.arange(n)) % self.max_size
+        self.state_frames[slots] = self.frame_count + state_positions
+        self.episode_starts[slots] = self.frame_count + episode_first[state_positions]
+        self.actions[slots] = np.asarray(actions)[skip:]
+        self.returns[slots] = np.asarray(returns)[skip:]
+        self.dones[slots] = dones
+
+        self.frame_count += total
+        self.transition_count += n
+        self._drop_overwritten()
+
+    def _first_frame(self, transition):
+        # oldest frame the transition's state stack needs
+        slot = transition % self.max_size
+        return max(self.state_frames[slot] - self.history + 1, self.episode_starts[slot])
+
+    def _grow(self, frames_size, oldest_frame):
+        # frames keep their absolute ids, only the ring positions change
+        frames = np.zeros((frames_size, *self.frame_shape), dtype=np.float32)
+        ids = np.arange(oldest_frame, self.frame_count)
+        frames[ids % frames_size] = self.frames[ids % self.frames_size]
+        self.frames, self.frames_size = frames, frames_size
+
+    def _drop_overwritten(self):
+        self.first_live = max(self.first_live, self.transition_count - self.max_size)
+        self.count = self.transition_count % self.max_size
+        self.real_size = self.transition_count - self.first_live
+
+    def stack(self, frame_ids: np.ndarray, episode_starts: np.ndarray) -> np.ndarray:
+        """
+        States ending at absolute frame ids, frames before `episode_starts` are zeros
+        """
+        if self.history == 1:
+            return np.take(self.frames, frame_ids % self.frames_size, axis=0)
+
+        ids = frame_ids[:, np.newaxis] - np.arange(self.history - 1, -1, -1)
+        frames = self.frames[ids % self.frames_size]
+        frames[ids < episode_starts[:, np.newaxis]] = 0
+
+        # (N, history, ..., planes) -> (N, ..., history * planes), oldest frame first
+        *shape, planes = self.frame_shape
+        return np.moveaxis(frames, 1, -2).reshape(len(frame_ids), *shape, self.history * planes)
+
+    def sample(self, batch_size) -> ReplayHistoryType:
+        assert self.real_size >= batch_size, "buffer contains less samples than batch size"
+
+        slots = (self.first_live + np.random.randint(0, self.real_size, size=batch_size)) % self.max_size
+        state_frames = self.state_frames[slots]
+        episode_starts = self.episode_starts[slots]
+
+        return (
+            tf.convert_to_tensor(self.stack(state_frames, episode_starts)),
+            tf.convert_to_tensor(self.actions[slots]),
+            tf.convert_to_tensor(self.returns[slots]),
+            tf.convert_to_tensor(self.stack(state_frames + 1, episode_starts)),
+            tf.convert_to_tensor(self.dones[slots])
+        )
+
+    def meta(self):
+        return {'max_size': self.max_size, 'history': self.history, 'frame_shape': list(self.frame_shape),
+                'frames_size': self.frames_size, 'frame_count': self.frame_count,
+                'transition_count': self.transition_count, 'first_live': self.first_live}
+
+    def save(self, directory):
+        save_buffers(directory, {name: getattr(self, name) for name in self.BUFFER_NAMES}, self.meta())
+
+    @classmethod
+    def load(cls, directory, lazy=False):
+        buffers, meta = load_buffers(directory, cls.BUFFER_NAMES, lazy)
+
+        memory = cls.__new__(cls)
+        memory.__dict__.update(buffers)
+        memory.history, memory.frame_shape = meta['history'], tuple(meta['frame_shape'])
+        memory.max_size, memory.frames_size, memory.frame_count = meta['max_size'], meta['frames_size'], meta['frame_count']
+        memory.transition_count, memory.first_live = meta['transition_count'], meta['first_live']
+        memory._drop_overwritten()
+        return memory
+
+    def __len__(self):
+        return self.real_size
+
+class HistoryReplayMemory(FrameReplayMemory):
+    """
+    `FrameReplayMemory` for states stacking `history` frames of `frame_shape`
+    """
+    def __init__(self, max_size, history, frame_shape=(8, 8, 8), frames_size=None):
+        *shape, planes = frame_shape
+        super().__init__(max_size, (max_size, *shape, planes * history), history, frames_size)
+
 # The ‘sum-tree’ data structure used here is very similar in spirit to the array representation
 # of a binary heap. However, instead of the usual heap property, the value of a parent node is
 # the sum of its children. Leaf nodes store the transition priorities and the internal nodes are
@@ -158,12 +500,117 @@ class SumTree:
     def __repr__(self):
         return f"SumTree(nodes={self.nodes.__repr__()}, data={self.data.__repr__()})"
     
+@nb.njit(cache=True)
+def _update_tree(nodes: np.ndarray, idxs: np.ndarray, values: np.ndarray, minimum: bool):
+    """
+    sets leaves `idxs` to `values` and recomputes their parents (sums or minimums), leaf `i` is node `capacity + i`
+    and children of node `j` are `2j` and `2j + 1` (root is 1)
+    """
+    capacity = len(nodes) // 2
+    for k in range(len(idxs)):
+        node = idxs[k] + capacity
+        nodes[node] = values[k]
+        node //= 2
+        while node >= 1:
+            if minimum:
+                nodes[node] = min(nodes[2 * node], nodes[2 * node + 1])
+            else:
+                nodes[node] = nodes[2 * node] + nodes[2 * node + 1]
+            node //= 2
+
+@nb.njit(cache=True)
+def _find_prefix_sums(nodes: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    leaf index of every value, first leaf where cumulative sum of priorities exceeds it
+    """
+    capacity = len(nodes) // 2
+    idxs = np.empty(len(values), dtype=np.int64)
+    for k in range(len(values)):
+        value = values[k]
+        node = 1
+        while node < capacity:
+            left = nodes[2 * node]
+            # rounding can push the value past the right subtree, empty subtrees are never chosen
+            if value < left or nodes[2 * node + 1] <= 0:
+                node = 2 * node
+            else:
+                value -= left
+                node = 2 * node + 1
+        idxs[k] = node - capacity
+    return idxs
+
+
+class _ArrayTree:
+    """
+    Binary tree of sums or minimums on one float64 array, leaves are priorities of `size` transitions
+    """
+    _minimum = False
+
+    def __init__(self, size):
+        self.size = size
+        # power of two number of leaves, unused ones stay empty
+        self.capacity = 1 << max(size - 1, 0).bit_length()
+        self.nodes = np.full(2 * self.capacity, np.inf if self._minimum else 0.0, dtype=np.float64)
+
+    def update_batch(self, idxs, values):
+        """
+        Sets priorities of leaves `idxs` (one numba call for the whole batch, later duplicates win)
+        """
+        idxs = np.asarray(idxs, dtype=np.int64).ravel()
+        values = np.broadcast_to(np.asarray(values, dtype=np.float64).ravel(), idxs.shape)
+        _update_tree(self.nodes, idxs, np.ascontiguousarray(values), self._minimum)
+
+    def update(self, idx, value):
+        self.update_batch([idx], [value])
+
+    def leaves(self, idxs) -> np.ndarray:
+        return self.nodes[self.capacity + np.asarray(idxs, dtype=np.int64)]
+
+    def __repr__(self):
+        return f"{type(self).__name__}(size={self.size}, leaves={self.leaves(np.arange(self.size))!r})"
+
+class ArraySumTree(_ArrayTree):
+    """
+    Array backed replacement of `SumTree` with batched updates and stratified sampling
+    """
+    @property
+    def total(self) -> float:
+        return float(self.nodes[1])
+
+    def find(self, values) -> np.ndarray:
+        """
+        Leaf indices of cumulative sums `values` (in [0, total))
+        """
+        return _find_prefix_sums(self.nodes, np.asarray(values, dtype=np.float64))
+
+    def sample_batch(self, n, rng=None):
+        """
+        Stratified sampling: [0, total) is split into `n` equal ranges and one value is drawn from each,
+        returns leaf indices (n,) and their priorities
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        values = (np.arange(n) + rng.random(n)) * (self.total / n)
+        idxs = self.find(values)
+        return idxs, self.leaves(idxs)
+
+class ArrayMinTree(_ArrayTree):
+    """
+    Minimum of priorities (inf while empty), normalizes importance sampling weights
+    """
+    _minimum = True
+
+    @property
+    def min(self) -> float:
+        return float(self.nodes[1])
+
 class PrioritizedReplayMemory:
     def __len__(self):
         return self.real_size
-    
+
     def __init__(self, state_size, action_size, buffer_size, eps=1e-2, alpha=0.1, beta=0.1):
-        self.tree = SumTree(size=buffer_size)
+        self.tree = ArraySumTree(buffer_size)
+        # smallest priority gives the largest importance sampling weight
+        self.min_tree = ArrayMinTree(buffer_size)
 
         # PER params
         self.eps = eps  # minimal priority, prevents zero probabilities
@@ -172,61 +619,43 @@ class PrioritizedReplayMemory:
         self.max_priority = eps  # priority for new samples, init as eps
 
         # transition: state, action, reward, next_state, done
-        self.state = tf.Variable(tf.zeros(state_size, dtype=tf.float32))
-        self.action = tf.Variable(tf.zeros(buffer_size, dtype=tf.int32))
-        self.reward = tf.Variable(tf.zeros(buffer_size, dtype=tf.float32))
-        self.next_state = tf.Variable(tf.zeros(state_size, dtype=tf.float32))
-        self.done = tf.Variable(tf.zeros(buffer_size, dtype=tf.float32))
-
+        self.memory = NumpyReplayMemory(buffer_size, state_size)
+        self.rng = np.random.default_rng()
 
-        self.count = 0
-        self.real_size = 0
         self.size = buffer_size
-    def add(self, transition):
-        state, action, reward, next_state, done = transition
 
-        for i in range(len(state)):
-            self.add_one((state[i], action[i], reward[i], next_state[i], done[i]))
-        
-    def add_one(self, transition):
-        state, action, reward, next_state, done = transition
+    @property
+    def count(self):
+        return self.memory.count
 
-        # store transition index with maximum priority in sum tree
-        self.tree.add(self.max_priority, self.count)
+    @property
+    def real_size(self):
+        return self.memory.real_size
 
-        # store transition in the buffer
-        self.state[self.count].assign(state)
-        self.action[self.count].assign(action)
-        self.reward[self.count].assign(reward)
-        self.next_state[self.count].assign(next_state)
-        self.done[self.count].assign(done)
+    def add(self, transition):
+        n = min(len(transition[0]), self.size)
+        idxs = (self.count + np.arange(n)) % self.size
 
+        self.memory.add(*transition)
 
-        # update counters
-        self.count = (self.count + 1) % self.size
-        self.real_size = min(self.size, self.real_size + 1)
+        # new transitions get maximum priority, so they are sampled at least once
+        self.tree.update_batch(idxs, self.max_priority)
+        self.min_tree.update_batch(idxs, self.max_priority)
+
+    def add_one(self, transition):
+        self.add(tuple(np.asarray(value)[np.newaxis] for value in transition))
 
     def sample(self, batch_size):
+        """
+        Returns batch (same as `ReplayMemory2.sample`), importance sampling weights (batch_size,) and buffer indices
+        of sampled transitions (pass them to `update_priorities`)
+        """
         assert self.real_size >= batch_size, "buffer contains less samples than batch size"
 
-        sample_idxs, tree_idxs = [], []
-        priorities = tf.Variable(tf.zeros((batch_size, 1), dtype=tf.float32))
-
         # To sample a minibatch of size k, the range [0, p_total] is divided equally into k ranges.
         # Next, a value is uniformly sampled from each range. Finally the transitions that correspond
         # to each of these sampled values are retrieved from the tree. (Appendix B.2.1, Proportional prioritization)
-        segment = self.tree.total / batch_size
-        for i in range(batch_size):
-            a, b = segment * i, segment * (i + 1)
-
-            cumsum = random.uniform(a, b)
-            # sample_idx is a sample index in buffer, needed further to sample actual transitions
-            # tree_idx is a index of a sample in the tree, needed further to update priorities
-            tree_idx, priority, sample_idx = self.tree.get(cumsum)
-
-            priorities[i].assign(priority)
-            tree_idxs.append(tree_idx)
-            sample_idxs.append(sample_idx)
+        sample_idxs, priorities = self.tree.sample_batch(batch_size, self.rng)
 
         # Concretely, we define the probability of sampling transition i as P(i) = p_i^α / \sum_{k} p_k^α
         # where p_i > 0 is the priority of transition i. (Section 3.3)
@@ -244,28 +673,28 @@ class PrioritizedReplayMemory:
         weights = (self.real_size * probs) ** -self.beta
 
         # As mentioned in Section 3.4, whenever importance sampling is used, all weights w_i were scaled
-        # so that max_i w_i = 1. We found that this worked better in practice as it kept all weights
-        # within a reasonable range, avoiding the possibility of extremely large updates. (Appendix B.2.1, Proportional prioritization)
-        weights = weights / tf.reduce_max(weights)
-
-        batch = (tf.gather(self.state, sample_idxs),
-                tf.gather(self.action, sample_idxs),
-                tf.gather(self.reward, sample_idxs),
-                tf.gather(self.next_state, sample_idxs),
-                tf.gather(self.done, sample_idxs))
-        
-        
-        return batch, weights, tree_idxs
+        # so that max_i w_i = 1. The largest weight over the whole buffer belongs to the smallest priority.
+        # (Appendix B.2.1, Proportional prioritization)
+        max_weight = (self.real_size * self.min_tree.min / self.tree.total) ** -self.beta
+        weights = weights / max_weight
+
+        batch = tuple(tf.convert_to_tensor(np.take(buffer, sample_idxs, axis=0)) for buffer in self.memory.buffers())
+
+        return batch, tf.constant(weights, dtype=tf.float32), sample_idxs
 
     def update_priorities(self, data_idxs, priorities):
+        """
+        Sets priorities from absolute TD errors (one per sampled transition) in one batched tree update
+        """
         if isinstance(priorities, tf.Tensor):
             priorities = priorities.numpy()
+        priorities = np.abs(np.asarray(priorities, dtype=np.float64)).ravel()
 
-        for data_idx, priority in zip(data_idxs, priorities):
-            # The first variant we consider is the direct, proportional prioritization where p_i = |δ_i| + eps,
-            # where eps is a small positive constant that prevents the edge-case of transitions not being
-            # revisited once their error is zero. (Section 3.3)
-            priority = (priority + self.eps) ** self.alpha
+        # The first variant we consider is the direct, proportional prioritization where p_i = |δ_i| + eps,
+        # where eps is a small positive constant that prevents the edge-case of transitions not being
+        # revisited once their error is zero. (Section 3.3)
+        priorities = (priorities + self.eps) ** self.alpha
 
-            self.tree.update(data_idx, priority)
-            self.max_priority = max(self.max_priority, priority)
\ No newline at end of file
+        self.tree.update_batch(data_idxs, priorities)
+        self.min_tree.update_batch(data_idxs, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
@@ -0,0 +1,208 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from .replay_memory import (ArrayMinTree, ArraySumTree, FrameReplayMemory, HistoryReplayMemory, MemmapReplayMemory,
+                            NumpyReplayMemory, PrioritizedReplayMemory)
+
+
+def episode(start, length, history, planes=2):
+    # frame i is filled with value start + i, states are stacks of the last `history` frames
+    frames = np.stack([np.full((8, 8, planes), start + i, dtype=np.float32) for i in range(length + 1)])
+    padded = np.concatenate([np.zeros((history - 1, 8, 8, planes), dtype=np.float32), frames])
+    stacks = np.stack([np.concatenate(padded[i:i + history], axis=2) for i in range(length + 1)])
+
+    actions = np.arange(start, start + length, dtype=np.int32)
+    returns = actions.astype(np.float32)
+    dones = np.zeros(length, dtype=np.float32)
+    dones[-1] = 1
+    return stacks[:-1], actions, returns, stacks[1:], dones
+
+
+class ArrayTreeTests(unittest.TestCase):
+    def test_sums_and_minimums(self):
+        rng = np.random.default_rng(0)
+        sums, minimums = ArraySumTree(100), ArrayMinTree(100)
+        priorities = np.zeros(100)
+        touched = np.zeros(100, dtype=np.bool_)
+        for _ in range(20):
+            idxs = rng.integers(0, 100, size=16)
+            values = rng.random(16)
+            sums.update_batch(idxs, values)
+            minimums.update_batch(idxs, values)
+            for idx, value in zip(idxs, values):
+                priorities[idx] = value
+            touched[idxs] = True
+
+            self.assertAlmostEqual(sums.total, priorities.sum())
+            self.assertEqual(minimums.min, priorities[touched].min())
+            self.assertTrue(np.array_equal(sums.leaves(np.arange(100)), priorities))
+
+        cumulative = np.cumsum(priorities)
+        values = rng.random(500) * sums.total
+        self.assertTrue(np.array_equal(sums.find(values), np.searchsorted(cumulative, values, side='right')))
+
+    def test_stratified_sampling(self):
+        tree = ArraySumTree(10)
+        priorities = np.array([0, 1, 0, 2, 0, 0, 4, 0, 1, 0], dtype=np.float64)
+        tree.update_batch(np.arange(10), priorities)
+
+        idxs, sampled = tree.sample_batch(8000, np.random.default_rng(1))
+        self.assertTrue(np.array_equal(sampled, priorities[idxs]))
+        self.assertTrue(np.all(priorities[idxs] > 0))
+        # one value per stratum, sorted leaves and frequencies proportional to priorities
+        self.assertTrue(np.all(np.diff(idxs) >= 0))
+        self.assertTrue(np.array_equal(np.bincount(idxs, minlength=10), priorities * 1000))
+
+
+class NumpyReplayMemoryTests(unittest.TestCase):
+    def test_wraparound(self):
+        memory = NumpyReplayMemory(10, (10, 2))
+        added = []
+        for start, length in ((0, 4), (4, 5), (9, 3), (12, 25), (37, 1)):
+            ids = np.arange(start, start + length)
+            memory.add(np.stack([ids, -ids], axis=1), ids, ids * 0.5, np.stack([ids + 1, -ids], axis=1), ids % 2)
+            added.extend(ids)
+
+            self.assertEqual(len(memory), min(len(added), 10))
+            self.assertEqual(set(memory.actions_buffer[:len(memory)]), set(added[-10:]))
+
+        memory.add_one(np.array([100, -100]), 100, 50, np.array([101, -100]), 0)
+        self.assertEqual(set(memory.actions_buffer), set(added[-9:] + [100]))
+
+        with tempfile.TemporaryDirectory() as directory:
+            memory.save(directory)
+            for lazy in (False, True):
+                loaded = NumpyReplayMemory.load(directory, lazy=lazy)
+                self.assertEqual((loaded.count, loaded.real_size, loaded.max_size), (memory.count, memory.real_size, memory.max_size))
+                for buffer, expected in zip(loaded.buffers(), memory.buffers()):
+                    self.assertTrue(np.array_equal(buffer, expected))
+
+                # lazily loaded buffers are copy-on-write, saved files stay as they were
+                loaded.add(np.zeros((3, 2)), np.full(3, -1), np.zeros(3), np.zeros((3, 2)), np.zeros(3))
+                del loaded
+            self.assertTrue(np.array_equal(NumpyReplayMemory.load(directory).actions_buffer, memory.actions_buffer))
+
+        states, actions, returns, next_states, dones = memory.sample(10)
+        actions = actions.numpy()
+        self.assertTrue(np.array_equal(states.numpy(), np.stack([actions, -actions], axis=1)))
+        self.assertTrue(np.array_equal(next_states.numpy()[:, 0], actions + 1))
+        self.assertTrue(np.array_equal(returns.numpy(), actions * 0.5))
+        self.assertTrue(np.array_equal(dones.numpy(), actions % 2))
+
+
+class MemmapReplayMemoryTests(unittest.TestCase):
+    def test_reopen(self):
+        with tempfile.TemporaryDirectory() as directory:
+            memory = MemmapReplayMemory(directory, 20, (20, 8, 8, 8))
+            states = np.random.default_rng(0).normal(size=(25, 8, 8, 8)).astype(np.float32)
+            memory.add(states[:15], np.arange(15), np.ones(15), states[:15] + 1, np.zeros(15))
+            memory.add(states[15:], np.arange(15, 25), np.ones(10), states[15:] + 1, np.zeros(10))
+            memory.flush()
+            del memory
+
+            memory = MemmapReplayMemory(directory, 20, (20, 8, 8, 8))
+            self.assertEqual((len(memory), memory.count), (20, 5))
+            self.assertTrue(np.array_equal(memory.states_buffer[:5], states[20:]))
+            self.assertTrue(np.array_equal(memory.next_states_buffer[5:], states[5:20] + 1))
+
+            states, _, _, next_states, _ = memory.sample(20)
+            self.assertTrue(np.array_equal(next_states.numpy(), states.numpy() + 1))
+            del memory, states, next_states
+
+            memory = MemmapReplayMemory.load(directory)
+            self.assertIsInstance(memory, MemmapReplayMemory)
+            self.assertEqual((len(memory), memory.count, memory.states_buffer.shape), (20, 5, (20, 8, 8, 8)))
+            memory.flush()
+            del memory
+
+            self.assertRaises(ValueError, MemmapReplayMemory, directory, 30, (30, 8, 8, 8))
+
+
+class PrioritizedReplayMemoryTests(unittest.TestCase):
+    def test_priorities_and_weights(self):
+        memory = PrioritizedReplayMemory((8, 3), 2, 8, eps=0.0, alpha=1.0, beta=1.0)
+        ids = np.arange(12, dtype=np.float32)
+        memory.add((np.stack([ids] * 3, axis=1), ids.astype(np.int32), ids, np.stack([ids + 1] * 3, axis=1), np.zeros(12)))
+        self.assertEqual(len(memory), 8)
+        self.assertAlmostEqual(memory.tree.total, 8 * memory.max_priority)
+
+        memory.update_priorities(np.arange(8), np.arange(1, 9, dtype=np.float32))
+        self.assertEqual(memory.min_tree.min, 1)
+        self.assertEqual(memory.max_priority, 8)
+
+        (states, actions, _, next_states, _), weights, idxs = memory.sample(8)
+        self.assertTrue(np.array_equal(actions.numpy(), memory.memory.actions_buffer[idxs]))
+        self.assertTrue(np.array_equal(next_states.numpy(), states.numpy() + 1))
+        # w_i = (N * P(i)) ** -beta normalized by the weight of the smallest priority
+        self.assertTrue(np.allclose(weights.numpy(), 1 / (idxs + 1)))
+
+
+class FrameReplayMemoryTests(unittest.TestCase):
+    def test_episode_boundaries(self):
+        memory = FrameReplayMemory(40, (40, 3))
+        # two episodes in one chunk, then a chunk whose next states do not follow on
+        frames = np.arange(12, dtype=np.float32)[:, np.newaxis].repeat(3, axis=1)
+        dones = np.array([0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 1], dtype=np.float32)
+        memory.add(frames[:-1], np.arange(11), np.zeros(11), frames[1:] + 100 * dones[:, np.newaxis], dones)
+        memory.add(frames[:5], np.arange(11, 16), np.zeros(5), frames[:5] + 50, np.zeros(5))
+
+        # one frame per state plus one per break (end of episode, or every transition of the second chunk)
+        self.assertEqual(memory.frame_count, 11 + 2 + 5 + 5)
+        self.assertEqual(len(memory), 16)
+
+        states, actions, _, next_states, _ = memory.sample(16)
+        for state, action, next_state in zip(states.numpy(), actions.numpy(), next_states.numpy()):
+            if action < 11:
+                self.assertTrue(np.all(state == action))
+                self.assertTrue(np.all(next_state == action + 1 + 100 * dones[action]))
+            else:
+                self.assertTrue(np.all(state == action - 11))
+                self.assertTrue(np.all(next_state == action - 11 + 50))
+
+    def test_grows_frames_for_short_episodes(self):
+        memory = FrameReplayMemory(20, (20, 2), frames_size=20)
+
+        for episode in range(10):
+            frames = np.full((5, 2), episode * 10, dtype=np.float32) + np.arange(5)[:, np.newaxis]
+            memory.add(frames[:-1], episode * 10 + np.arange(4), np.zeros(4), frames[1:], np.zeros(4))
+
+        # 5 episodes of 5 frames are live, no transition is dropped before max_size
+        self.assertEqual(len(memory), 20)
+        self.assertGreaterEqual(memory.frames_size, 25)
+        states, actions, _, next_states, _ = memory.sample(20)
+        self.assertTrue(np.all(actions.numpy() >= 50))
+        self.assertTrue(np.array_equal(states.numpy()[:, 0], actions.numpy()))
+        self.assertTrue(np.array_equal(next_states.numpy()[:, 0], actions.numpy() + 1))
+
+
+class HistoryReplayMemoryTests(unittest.TestCase):
+    def test_rebuilds_stacks(self):
+        memory = HistoryReplayMemory(50, history=3, frame_shape=(8, 8, 2))
+        episodes = {}
+        for start in range(1, 400, 20):
+            states, actions, returns, next_states, dones = episode(start, 7, 3)
+            memory.add(states, actions, returns, next_states, dones)
+            for i, a in enumerate(actions):
+                episodes[int(a)] = (states[i], next_states[i], dones[i])
+
+        self.assertEqual(len(memory), 50)
+        # frames are stored once per position instead of twice per transition with 3 frames each
+        self.assertLess(memory.frames.nbytes, 6 * 50 * 8 * 8 * 2 * 4)
+
+        with tempfile.TemporaryDirectory() as directory:
+            memory.save(directory)
+            memory = HistoryReplayMemory.load(directory)
+
+        states, actions, returns, next_states, dones = memory.sample(40)
+        for state, a, r, next_state, done in zip(states.numpy(), actions.numpy(), returns.numpy(), next_states.numpy(), dones.numpy()):
+            expected_state, expected_next, expected_done = episodes[int(a)]
+            self.assertEqual(r, a)
+            self.assertEqual(done, expected_done)
+            self.assertTrue(np.array_equal(state, expected_state))
+            self.assertTrue(np.array_equal(next_state, expected_next))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -103,7 +103,7 @@ def training_step_dqnet_target_critic_2(
         grads = tape.gradient(loss, actor_model.trainable_variables)
         optimizer.apply_gradients(zip(grads, actor_model.trainable_variables))
 
-#@tf.function
+@tf.function
 def training_step_dqnet_target_critic_ps(
         batch: ReplayHistoryType,
         weights: tf.Tensor,
@@ -118,7 +118,9 @@ def training_step_dqnet_target_critic_ps(
     - DQN target network
     - Critic network & cost
     - Double DQN
-    - Mulitple minibatch iterations
+    - Prioritized replay, `weights` (batch_size,) are importance sampling weights
+
+    Returns loss and absolute TD errors (batch_size,), pass them to `PrioritizedReplayMemory.update_priorities`
     """
     # sample minibatch_size experiences from batch
     batch_states, batch_actions, batch_rewards, batch_next_states, batch_dones = batch
@@ -150,7 +152,7 @@ def training_step_dqnet_target_critic_ps(
         actor_loss = tf.reduce_mean(loss_fn(target_Q_values, Q_values)*weights)
         critic_loss = tf.reduce_mean(loss_fn(target_Q_values, values)*weights)
 
-        td_error = tf.abs(target_Q_values - Q_values)
+        td_error = tf.abs(tf.reshape(target_Q_values - Q_values, [-1]))
 
         loss = actor_loss + critic_loss
 